@@ -12,6 +12,20 @@ class Config:
     PG_PORT = os.getenv('PG_PORT', '5432')
     PG_DB = os.getenv('PG_DB', 'excel_data')
     SQLALCHEMY_DATABASE_URI = f'postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}'
+    # 分析接口使用独立的只读连接池，导入时的大事务不会占满分析查询的连接；
+    # 为空时连同一个数据库，可以指向只读副本
+    ANALYTICS_DATABASE_URI = os.getenv('ANALYTICS_DATABASE_URI') or None
+    # 写连接池（导入）和分析连接池各自的大小、额外连接数和语句超时（毫秒，0 表示不限制），仅 PostgreSQL 生效
+    WRITER_POOL_SIZE = int(os.getenv('WRITER_POOL_SIZE', 5))
+    WRITER_MAX_OVERFLOW = int(os.getenv('WRITER_MAX_OVERFLOW', 5))
+    WRITER_STATEMENT_TIMEOUT_MS = int(os.getenv('WRITER_STATEMENT_TIMEOUT_MS', 0))
+    ANALYTICS_POOL_SIZE = int(os.getenv('ANALYTICS_POOL_SIZE', 10))
+    ANALYTICS_MAX_OVERFLOW = int(os.getenv('ANALYTICS_MAX_OVERFLOW', 10))
+    ANALYTICS_STATEMENT_TIMEOUT_MS = int(os.getenv('ANALYTICS_STATEMENT_TIMEOUT_MS', 30000))
+    # 借出连接前先检查连接是否可用（数据库重启或副本切换后自动重连）
+    POOL_PRE_PING = os.getenv('POOL_PRE_PING', 'True') == 'True'
+    # 启动时 schema 版本落后则自动执行在线迁移；耗时的离线迁移（例如建索引）始终由 flask db-upgrade 执行
+    SCHEMA_AUTO_MIGRATE = os.getenv('SCHEMA_AUTO_MIGRATE', 'True') == 'True'
 
     # 邮件配置
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -27,5 +41,51 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
     ALLOWED_EXTENSIONS = {'xlsx', 'xls','csv'}
 
+    # 批量导入配置（auto: PostgreSQL 用 COPY，其它数据库用 executemany；orm 仅用于对比测试）
+    BULK_LOAD_METHOD = os.getenv('BULK_LOAD_METHOD', 'auto')
+    BULK_LOAD_BATCH_SIZE = int(os.getenv('BULK_LOAD_BATCH_SIZE', 5000))
+    # 重新导入方式（auto: PostgreSQL 写 staging 表后原子换表，其它数据库清空后重写；可显式设为 swap/replace）
+    # 只有 swap 在数据写完之后才建索引，replace 写入时逐行维护已有的索引
+    LOAD_MODE = os.getenv('LOAD_MODE', 'auto')
+
+    # 导入时预先计算分析接口用到的分组统计，接口直接读取（False 时每次请求实时统计）
+    AGGREGATE_CUBES = os.getenv('AGGREGATE_CUBES', 'True') == 'True'
+
+    # 导入后在内存中为每个快照建立学生位图索引（安装 pyroaring 时使用压缩位图，否则用 NumPy 数组），去重人数直接由位图得出
+    STUDENT_INDEX = os.getenv('STUDENT_INDEX', 'True') == 'True'
+
+    # 快照历史：每种快照保留最近几个被覆盖的旧版本（0 表示不保留），
+    # 以及所有历史版本合计的空间上限（MB，0 表示不限制），超出时从最旧的开始删除。
+    # 保留旧版本要在导入事务中把整份旧快照复制一遍（写入量和 WAL 翻倍），因此默认不保留，需要按版本查询时再开启
+    SNAPSHOT_HISTORY_COUNT = int(os.getenv('SNAPSHOT_HISTORY_COUNT', 0))
+    SNAPSHOT_HISTORY_MAX_MB = int(os.getenv('SNAPSHOT_HISTORY_MAX_MB', 0))
+    # merge 导入是否也保留合并前的版本。保留历史版本要把整份快照复制一遍，只改动几百行的合并也要重写整个快照、
+    # 每个历史版本都占一份完整空间，因此默认不保留：合并直接改线上版本，合并前的数据不能再按版本查询。
+    # 需要每次合并都能回看时设为 True（代价是每次合并复制一份快照）；数据没有变化的合并在两种设置下都不产生新版本
+    SNAPSHOT_HISTORY_ON_MERGE = os.getenv('SNAPSHOT_HISTORY_ON_MERGE', 'False') == 'True'
+
+    # 分析查询的执行位置：database 直接查数据库；duckdb 在导入后导出的 Parquet 副本上统计（需要安装 duckdb）；
+    # columnar 在导入后导出的列式快照上统计（各进程 mmap 共享）；没有安装或副本还没有导出时回退到数据库
+    # （duckdb 等可选依赖见 requirements-analytics.txt）
+    ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'database')
+    ANALYTICS_STORE_FOLDER = os.getenv('ANALYTICS_STORE_FOLDER', os.path.join(os.path.dirname(__file__), 'analytics_store'))
+
+    # 上传文件按块流式解析，每块行数决定峰值内存
+    INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 50000))
+    # Excel 上传读取的工作表名，为空时读取第一个工作表
+    EXCEL_SHEET_NAME = os.getenv('EXCEL_SHEET_NAME') or None
+    # 后台导入任务：线程数，执行期间刷新心跳的间隔（秒），以及 running 任务心跳超过多少秒视为执行进程已退出
+    # （执行进程在其它机器上时按心跳判断，启动时会重新执行；本机的进程直接检查是否还在运行）
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 2))
+    JOB_HEARTBEAT_SECONDS = int(os.getenv('JOB_HEARTBEAT_SECONDS', 30))
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 300))
+    # /report 接口中并发取数的线程数（每个线程占用一个分析连接）
+    REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 3))
+    # 判断文件年份时最多读取的行数（只读 ACADEMIC_YEAR 一列）
+    YEAR_PROBE_ROWS = int(os.getenv('YEAR_PROBE_ROWS', 1000))
+    # 多文件批量上传时并行解析的进程数（<=1 表示在请求进程内顺序解析）
+    PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', min(os.cpu_count() or 1, 3)))
+
     # 其他配置
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
\ No newline at end of file
+    # 上传内容由 werkzeug 落盘缓存后按块解析，不再整体读入内存，可以放宽上限
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH_MB', 512)) * 1024 * 1024  # 默认 512MB
\ No newline at end of file
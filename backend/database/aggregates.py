@@ -0,0 +1,394 @@
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+
+from .models import db, EnrollmentFact, SnapshotAggregate
+from .schema import ENCODED_COLUMNS, storage_name
+from .dimensions import decode_rows, dimension_labels, labels_like, like_pattern
+from .analytics_store import analytics_backend, backend_counts
+from .engines import read_session
+from .student_index import index_enabled, snapshot_index, student_count, union
+
+# 分析接口用到的分组统计，每次导入后按快照预先算好存入 snapshot_aggregate
+#   name      统计名
+#   columns   分组列（数据库字段名，字典编码的列按维度键分组）
+#   where     只统计满足条件的行（事实表上的 SQL 条件）
+#   distinct  True 按 masked_id 去重统计人数，False 统计行数
+CubeSpec = namedtuple('CubeSpec', ['name', 'columns', 'where', 'distinct'])
+
+
+def _cube(name, *columns, where=None, distinct=True):
+    return CubeSpec(name, columns, where, distinct)
+
+
+AGGREGATE_CUBES = [
+    # 性别参与度
+    _cube('gender', 'gender', where='gender_id IS NOT NULL'),
+    _cube('faculty_gender', 'faculty_descr', 'gender', where='gender_id IS NOT NULL'),
+    _cube('faculty_gender_total', 'faculty_descr', where='gender_id IS NOT NULL'),
+    # equity 分析：学院 × 分组字段
+    _cube('faculty_first_gen', 'faculty_descr', 'first_generation_ind', where='first_generation_ind_id IS NOT NULL'),
+    _cube('faculty_ses', 'faculty_descr', 'ses', where='ses_id IS NOT NULL'),
+    _cube('faculty_atsi_group', 'faculty_descr', 'atsi_group', where='atsi_group_id IS NOT NULL'),
+    _cube('regional_remote', 'regional_remote', where='regional_remote_id IS NOT NULL'),
+    # CDEV 课程
+    _cube('cdev', 'course_code', 'course_name', 'residency_group_descr', where="course_code LIKE 'CDEV%'"),
+    _cube('cdev_gender', 'course_code', 'gender', where="course_code LIKE 'CDEV%' AND gender_id IS NOT NULL",
+          distinct=False),
+    # 年度对比和 Census Day 对比
+    _cube('faculty_residency_year', 'faculty_descr', 'residency_group_descr', 'academic_year'),
+    _cube('faculty', 'faculty_descr'),
+    _cube('term_faculty_gender', 'term_descr', 'faculty_descr', 'gender'),
+]
+
+CUBES = {spec.name: spec for spec in AGGREGATE_CUBES}
+
+
+def _definition(spec):
+    """统计定义的文本形式，和结果一起保存，用于判断结果是否过期"""
+    return f"{','.join(spec.columns)}|{spec.where or ''}|{'distinct' if spec.distinct else 'rows'}"
+
+
+def _cubes_enabled():
+    return current_app.config.get('AGGREGATE_CUBES', True)
+
+
+def _fact_table(table_name=None):
+    """事实表；table_name 指定时为同样结构的另一张表（例如换分区之前的 staging 表）"""
+    fact = EnrollmentFact.__table__
+    if table_name is None:
+        return fact
+    return db.table(table_name, *[db.column(column.name, column.type) for column in fact.columns])
+
+
+def _snapshot_count(snapshot, distinct=True, table=None):
+    """条件聚合：只统计 snapshot 中的行，多个快照的对比可以在同一次扫描中完成"""
+    table = EnrollmentFact.__table__ if table is None else table
+    value = db.case((table.c.snapshot == snapshot, table.c.masked_id))
+    return db.func.count(db.func.distinct(value) if distinct else value)
+
+
+def _key_columns(columns, table=None):
+    table = EnrollmentFact.__table__ if table is None else table
+    return [table.c[storage_name(column)] for column in columns]
+
+
+def _database_counts(spec, snapshots, columns, label_filters, session=None, table_name=None):
+    """直接在事实表（或 table_name）上统计（一次扫描，每个快照一个计数列），默认使用分析连接池"""
+    table = _fact_table(table_name)
+    keys = _key_columns(columns, table)
+    query = (session or read_session()).query(
+        *keys, *[_snapshot_count(snapshot, spec.distinct, table) for snapshot in snapshots]
+    ).filter(table.c.snapshot.in_(snapshots))
+    if spec.where:
+        query = query.filter(db.text(spec.where))
+    for column, pattern in label_filters.items():
+        # 标签的匹配在维度表上完成，事实表只按维度键过滤
+        query = query.filter(_key_columns([column], table)[0].in_(labels_like(column, pattern)))
+    return [tuple(row) for row in query.group_by(*keys).all()]
+
+
+def _live_counts(spec, snapshots, columns, label_filters):
+    """实时统计：ANALYTICS_BACKEND 为 duckdb / columnar 时在导出的副本上统计，副本还没有导出时回退到数据库"""
+    if analytics_backend() != 'database':
+        label_ids = {
+            storage_name(column): read_session().execute(labels_like(column, pattern)).scalars().all()
+            for column, pattern in label_filters.items()
+        }
+        rows = backend_counts([storage_name(column) for column in columns], spec.where, spec.distinct,
+                              snapshots, label_ids)
+        if rows is not None:
+            return rows
+    return _database_counts(spec, snapshots, columns, label_filters)
+
+
+def _cube_counts(spec, snapshots, columns, label_filters):
+    """从预聚合结果中取数；缺少某个快照的结果、结果过期或无法精确回答时返回 None"""
+    stored = {
+        aggregate.snapshot: aggregate
+        for aggregate in read_session().query(SnapshotAggregate).filter(
+            SnapshotAggregate.cube == spec.name, SnapshotAggregate.snapshot.in_(snapshots)
+        )
+    }
+    definition = _definition(spec)
+    if any(snapshot not in stored or stored[snapshot].definition != definition for snapshot in snapshots):
+        return None
+
+    # 每个快照中过滤列只能匹配到一个标签：去重人数不能跨标签相加
+    filters = [
+        (spec.columns.index(column), column, like_pattern(pattern)) for column, pattern in label_filters.items()
+    ]
+    positions = [spec.columns.index(column) for column in columns]
+    combined = {}
+    for number, snapshot in enumerate(snapshots):
+        rows = stored[snapshot].rows
+        for position, column, regex in filters:
+            keys = {row[position] for row in rows}
+            labels = dimension_labels(column, keys)
+            matched = {key for key in keys if key is not None and regex.fullmatch(labels[key])}
+            if len(matched) > 1:
+                return None
+            rows = [row for row in rows if row[position] in matched]
+        for row in rows:
+            key = tuple(row[position] for position in positions)
+            combined.setdefault(key, [0] * len(snapshots))[number] += row[-1]
+    return [key + tuple(counts) for key, counts in combined.items()]
+
+
+def _index_counts(spec, snapshots, columns, label_filters):
+    """
+    从学生位图索引取数：过滤掉的标签和汇总掉的分组列取位图并集，人数为并集中的学生数
+
+    与预聚合结果不同，过滤列匹配到多个标签时仍然精确；按行数统计或索引不可用时返回 None
+    """
+    if not spec.distinct or not index_enabled():
+        return None
+    indexes = [snapshot_index(snapshot, AGGREGATE_CUBES) for snapshot in snapshots]
+    if any(index is None for index in indexes):
+        return None
+
+    filters = [
+        (spec.columns.index(column), column, like_pattern(pattern)) for column, pattern in label_filters.items()
+    ]
+    positions = [spec.columns.index(column) for column in columns]
+    combined = {}
+    for number, index in enumerate(indexes):
+        groups = index.cubes[spec.name]
+        for position, column, regex in filters:
+            labels = dimension_labels(column, {key[position] for key in groups})
+            groups = {
+                key: bitmap for key, bitmap in groups.items()
+                if key[position] is not None and regex.fullmatch(labels[key[position]])
+            }
+        merged = {}
+        for key, bitmap in groups.items():
+            merged.setdefault(tuple(key[position] for position in positions), []).append(bitmap)
+        for key, bitmaps in merged.items():
+            combined.setdefault(key, [0] * len(snapshots))[number] = student_count(union(bitmaps))
+    return [key + tuple(counts) for key, counts in combined.items()]
+
+
+def _sorted_by_labels(rows, count):
+    """按每行前 count 列（已换回标签）排序，空值排在最后（与 PostgreSQL 的 ORDER BY 一致）"""
+    return sorted(rows, key=lambda row: tuple((value is None, value) for value in row[:count]))
+
+
+def _grouped_database_counts(specs, snapshots, session=None):
+    """
+    多个统计在事实表上一次扫描完成，结果与逐个 _database_counts 相同
+
+    PostgreSQL 用 GROUPING SETS，每个统计是一个分组集，各自的条件放进自己的计数列，
+    GROUPING() 位掩码区分结果行属于哪个分组集；其它数据库一次读出去重后的 (分组列, masked_id)，在内存中分组
+
+    Returns:
+        dict: {统计名: [(分组键..., 快照1人数, ...)]}
+    """
+    session = session or read_session()
+    union = list(dict.fromkeys(column for spec in specs for column in spec.columns))
+    keys = _key_columns(union)
+    query_filters = [EnrollmentFact.snapshot.in_(snapshots)]
+    if all(spec.where for spec in specs):
+        query_filters.append(db.or_(*[db.text(f"({spec.where})") for spec in specs]))
+
+    def position(column):
+        return union.index(column)
+
+    if session.get_bind().dialect.name == 'postgresql':
+        def measure(spec, snapshot):
+            condition = EnrollmentFact.snapshot == snapshot
+            if spec.where:
+                condition = db.and_(condition, db.text(f"({spec.where})"))
+            return db.func.count(db.func.distinct(db.case((condition, EnrollmentFact.masked_id))))
+
+        # GROUPING(所有列) 中不属于分组集的列对应的位为 1（第一列为最高位）
+        masks = {}
+        for spec in specs:
+            mask = sum(1 << (len(union) - 1 - number) for number, column in enumerate(union)
+                       if column not in spec.columns)
+            masks.setdefault(mask, []).append(spec)
+        grouping_sets = [db.tuple_(*_key_columns(group[0].columns)) for group in masks.values()]
+        query = session.query(
+            *keys, db.func.grouping(*keys),
+            *[measure(spec, snapshot) for spec in specs for snapshot in snapshots]
+        ).filter(*query_filters).group_by(db.func.grouping_sets(*grouping_sets))
+
+        results = {spec.name: [] for spec in specs}
+        for row in query:
+            for spec in masks.get(row[len(union)], []):
+                offset = len(union) + 1 + specs.index(spec) * len(snapshots)
+                counts = tuple(row[offset:offset + len(snapshots)])
+                # 其它统计的条件选中、本统计的条件没有选中的行也会形成分组，人数全为 0，不属于本统计
+                if any(counts):
+                    results[spec.name].append(tuple(row[position(column)] for column in spec.columns) + counts)
+        return results
+
+    flags = [db.case((db.text(f"({spec.where})"), 1), else_=0) if spec.where else db.literal(1) for spec in specs]
+    query = session.query(EnrollmentFact.snapshot, *keys, EnrollmentFact.masked_id, *flags) \
+        .filter(*query_filters).distinct()
+    students = {spec.name: {} for spec in specs}
+    for row in query:
+        number = snapshots.index(row[0])
+        values, masked_id = row[1:len(union) + 1], row[len(union) + 1]
+        for spec, flag in zip(specs, row[len(union) + 2:]):
+            if flag:
+                key = tuple(values[position(column)] for column in spec.columns)
+                groups = students[spec.name].setdefault(key, [set() for _ in snapshots])
+                if masked_id is not None:
+                    groups[number].add(masked_id)
+    return {
+        name: [key + tuple(len(group) for group in groups) for key, groups in grouped.items()]
+        for name, grouped in students.items()
+    }
+
+
+def _decoded(columns, rows):
+    """维度键换回标签后按标签排序"""
+    targets = [column if column in ENCODED_COLUMNS else None for column in columns]
+    return _sorted_by_labels(decode_rows(rows, *targets), len(columns))
+
+
+def cube_spec(columns, where=None, distinct=True):
+    """
+    按分组列（顺序无关）、条件和计数方式找到相同定义的预聚合统计，可以直接用它的预聚合结果和位图索引；
+    没有时返回一个临时统计（名字以 ~ 开头，不在 CUBES 中，只能实时统计）
+    """
+    for spec in AGGREGATE_CUBES:
+        if sorted(spec.columns) == sorted(columns) and spec.where == where and spec.distinct == distinct:
+            return spec
+    spec = CubeSpec(None, tuple(columns), where, distinct)
+    return spec._replace(name=f"~{_definition(spec)}")
+
+
+def _stored_counts(spec, snapshots, columns, label_filters):
+    """依次尝试预聚合结果和学生位图索引，都不可用时返回 None（临时统计没有这两种结果）"""
+    if spec.name not in CUBES:
+        return None
+    rows = _cube_counts(spec, snapshots, columns, label_filters) if _cubes_enabled() else None
+    if rows is None:
+        rows = _index_counts(spec, snapshots, columns, label_filters)
+    return rows
+
+
+def snapshot_counts(cube, snapshots, label_filters=None, versions=None):
+    """
+    按统计 cube 的分组取各快照的人数：依次尝试预聚合结果、学生位图索引，都不可用时实时查询
+
+    Args:
+        cube (str): AGGREGATE_CUBES 中的统计名
+        snapshots (tuple): 快照，例如 ('before_census', 'current')
+        label_filters (dict): {列: LIKE 模式}，按标签过滤，过滤列不再出现在结果中
+        versions (dict): {快照类型: 数据键}，改为查询保留的历史版本（见 versions.py），其余快照用线上版本
+
+    Returns:
+        list: [(分组标签..., 快照1人数, 快照2人数, ...)]，按分组标签排序
+    """
+    return spec_counts_many([(CUBES[cube], label_filters or {})], snapshots, versions)[0]
+
+
+def snapshot_counts_many(cubes, snapshots, versions=None):
+    """
+    同一组快照上的多个统计一起取数（不带标签过滤），参数和每个统计的结果同 snapshot_counts
+
+    Returns:
+        dict: {统计名: [(分组标签..., 快照1人数, ...)]}
+    """
+    results = spec_counts_many([(CUBES[cube], {}) for cube in cubes], snapshots, versions)
+    return dict(zip(cubes, results))
+
+
+def spec_counts_many(requests, snapshots, versions=None):
+    """
+    同一组快照上的多个统计（预聚合统计或 cube_spec 得到的临时统计）一起取数
+
+    预聚合结果和位图索引都不可用、需要实时统计的多个统计在数据库上一次扫描完成（带标签过滤的单独查询）
+
+    Args:
+        requests (list): [(CubeSpec, {列: LIKE 模式})]
+        snapshots (tuple): 快照
+        versions (dict): {快照类型: 数据键}
+
+    Returns:
+        list: 与 requests 对应，每项为 [(分组标签..., 快照1人数, ...)]，分组列为 spec.columns 去掉过滤列，按分组标签排序
+    """
+    snapshots = tuple((versions or {}).get(snapshot, snapshot) for snapshot in snapshots)
+    columns = [[column for column in spec.columns if column not in label_filters] for spec, label_filters in requests]
+    results, pending = {}, []
+    for number, (spec, label_filters) in enumerate(requests):
+        rows = _stored_counts(spec, snapshots, columns[number], label_filters)
+        if rows is None:
+            pending.append(number)
+        else:
+            results[number] = rows
+
+    # 一次扫描只能合并不带过滤的去重人数统计，其它的单独查询
+    grouped = [number for number in pending if requests[number][0].distinct and not requests[number][1]]
+    specs = list({requests[number][0].name: requests[number][0] for number in grouped}.values())
+    if len(specs) > 1 and analytics_backend() == 'database':
+        counts = _grouped_database_counts(specs, snapshots)
+        for number in grouped:
+            results[number] = counts[requests[number][0].name]
+        pending = [number for number in pending if number not in results]
+    for number in pending:
+        spec, label_filters = requests[number]
+        results[number] = _live_counts(spec, snapshots, columns[number], label_filters)
+    return [_decoded(columns[number], results[number]) for number in range(len(requests))]
+
+
+def refresh_snapshot_aggregates(snapshot, table_name=None):
+    """
+    重新计算 snapshot 的全部预聚合结果（在导入事务中调用，与数据一起提交）
+
+    table_name 指定时从该表统计（swap 导入在换分区之前从 staging 表统计，换分区后立即提交）
+
+    Returns:
+        dict: {aggregates_refreshed, aggregate_seconds}
+    """
+    if not _cubes_enabled():
+        # 不再维护时删除旧结果，之后重新启用也不会读到过期的统计
+        SnapshotAggregate.query.filter_by(snapshot=snapshot).delete()
+        return {'aggregates_refreshed': 0, 'aggregate_seconds': 0.0}
+
+    started = time.perf_counter()
+    for spec in AGGREGATE_CUBES:
+        # 导入事务中的数据还没有提交：在写连接上统计，也不能查 Parquet 副本
+        rows = _database_counts(spec, (snapshot,), spec.columns, {}, session=db.session, table_name=table_name)
+        aggregate = db.session.get(SnapshotAggregate, (snapshot, spec.name))
+        if aggregate is None:
+            aggregate = SnapshotAggregate(snapshot=snapshot, cube=spec.name)
+            db.session.add(aggregate)
+        aggregate.definition = _definition(spec)
+        aggregate.rows = [list(row) for row in rows]
+        aggregate.refreshed_at = datetime.now()
+    return {
+        'aggregates_refreshed': len(AGGREGATE_CUBES),
+        'aggregate_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def check_analytics_parity(keys):
+    """
+    核对当前分析后端（Parquet 副本或列式快照）与数据库的统计结果：每个统计在每个快照键上各算一次，
+    term_faculty_gender 另按每个学期标签过滤各算一次
+
+    Returns:
+        list: 不一致的 (统计名, 快照键, 过滤条件)；副本缺少该快照键时同样记为不一致
+    """
+    mismatches = []
+    terms = dimension_labels('term_descr').values()
+    for key in keys:
+        checks = [(spec, {}) for spec in AGGREGATE_CUBES]
+        checks += [(CUBES['term_faculty_gender'], {'term_descr': term}) for term in terms]
+        for spec, label_filters in checks:
+            columns = [column for column in spec.columns if column not in label_filters]
+            label_ids = {
+                storage_name(column): read_session().execute(labels_like(column, pattern)).scalars().all()
+                for column, pattern in label_filters.items()
+            }
+            stored = backend_counts([storage_name(column) for column in columns], spec.where, spec.distinct,
+                                    (key,), label_ids)
+            expected = _database_counts(spec, (key,), columns, label_filters)
+            if stored is None or sorted(stored, key=repr) != sorted(expected, key=repr):
+                mismatches.append((spec.name, key, label_filters))
+    return mismatches
@@ -0,0 +1,172 @@
+import glob
+import os
+
+import pandas as pd
+from flask import current_app
+from sqlalchemy import text
+
+from .models import db, EnrollmentFact, SnapshotVersion
+from .engines import read_session
+from .columnar import columnar_counts, sync_columnar_store
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    duckdb = None
+    HAS_DUCKDB = False
+
+# 分析查询的执行位置（数据库仍是唯一的数据来源）：
+#   database  直接查数据库
+#   duckdb    在 Parquet 副本上用 DuckDB 统计
+#   columnar  在 mmap 打开的列式快照上用 NumPy 统计（见 columnar.py），多个进程共享同一份页缓存
+ANALYTICS_BACKENDS = ('database', 'duckdb', 'columnar')
+
+# 导出 Parquet 时每次从数据库读取的行数
+EXPORT_CHUNK_SIZE = 50000
+
+_warned = False
+
+
+def analytics_backend():
+    """当前生效的分析后端；配置为 duckdb 但没有安装时回退到 database"""
+    global _warned
+    backend = current_app.config.get('ANALYTICS_BACKEND', 'database')
+    if backend not in ANALYTICS_BACKENDS:
+        raise ValueError(f"Unknown analytics backend: {backend}")
+    if backend == 'duckdb' and not HAS_DUCKDB:
+        if not _warned:
+            print("ANALYTICS_BACKEND=duckdb but duckdb is not installed, analytics queries use the database")
+            _warned = True
+        return 'database'
+    return backend
+
+
+def _store_folder():
+    return current_app.config['ANALYTICS_STORE_FOLDER']
+
+
+def version_file(version):
+    """
+    一个快照版本的 Parquet 文件：版本的数据不会再变化，转为历史版本后文件原样保留
+
+    文件名带上导入时间，数据库重建后版本 id 重新编号也不会读到旧文件
+    """
+    return os.path.join(_store_folder(), f"version_{version.id}_{version.loaded_at:%Y%m%d%H%M%S%f}.parquet")
+
+
+def _store_columns():
+    return [column for column in EnrollmentFact.__table__.columns if column.name != 'snapshot']
+
+
+def export_version(version):
+    """
+    把一个版本的数据从数据库分块导出为 Parquet 文件
+
+    先写临时文件再改名，查询读到的文件总是完整的
+    """
+    path = version_file(version)
+    temporary = f"{path}.tmp"
+    columns = _store_columns()
+    definitions = ', '.join(
+        f"{column.name} {'INTEGER' if isinstance(column.type, db.Integer) else 'VARCHAR'}" for column in columns
+    )
+    names = ', '.join(column.name for column in columns)
+
+    store = duckdb.connect()
+    try:
+        store.execute(f"CREATE TABLE version_rows ({definitions})")
+        for chunk in pd.read_sql(
+            text(f"SELECT {names} FROM {EnrollmentFact.__tablename__} WHERE snapshot = :key"),
+            db.session.connection(), params={'key': version.storage_key}, chunksize=EXPORT_CHUNK_SIZE
+        ):
+            store.register('chunk', chunk)
+            store.execute(f"INSERT INTO version_rows SELECT {names} FROM chunk")
+            store.unregister('chunk')
+        store.execute(f"COPY version_rows TO '{temporary}' (FORMAT PARQUET)")
+    finally:
+        store.close()
+    os.replace(temporary, path)
+
+
+def sync_analytics_store():
+    """
+    让当前分析后端的副本与数据库中保留的版本一致：导出还没有文件的版本，删除已被删除的版本的文件
+
+    Returns:
+        dict: {exported: 导出的版本 id, removed: 删除的文件名}
+    """
+    backend = analytics_backend()
+    if backend == 'columnar':
+        return sync_columnar_store()
+    if backend != 'duckdb':
+        return {'exported': [], 'removed': []}
+
+    os.makedirs(_store_folder(), exist_ok=True)
+    versions = SnapshotVersion.query.order_by(SnapshotVersion.id).all()
+    exported = []
+    for version in versions:
+        if not os.path.exists(version_file(version)):
+            export_version(version)
+            exported.append(version.id)
+
+    wanted = {version_file(version) for version in versions}
+    removed = []
+    for path in glob.glob(os.path.join(_store_folder(), 'version_*.parquet')):
+        if path not in wanted:
+            os.remove(path)
+            removed.append(os.path.basename(path))
+    return {'exported': exported, 'removed': sorted(removed)}
+
+
+def store_counts(columns, where, distinct, snapshots, label_ids=None):
+    """
+    在 Parquet 副本上用 DuckDB 做分组统计，SQL 与数据库上的统计相同（一次扫描，每个快照一个计数列）
+
+    Args:
+        columns (list): 分组列（事实表字段名）
+        where (str): 统计条件，为 None 时统计全部行
+        distinct (bool): 按 masked_id 去重统计人数，否则统计行数
+        snapshots (tuple): 快照键
+        label_ids (dict): {事实表字段名: 允许的维度键列表}
+
+    Returns:
+        list: [(分组键..., 快照1人数, ...)]；某个快照还没有 Parquet 文件时返回 None，由调用方改查数据库
+    """
+    sources = []
+    for key in snapshots:
+        version = read_session().query(SnapshotVersion).filter_by(storage_key=key).first()
+        if version is None or not os.path.exists(version_file(version)):
+            return None
+        sources.append(f"SELECT '{key}' AS snapshot, * FROM read_parquet('{version_file(version)}')")
+
+    keys = ', '.join(columns)
+    measures = ', '.join(
+        f"COUNT({'DISTINCT ' if distinct else ''}CASE WHEN snapshot = '{key}' THEN masked_id END)"
+        for key in snapshots
+    )
+    conditions = [where] if where else []
+    for column, ids in (label_ids or {}).items():
+        conditions.append(f"{column} IN ({', '.join(str(int(value)) for value in ids)})" if ids else 'FALSE')
+
+    sql = f"SELECT {keys + ', ' if keys else ''}{measures} FROM ({' UNION ALL '.join(sources)}) f"
+    if conditions:
+        sql += f" WHERE {' AND '.join(f'({condition})' for condition in conditions)}"
+    if keys:
+        sql += f" GROUP BY {keys}"
+
+    store = duckdb.connect()
+    try:
+        return [tuple(row) for row in store.execute(sql).fetchall()]
+    finally:
+        store.close()
+
+
+def backend_counts(columns, where, distinct, snapshots, label_ids=None):
+    """按当前分析后端分组统计，参数和返回值同 store_counts；后端为 database 时返回 None"""
+    backend = analytics_backend()
+    if backend == 'duckdb':
+        return store_counts(columns, where, distinct, snapshots, label_ids)
+    if backend == 'columnar':
+        return columnar_counts(columns, where, distinct, snapshots, label_ids)
+    return None
@@ -0,0 +1,92 @@
+import time
+from io import StringIO
+
+from .models import db
+
+# 每批写入的行数：COPY 每批生成一段 CSV 缓冲，executemany 每批提交一次参数列表
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _copy_batches(frame, table, connection, batch_size):
+    """PostgreSQL: 分批生成 CSV 缓冲并通过 COPY FROM STDIN 写入"""
+    columns = ', '.join(frame.columns)
+    sql = f"COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '')"
+
+    cursor = connection.connection.cursor()
+    try:
+        for start in range(0, len(frame), batch_size):
+            buffer = StringIO()
+            frame.iloc[start:start + batch_size].to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def _records(batch):
+    """把 DataFrame 转成参数字典列表，NaN/NA 统一替换成 None"""
+    batch = batch.astype(object)
+    return batch.where(batch.notna(), None).to_dict('records')
+
+
+def _executemany_batches(frame, table, connection, batch_size):
+    """通用路径（SQLite 等）：分批 executemany 插入"""
+    statement = db.table(table.name, *[db.column(name) for name in frame.columns]).insert()
+    for start in range(0, len(frame), batch_size):
+        connection.execute(statement, _records(frame.iloc[start:start + batch_size]))
+
+
+def _orm_batches(frame, model, batch_size):
+    """旧的 ORM 路径，只用于和 COPY/executemany 对比吞吐"""
+    for start in range(0, len(frame), batch_size):
+        db.session.bulk_save_objects(
+            [model(**record) for record in _records(frame.iloc[start:start + batch_size])]
+        )
+
+
+def resolve_method(method, connection):
+    """auto 时根据数据库方言选择：PostgreSQL 用 COPY，其它用 executemany"""
+    if method == 'auto':
+        return 'copy' if connection.dialect.name == 'postgresql' else 'executemany'
+    if method not in ('copy', 'executemany', 'orm'):
+        raise ValueError(f"Unknown bulk load method: {method}")
+    if method == 'copy' and connection.dialect.name != 'postgresql':
+        raise ValueError("COPY bulk load requires PostgreSQL")
+    return method
+
+
+def bulk_insert(frame, model, method='auto', batch_size=DEFAULT_BATCH_SIZE, table_name=None):
+    """
+    把已映射好列的 DataFrame 批量写入 model 对应的表（使用当前 session 的事务，不提交）
+
+    table_name 指定时写入同结构的其它表（例如 staging 表），此时不支持 orm 方式
+
+    Returns:
+        dict: 行数和吞吐报告 {table, method, rows, seconds, rows_per_second}
+    """
+    table = model.__table__
+    if table_name is not None:
+        table = db.table(table_name)
+    connection = db.session.connection()
+    method = resolve_method(method, connection)
+    if method == 'orm' and table_name is not None:
+        raise ValueError("ORM bulk load cannot target a staging table")
+
+    started = time.perf_counter()
+    if len(frame):
+        if method == 'copy':
+            _copy_batches(frame, table, connection, batch_size)
+        elif method == 'executemany':
+            _executemany_batches(frame, table, connection, batch_size)
+        else:
+            _orm_batches(frame, model, batch_size)
+            db.session.flush()
+    seconds = time.perf_counter() - started
+
+    return {
+        'table': table.name,
+        'method': method,
+        'rows': len(frame),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(len(frame) / seconds) if seconds > 0 else None
+    }
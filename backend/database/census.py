@@ -0,0 +1,95 @@
+import re
+
+from .aggregates import snapshot_counts
+from .versions import version_stamps, VersionedCache
+
+# census drop：before census 和 after census 两个快照按 学期 × faculty × gender 的人数，
+# 所有学期一次取数（预聚合结果、位图索引或一次分组查询），按快照对的版本缓存，接口只取其中一个学期
+#
+# term_descr 的标签带年份（例如 '2025 Term 1'），学期名为去掉年份后的部分（'Term 1'），按学期名精确匹配
+_YEAR_PREFIX = re.compile(r'^\d{4} ')
+
+# 最多缓存的快照对数（查询历史版本时每种组合一份）
+MAX_CACHED_PAIRS = 16
+# 已算好的结果，按快照对的版本缓存：{学期名: {faculty: {gender: (before, after)}}}
+_drops = VersionedCache(MAX_CACHED_PAIRS)
+
+SNAPSHOT_PAIR = ('before_census', 'current')
+
+
+def term_name(label):
+    """term_descr 标签对应的学期名：去掉开头的年份"""
+    return _YEAR_PREFIX.sub('', label, count=1)
+
+
+def _term_pattern(term, labels):
+    """只匹配学期名为 term 的标签的 LIKE 模式（标签都带年份时为 '____ <学期名>'）"""
+    if all(_YEAR_PREFIX.match(label) for label in labels):
+        return f"____ {term}"
+    return term
+
+
+def _compute(versions):
+    """
+    所有学期的 before / after 人数
+
+    同一个快照中同一学期名出现在多个年份的标签下时，人数不能直接相加（同一个学生会算两次），
+    这些学期改为按学期名过滤单独统计
+    """
+    rows = snapshot_counts('term_faculty_gender', SNAPSHOT_PAIR, versions=versions)
+
+    labels = {}
+    for label, faculty, gender, before, after in rows:
+        if label is None:
+            continue
+        seen = labels.setdefault(term_name(label), {}).setdefault(label, [False, False])
+        seen[0] = seen[0] or before > 0
+        seen[1] = seen[1] or after > 0
+    overlapping = {
+        term for term, term_labels in labels.items()
+        if any(sum(seen[number] for seen in term_labels.values()) > 1 for number in range(len(SNAPSHOT_PAIR)))
+    }
+
+    # 不同年份的标签合并后仍按 faculty、gender 的顺序排列（空值在最后，与单个标签的结果一致）
+    drops = {}
+    for label, faculty, gender, before, after in sorted(
+        rows, key=lambda row: tuple((value is None, value) for value in row[1:3])
+    ):
+        if label is None or term_name(label) in overlapping:
+            continue
+        counts = drops.setdefault(term_name(label), {}).setdefault(faculty, {})
+        previous = counts.get(gender, (0, 0))
+        counts[gender] = (previous[0] + before, previous[1] + after)
+
+    for term in sorted(overlapping):
+        pattern = _term_pattern(term, labels[term])
+        counts = drops[term] = {}
+        for faculty, gender, before, after in snapshot_counts(
+            'term_faculty_gender', SNAPSHOT_PAIR, {'term_descr': pattern}, versions=versions
+        ):
+            counts.setdefault(faculty, {})[gender] = (before, after)
+    return drops
+
+
+def census_drops(versions=None):
+    """
+    所有学期的 census drop 人数，按快照对的版本缓存（新版本发布后自动重新计算）
+
+    Args:
+        versions (dict): 可选，{快照类型: 数据键}，查询保留的历史版本
+
+    Returns:
+        dict: {学期名: {faculty: {gender: (before census 人数, after census 人数)}}}
+    """
+    snapshots = tuple((versions or {}).get(snapshot, snapshot) for snapshot in SNAPSHOT_PAIR)
+    stamps = version_stamps(snapshots)
+    drops = _drops.get(stamps)
+    if drops is None:
+        drops = _compute(versions)
+        _drops.put(stamps, drops)
+    return drops
+
+
+def census_terms(versions=None):
+    """数据中出现的学期名（两个快照的并集），按名称排序"""
+    return sorted(census_drops(versions))
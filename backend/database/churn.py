@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from .models import EnrollmentFact
+from .schema import storage_name
+from .dimensions import dimension_labels
+from .engines import read_session
+from .versions import version_stamps, VersionedCache
+
+# census churn：before census 和 after census 两个快照中每个学生所在的 faculty 做集合运算，
+# 得出退出（dropped）、新增（added）和转 faculty（transferred）的学生
+#
+# 每个快照读一次去重后的 (faculty 维度键, masked_id)，两个快照的 masked_id 一起编码成按 masked_id 排序的整数，
+# 之后的反连接都是 NumPy 上按编号的布尔数组查表，不再逐行循环
+SNAPSHOT_PAIR = ('before_census', 'current')
+CHANGES = ('dropped', 'added', 'transferred')
+
+# faculty 为空的行在数组中的键
+NO_FACULTY = -1
+# 学生明细每页最多的学生数
+MAX_PAGE_SIZE = 1000
+# 最多缓存的快照对数
+MAX_CACHED_PAIRS = 8
+_churns = VersionedCache(MAX_CACHED_PAIRS)
+
+
+def _snapshot_students(key):
+    """快照中去重后的 (faculty 维度键, masked_id) 两列，masked_id 为空的行不参与比较"""
+    faculty = EnrollmentFact.__table__.c[storage_name('faculty_descr')]
+    query = read_session().query(faculty, EnrollmentFact.masked_id).filter(
+        EnrollmentFact.snapshot == key, EnrollmentFact.masked_id.isnot(None)
+    ).distinct()
+    frame = pd.DataFrame(query.all(), columns=['faculty', 'masked_id'])
+    faculties = pd.to_numeric(frame['faculty']).astype('Int64').to_numpy(dtype=np.int64, na_value=NO_FACULTY)
+    return faculties, frame['masked_id'].to_numpy(dtype=object)
+
+
+class CensusChurn:
+    """
+    两个快照之间的学生变化
+
+    每个快照保存 (faculty 编号, 学生编号) 去重后的两个数组，学生编号按 masked_id 排序，
+    students[编号] 为 masked_id；各分类的学生编号数组已排好序，分页时直接切片
+    """
+
+    def __init__(self, before, after):
+        (before_faculties, before_ids), (after_faculties, after_ids) = before, after
+        # masked_id 先按哈希编码，再按 masked_id 排序重新编号（比直接排序编码快）
+        codes, students = pd.factorize(np.concatenate([before_ids, after_ids]))
+        order = np.argsort(np.asarray(students, dtype=str), kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        codes = rank[codes]
+        self.students = np.asarray(students, dtype=object)[order]
+        # faculty 维度键同样换成 0..n-1 的编号，self.faculty_keys[编号] 为维度键
+        self.faculty_keys, faculties = np.unique(np.concatenate([before_faculties, after_faculties]),
+                                                 return_inverse=True)
+        self.before = (faculties[:len(before_ids)], codes[:len(before_ids)])
+        self.after = (faculties[len(before_ids):], codes[len(before_ids):])
+
+        width = len(self.students)
+        in_before = np.zeros(width, dtype=bool)
+        in_before[self.before[1]] = True
+        in_after = np.zeros(width, dtype=bool)
+        in_after[self.after[1]] = True
+
+        # (faculty, 学生) 合成一个整数键，同一 faculty 中是否还有这个学生即按键查布尔表（反连接，线性时间）
+        before_keys = self.before[0] * width + self.before[1]
+        after_keys = self.after[0] * width + self.after[1]
+        pairs = np.zeros(len(self.faculty_keys) * width, dtype=bool)
+        pairs[after_keys] = True
+        stayed_before = pairs[before_keys]
+        pairs[:] = False
+        pairs[before_keys] = True
+        stayed_after = pairs[after_keys]
+
+        # before 中的每一行：仍在该 faculty（retained）、两个快照都有但不在该 faculty（转出）、after 中没有（dropped）
+        self.before_rows = {
+            'retained': stayed_before,
+            'dropped': ~in_after[self.before[1]],
+            'transferred': in_after[self.before[1]] & ~stayed_before,
+        }
+        # after 中的每一行：转入、before 中没有（added）
+        self.after_rows = {
+            'retained': stayed_after,
+            'added': ~in_before[self.after[1]],
+            'transferred': in_before[self.after[1]] & ~stayed_after,
+        }
+
+        moved = np.zeros(width, dtype=bool)
+        moved[self.before[1][self.before_rows['transferred']]] = True
+        moved[self.after[1][self.after_rows['transferred']]] = True
+        self.changed = {
+            'dropped': np.flatnonzero(in_before & ~in_after),
+            'added': np.flatnonzero(~in_before & in_after),
+            'transferred': np.flatnonzero(moved),
+        }
+        self.totals = {
+            'before_census': int(in_before.sum()),
+            'after_census': int(in_after.sum()),
+            'retained': int((in_before & in_after).sum()) - len(self.changed['transferred']),
+            **{change: len(codes) for change, codes in self.changed.items()},
+        }
+
+    def faculty_summary(self):
+        """每个 faculty 的人数和各类变化人数，按净变化的绝对值降序"""
+        (before_faculties, _), (after_faculties, _) = self.before, self.after
+        keys = self.faculty_keys.tolist()
+        labels = dimension_labels('faculty_descr', set(keys))
+
+        def per_faculty(faculties, flags=None):
+            return np.bincount(faculties if flags is None else faculties[flags], minlength=len(keys))
+
+        columns = {
+            'before_census': per_faculty(before_faculties),
+            'after_census': per_faculty(after_faculties),
+            'retained': per_faculty(before_faculties, self.before_rows['retained']),
+            'dropped': per_faculty(before_faculties, self.before_rows['dropped']),
+            'transferred_out': per_faculty(before_faculties, self.before_rows['transferred']),
+            'added': per_faculty(after_faculties, self.after_rows['added']),
+            'transferred_in': per_faculty(after_faculties, self.after_rows['transferred']),
+        }
+        result = []
+        for position, key in enumerate(keys):
+            entry = {'faculty_descr': None if key == NO_FACULTY else labels.get(key)}
+            entry.update({name: int(counts[position]) for name, counts in columns.items()})
+            entry['net_change'] = entry['after_census'] - entry['before_census']
+            result.append(entry)
+        result.sort(key=lambda entry: abs(entry['net_change']), reverse=True)
+        return result
+
+    def student_codes(self, change, faculty_key=None):
+        """某类变化的学生编号（有序）；指定 faculty 时只取与该 faculty 有关的学生（转出或转入都算）"""
+        if faculty_key is None:
+            return self.changed[change]
+        faculty = np.searchsorted(self.faculty_keys, faculty_key)
+        if faculty == len(self.faculty_keys) or self.faculty_keys[faculty] != faculty_key:
+            return np.empty(0, dtype=np.int64)
+        (before_faculties, before_codes), (after_faculties, after_codes) = self.before, self.after
+        parts = []
+        if change in self.before_rows:
+            parts.append(before_codes[(before_faculties == faculty) & self.before_rows[change]])
+        if change in self.after_rows:
+            parts.append(after_codes[(after_faculties == faculty) & self.after_rows[change]])
+        return np.unique(np.concatenate(parts))
+
+    def students_page(self, codes, change):
+        """一页学生的明细：masked_id 以及在两个快照中所在的 faculty"""
+        labels = dimension_labels('faculty_descr')
+        faculties = {}
+        for side, (side_faculties, side_codes) in (('faculties_before', self.before), ('faculties_after', self.after)):
+            selected = np.isin(side_codes, codes)
+            keys = self.faculty_keys[side_faculties[selected]]
+            for code, key in zip(side_codes[selected].tolist(), keys.tolist()):
+                faculties.setdefault(code, {}).setdefault(side, []).append(
+                    None if key == NO_FACULTY else labels.get(key)
+                )
+        return [
+            {
+                'masked_id': self.students[code],
+                'change': change,
+                'faculties_before': sorted(faculties.get(code, {}).get('faculties_before', []), key=str),
+                'faculties_after': sorted(faculties.get(code, {}).get('faculties_after', []), key=str),
+            }
+            for code in codes.tolist()
+        ]
+
+
+def census_churn(versions=None):
+    """before census 与 after census 之间的学生变化，按快照对的版本缓存"""
+    snapshots = tuple((versions or {}).get(snapshot, snapshot) for snapshot in SNAPSHOT_PAIR)
+    stamps = version_stamps(snapshots)
+    churn = _churns.get(stamps)
+    if churn is None:
+        churn = CensusChurn(*[_snapshot_students(key) for key in snapshots])
+        _churns.put(stamps, churn)
+    return churn
+
+
+def census_churn_data(change=None, faculty=None, page=1, page_size=100, versions=None):
+    """
+    Census Day学生变化分析：退出、新增、转faculty的人数，以及一页学生明细
+
+    Args:
+        change (str): 学生明细的变化类型（dropped / added / transferred），为空时列出全部有变化的学生
+        faculty (str): 可选，只列出与该faculty有关的学生
+        page (int): 页码，从 1 开始
+        page_size (int): 每页学生数
+        versions (dict): 可选，{快照类型: 数据键}，查询保留的历史版本
+
+    Returns:
+        dict: {summary, faculties, students: {change, faculty, page, page_size, total, items}}
+    """
+    churn = census_churn(versions)
+
+    faculty_key = None
+    if faculty is not None:
+        faculty_key = next(
+            (key for key, label in dimension_labels('faculty_descr').items() if label == faculty), None
+        )
+    changes = [change] if change else list(CHANGES)
+    if faculty is not None and faculty_key is None:
+        listed = [(name, np.empty(0, dtype=np.int64)) for name in changes]
+    else:
+        listed = [(name, churn.student_codes(name, faculty_key)) for name in changes]
+
+    # 各类变化依次排列（同一类中按 masked_id 排序），只取当前页
+    total = sum(len(codes) for _, codes in listed)
+    start, items = (page - 1) * page_size, []
+    for name, codes in listed:
+        if start < len(codes) and len(items) < page_size:
+            selected = codes[start:start + page_size - len(items)]
+            items.extend(churn.students_page(selected, name))
+        start = max(start - len(codes), 0)
+
+    return {
+        'summary': churn.totals,
+        'faculties': churn.faculty_summary(),
+        'students': {
+            'change': change,
+            'faculty': faculty,
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'items': items,
+        },
+    }
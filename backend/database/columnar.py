@@ -0,0 +1,272 @@
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import text
+
+from .models import db, EnrollmentFact, SnapshotVersion
+from .dimensions import like_pattern
+from .engines import read_session
+
+# 列式快照：每个版本导出为一个目录，每列一个 .npy 文件，各进程以只读 mmap 方式打开，数据在页缓存中共享
+#   整数列（含字典编码列的维度键）  int64，空值为 NULL_INT
+#   字符串列                        int32 编码（空值为 -1）+ <列名>.labels.json 字典
+NULL_INT = np.iinfo(np.int64).min
+MANIFEST = 'manifest.json'
+
+# 导出时每次从数据库读取的行数
+EXPORT_CHUNK_SIZE = 50000
+
+# 已打开的版本 {版本 id: ColumnarSnapshot}
+_mapped = {}
+_map_lock = threading.Lock()
+
+# 列式统计支持的条件：<列> IS NOT NULL、<列> LIKE '<模式>'，多个条件用 AND 连接
+_CONDITION = re.compile(r"^(\w+) (?:(IS NOT NULL)|LIKE '([^']*)')$")
+
+
+def _store_folder():
+    return os.path.join(current_app.config['ANALYTICS_STORE_FOLDER'], 'columnar')
+
+
+def version_folder(version):
+    """版本的列式目录，目录名带上导入时间（与 Parquet 文件相同，数据库重建后不会读到旧目录）"""
+    return os.path.join(_store_folder(), f"version_{version.id}_{version.loaded_at:%Y%m%d%H%M%S%f}")
+
+
+def _store_columns():
+    return [column for column in EnrollmentFact.__table__.columns if column.name not in ('snapshot', 'id')]
+
+
+def _column_chunks(version, columns):
+    """按 EXPORT_CHUNK_SIZE 分块读出一个版本的行（PostgreSQL 上使用服务端游标，不会一次取回全部结果）"""
+    names = ', '.join(column.name for column in columns)
+    query = text(
+        f"SELECT {names} FROM {EnrollmentFact.__tablename__} WHERE snapshot = :key ORDER BY id"
+    ).execution_options(stream_results=True)
+    return pd.read_sql(query, db.session.connection(), params={'key': version.storage_key},
+                       chunksize=EXPORT_CHUNK_SIZE)
+
+
+def export_columnar_version(version):
+    """
+    把一个版本从数据库分块读出后写成列式目录
+
+    先按行数预分配每列的 .npy 文件（open_memmap），每读一块写入对应的行，峰值内存为一块数据和字符串列的字典；
+    字符串列的编码按标签首次出现的顺序分配，与整列一次 factorize 的结果相同。
+    先写到临时目录再改名，其它进程看到的目录总是完整的
+    """
+    folder = version_folder(version)
+    temporary = f"{folder}.tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+
+    columns = _store_columns()
+    rows = db.session.execute(text(
+        f"SELECT COUNT(*) FROM {EnrollmentFact.__tablename__} WHERE snapshot = :key"
+    ), {'key': version.storage_key}).scalar()
+
+    manifest = {'version': version.id, 'rows': rows, 'columns': {}}
+    arrays, codes = {}, {}
+    for column in columns:
+        string = not isinstance(column.type, db.Integer)
+        manifest['columns'][column.name] = 'string' if string else 'int'
+        arrays[column.name] = np.lib.format.open_memmap(
+            os.path.join(temporary, f"{column.name}.npy"), mode='w+',
+            dtype=np.int32 if string else np.int64, shape=(rows,)
+        )
+        if string:
+            codes[column.name] = {}
+
+    start = 0
+    for chunk in _column_chunks(version, columns):
+        end = start + len(chunk)
+        for column in columns:
+            values = chunk[column.name]
+            if column.name in codes:
+                # 块内编码换成全局编码，新出现的标签接在字典末尾
+                chunk_codes, labels = pd.factorize(values.astype('string'), use_na_sentinel=True)
+                known = codes[column.name]
+                mapping = np.array([known.setdefault(str(label), len(known)) for label in labels] + [-1],
+                                   dtype=np.int32)
+                arrays[column.name][start:end] = mapping[chunk_codes]
+            else:
+                arrays[column.name][start:end] = pd.to_numeric(values).astype('Int64').to_numpy(
+                    dtype=np.int64, na_value=NULL_INT
+                )
+        start = end
+    if start != rows:
+        raise RuntimeError(f"Snapshot {version.storage_key} changed while exporting ({start} of {rows} rows)")
+
+    for array in arrays.values():
+        array.flush()
+    arrays.clear()
+    for name, known in codes.items():
+        with open(os.path.join(temporary, f"{name}.labels.json"), 'w') as labels_file:
+            json.dump(list(known), labels_file)
+    with open(os.path.join(temporary, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temporary, folder)
+
+
+def sync_columnar_store():
+    """
+    让列式目录与数据库中保留的版本一致：导出还没有目录的版本，删除已被删除的版本的目录
+
+    Returns:
+        dict: {exported: 导出的版本 id, removed: 删除的目录名}
+    """
+    os.makedirs(_store_folder(), exist_ok=True)
+    versions = SnapshotVersion.query.order_by(SnapshotVersion.id).all()
+    exported = []
+    for version in versions:
+        if not os.path.exists(version_folder(version)):
+            export_columnar_version(version)
+            exported.append(version.id)
+
+    wanted = {version_folder(version) for version in versions}
+    removed = []
+    for folder in glob.glob(os.path.join(_store_folder(), 'version_*')):
+        if folder not in wanted and not folder.endswith('.tmp'):
+            shutil.rmtree(folder, ignore_errors=True)
+            removed.append(os.path.basename(folder))
+    return {'exported': exported, 'removed': sorted(removed)}
+
+
+class ColumnarSnapshot:
+    """一个版本的列式数据：各列按需以只读 mmap 打开（零拷贝），字符串列的字典读入内存"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, MANIFEST)) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.rows = manifest['rows']
+        self.types = manifest['columns']
+        self._arrays = {}
+        self._labels = {}
+
+    def array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.folder, f"{name}.npy"), mmap_mode='r')
+        return self._arrays[name]
+
+    def labels(self, name):
+        if name not in self._labels:
+            with open(os.path.join(self.folder, f"{name}.labels.json")) as labels_file:
+                self._labels[name] = np.array(json.load(labels_file), dtype=object)
+        return self._labels[name]
+
+    def not_null(self, name):
+        array = self.array(name)
+        return array != (NULL_INT if self.types[name] == 'int' else -1)
+
+    def like(self, name, pattern):
+        """字符串列满足 LIKE 模式的行：先在字典上匹配，再按编码取行"""
+        regex = like_pattern(pattern)
+        matched = [code for code, label in enumerate(self.labels(name)) if regex.fullmatch(label)]
+        return np.isin(self.array(name), matched)
+
+    def values(self, name, codes):
+        """把分组后的编码换回数据库中的值（整数列原样，字符串列换回字符串，空值为 None）"""
+        if self.types[name] == 'int':
+            return [None if code == NULL_INT else int(code) for code in codes]
+        labels = self.labels(name)
+        return [None if code < 0 else labels[code] for code in codes]
+
+
+def _open(key):
+    """快照键对应版本的列式数据；新版本发布后第一次查询时打开新目录，已删除版本的映射随之关闭"""
+    version = read_session().query(SnapshotVersion).filter_by(storage_key=key).first()
+    if version is None:
+        return None
+    folder = version_folder(version)
+    snapshot = _mapped.get(version.id)
+    if snapshot is not None and snapshot.folder == folder:
+        return snapshot
+    if not os.path.exists(os.path.join(folder, MANIFEST)):
+        return None
+    with _map_lock:
+        for version_id in [version_id for version_id, mapped in _mapped.items() if not os.path.exists(mapped.folder)]:
+            del _mapped[version_id]
+        snapshot = _mapped[version.id] = ColumnarSnapshot(folder)
+    return snapshot
+
+
+def _where_mask(snapshot, where):
+    """把统计条件转换成行掩码；不支持的条件返回 None，由调用方改查数据库"""
+    mask = np.ones(snapshot.rows, dtype=bool)
+    if not where:
+        return mask
+    for condition in re.split(r'\s+AND\s+', where.strip()):
+        match = _CONDITION.match(condition)
+        if match is None or match.group(1) not in snapshot.types:
+            return None
+        name, not_null, pattern = match.groups()
+        mask &= snapshot.not_null(name) if not_null else snapshot.like(name, pattern)
+    return mask
+
+
+def _group_counts(snapshot, columns, mask, distinct):
+    """按 columns 分组统计人数（distinct 时按 masked_id 去重），返回 {分组值: 人数}"""
+    if not mask.any():
+        return {}
+    # 各分组列先各自编码成 0..n-1，再按混合进制合成一个整数分组键，只需要一维的 unique
+    composite = np.zeros(int(mask.sum()), dtype=np.int64)
+    uniques = []
+    for name in columns:
+        values, codes = np.unique(snapshot.array(name)[mask], return_inverse=True)
+        composite = composite * len(values) + codes
+        uniques.append(values)
+    groups, inverse = np.unique(composite, return_inverse=True)
+    if distinct:
+        students = snapshot.array('masked_id')[mask].astype(np.int64)
+        width = int(students.max()) + 1
+        pairs = np.unique(inverse * width + students)
+        counts = np.bincount(pairs // width, minlength=len(groups))
+    else:
+        counts = np.bincount(inverse, minlength=len(groups))
+
+    # 把合成键拆回各列的编码，再换回数据库中的值
+    values = []
+    remainder = groups
+    for name, column_values in reversed(list(zip(columns, uniques))):
+        values.append(snapshot.values(name, column_values[remainder % len(column_values)]))
+        remainder = remainder // len(column_values)
+    values.reverse()
+    return {tuple(column[row] for column in values): int(counts[row]) for row in range(len(groups))}
+
+
+def columnar_counts(columns, where, distinct, snapshots, label_ids=None):
+    """
+    在列式快照上用 NumPy 做分组统计，结果与数据库上的统计相同
+
+    Args:
+        columns (list): 分组列（事实表字段名）
+        where (str): 统计条件（只支持 IS NOT NULL 和 LIKE），为 None 时统计全部行
+        distinct (bool): 按 masked_id 去重统计人数，否则统计行数
+        snapshots (tuple): 快照键
+        label_ids (dict): {事实表字段名: 允许的维度键列表}
+
+    Returns:
+        list: [(分组键..., 快照1人数, ...)]；某个快照还没有列式目录或条件不支持时返回 None
+    """
+    opened = [_open(key) for key in snapshots]
+    if any(snapshot is None for snapshot in opened):
+        return None
+
+    combined = {}
+    for number, snapshot in enumerate(opened):
+        mask = _where_mask(snapshot, where)
+        if mask is None:
+            return None
+        for name, ids in (label_ids or {}).items():
+            mask &= np.isin(snapshot.array(name), list(ids))
+        for key, count in _group_counts(snapshot, list(columns), mask, distinct).items():
+            combined.setdefault(key, [0] * len(snapshots))[number] = count
+    return [key + tuple(counts) for key, counts in combined.items()]
@@ -0,0 +1,109 @@
+import re
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import DIMENSION_TABLES
+from .engines import read_session
+from .schema import ENCODED_COLUMNS, storage_name
+
+# 已读取的维度标签 {target: {id: label}}；维度只增不删，遇到缓存中没有的 id 时整表重新读取
+_label_cache = {}
+
+
+def _insert_missing(connection, table):
+    """插入新标签，其它导入同时插入了同一标签时忽略（label 唯一）"""
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=['label'])
+    if connection.dialect.name == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=['label'])
+    return table.insert()
+
+
+def _select_ids(connection, table, labels):
+    return dict(connection.execute(
+        select(table.c.label, table.c.id).where(table.c.label.in_(labels))
+    ).all())
+
+
+def label_ids(connection, target, labels):
+    """
+    返回 {label: id}，维度表中还没有的标签先插入
+
+    PostgreSQL 上新标签在独立的短事务中提交，并发导入不会互相等待对方的整个导入事务；
+    导入失败回滚时多出的标签留在维度表中，不影响结果
+    SQLite 只允许一个写事务，沿用导入所在的连接
+    """
+    table = DIMENSION_TABLES[target]
+    labels = sorted(labels)
+    ids = _select_ids(connection, table, labels)
+    missing = [label for label in labels if label not in ids]
+    if missing:
+        if connection.dialect.name == 'postgresql':
+            with connection.engine.begin() as writer:
+                writer.execute(_insert_missing(writer, table), [{'label': label} for label in missing])
+        else:
+            connection.execute(_insert_missing(connection, table), [{'label': label} for label in missing])
+        ids.update(_select_ids(connection, table, missing))
+    return ids
+
+
+def encode_frame(connection, frame):
+    """把 frame 中字典编码的列换成维度表的整数键列 <target>_id（列的位置不变），空值保持为空"""
+    encoded = [column for column in frame.columns if column in ENCODED_COLUMNS]
+    for target in encoded:
+        values = frame[target]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('string').astype('category')
+        labels = [str(label) for label in values.cat.categories]
+        ids = label_ids(connection, target, labels) if labels else {}
+        # 按分类编码整列查表；编码 -1（空值）落在末尾的占位上，再标记为缺失
+        lookup = np.array([ids[label] for label in labels] + [0], dtype='int64')
+        codes = values.cat.codes.to_numpy()
+        frame[target] = pd.Series(lookup[codes], index=frame.index, dtype='Int64').mask(codes == -1)
+    return frame.rename(columns={target: storage_name(target) for target in encoded})
+
+
+def dimension_labels(target, ids=()):
+    """返回维度 target 的 {id: label}；ids 中有缓存里没有的键（其它进程新导入的标签）时重新读取"""
+    labels = _label_cache.get(target)
+    if labels is None or any(key is not None and key not in labels for key in ids):
+        table = DIMENSION_TABLES[target]
+        labels = dict(read_session().execute(select(table.c.id, table.c.label)).all())
+        _label_cache[target] = labels
+    return labels
+
+
+def decode_rows(rows, *targets):
+    """
+    把查询结果每行前 len(targets) 个值从维度键换回标签，其余值原样保留
+
+    targets 中为 None 的位置是未编码的列，不做转换
+    """
+    lookups = [
+        dimension_labels(target, {row[position] for row in rows}) if target else None
+        for position, target in enumerate(targets)
+    ]
+    decoded = []
+    for row in rows:
+        keys = tuple(
+            lookup.get(value) if lookup is not None and value is not None else value
+            for lookup, value in zip(lookups, row)
+        )
+        decoded.append(keys + tuple(row[len(targets):]))
+    return decoded
+
+
+def like_pattern(pattern):
+    """把 SQL LIKE 模式转换成正则（区分大小写，与 PostgreSQL 一致）"""
+    return re.compile(''.join(
+        '.*' if char == '%' else '.' if char == '_' else re.escape(char) for char in pattern
+    ), re.DOTALL)
+
+
+def labels_like(target, pattern):
+    """标签满足 LIKE pattern 的维度键子查询，用于在事实表上按标签过滤：column.in_(labels_like(...))"""
+    table = DIMENSION_TABLES[target]
+    return select(table.c.id).where(table.c.label.like(pattern))
@@ -0,0 +1,127 @@
+import threading
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .models import db
+
+# 分析接口使用的连接池（Flask-SQLAlchemy 的 bind），默认写连接池用于导入
+ANALYTICS_BIND = 'analytics'
+
+# 各连接池的使用情况 {池名: {checkouts, in_use, peak_in_use}}，用于确定连接池大小
+_pool_usage = {}
+_usage_lock = threading.Lock()
+
+
+def _engine_options(uri, pool_size, max_overflow, statement_timeout_ms, pre_ping):
+    """
+    一个连接池的引擎参数
+
+    池大小和语句超时只对 PostgreSQL 生效（超时通过连接参数设置，超时的语句由服务端取消）
+    """
+    options = {'pool_pre_ping': pre_ping}
+    if uri.startswith('postgresql'):
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+        if statement_timeout_ms:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+
+def configure_engines(app):
+    """
+    db.init_app 之前调用：写连接池（默认引擎，导入使用）和分析只读连接池各自的参数
+
+    ANALYTICS_DATABASE_URI 为空时两个连接池连同一个数据库，否则分析查询改查该库（例如只读副本）
+    """
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **_engine_options(uri, config['WRITER_POOL_SIZE'], config['WRITER_MAX_OVERFLOW'],
+                          config['WRITER_STATEMENT_TIMEOUT_MS'], config['POOL_PRE_PING']),
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
+    analytics_uri = config.get('ANALYTICS_DATABASE_URI') or uri
+    config['SQLALCHEMY_BINDS'] = {
+        **(config.get('SQLALCHEMY_BINDS') or {}),
+        ANALYTICS_BIND: {
+            'url': analytics_uri,
+            **_engine_options(analytics_uri, config['ANALYTICS_POOL_SIZE'], config['ANALYTICS_MAX_OVERFLOW'],
+                              config['ANALYTICS_STATEMENT_TIMEOUT_MS'], config['POOL_PRE_PING'])
+        }
+    }
+    app.teardown_appcontext(_close_read_session)
+
+
+def _watch_pool(name, engine):
+    usage = {'checkouts': 0, 'in_use': 0, 'peak_in_use': 0}
+    _pool_usage[name] = usage
+
+    def checkout(*args):
+        with _usage_lock:
+            usage['checkouts'] += 1
+            usage['in_use'] += 1
+            usage['peak_in_use'] = max(usage['peak_in_use'], usage['in_use'])
+
+    def checkin(*args):
+        with _usage_lock:
+            usage['in_use'] -= 1
+
+    event.listen(engine, 'checkout', checkout)
+    event.listen(engine, 'checkin', checkin)
+
+
+def watch_pools():
+    """db.init_app 之后在应用上下文中调用：记录两个连接池的借出次数和同时借出的峰值"""
+    _watch_pool('writer', db.engine)
+    _watch_pool(ANALYTICS_BIND, db.engines[ANALYTICS_BIND])
+
+
+def read_session():
+    """
+    分析查询使用的会话（分析连接池），每个应用上下文一个，上下文结束时关闭
+
+    只用于读取；导入事务中的统计（预聚合刷新）仍使用 db.session，读到未提交的数据
+    """
+    session = g.get('_read_session')
+    if session is None:
+        session = g._read_session = Session(bind=db.engines[ANALYTICS_BIND])
+    return session
+
+
+def _close_read_session(exc):
+    session = g.pop('_read_session', None)
+    if session is not None:
+        session.close()
+
+
+def pool_stats():
+    """
+    各连接池的使用情况
+
+    Returns:
+        dict: {池名: {url, pool, size, max_overflow, checked_out, checked_in, overflow,
+                      checkouts, peak_in_use, utilization}}，utilization 为同时借出的峰值占池容量的比例
+    """
+    stats = {}
+    for name, engine in (('writer', db.engine), (ANALYTICS_BIND, db.engines[ANALYTICS_BIND])):
+        pool = engine.pool
+        usage = dict(_pool_usage.get(name, {}))
+        entry = {
+            'url': engine.url.render_as_string(hide_password=True),
+            'pool': type(pool).__name__,
+            'checkouts': usage.get('checkouts', 0),
+            'peak_in_use': usage.get('peak_in_use', 0),
+        }
+        if hasattr(pool, 'size') and hasattr(pool, 'checkedout'):
+            capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+            entry.update(
+                size=pool.size(),
+                max_overflow=getattr(pool, '_max_overflow', None),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+                utilization=round(entry['peak_in_use'] / capacity, 3) if capacity else None
+            )
+        stats[name] = entry
+    return stats
@@ -0,0 +1,46 @@
+import hashlib
+from datetime import datetime
+
+from .models import db, TableFingerprint
+from .schema import SCHEMA_VERSION
+
+# 计算指纹时每次读取的字节数
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_fingerprint(file):
+    """按块计算上传文件内容的 SHA-256，不把整个文件读进内存"""
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    for block in iter(lambda: file.stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    file.stream.seek(0)
+    return digest.hexdigest()
+
+
+def fingerprint_matches(table_name, content_hash):
+    """目标表当前内容是否就是这个文件（内容和列定义版本都一致）"""
+    fingerprint = db.session.get(TableFingerprint, table_name)
+    return (
+        fingerprint is not None
+        and fingerprint.content_hash == content_hash
+        and fingerprint.schema_version == SCHEMA_VERSION
+    )
+
+
+def record_fingerprint(table_name, content_hash, row_count):
+    """在导入事务中记录（或清除）目标表的指纹，与数据一起提交"""
+    fingerprint = db.session.get(TableFingerprint, table_name)
+    if content_hash is None:
+        # 来源未知的导入，旧指纹不再代表表内容
+        if fingerprint is not None:
+            db.session.delete(fingerprint)
+        return
+
+    if fingerprint is None:
+        fingerprint = TableFingerprint(table_name=table_name)
+        db.session.add(fingerprint)
+    fingerprint.content_hash = content_hash
+    fingerprint.schema_version = SCHEMA_VERSION
+    fingerprint.row_count = row_count
+    fingerprint.loaded_at = datetime.now()
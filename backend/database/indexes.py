@@ -0,0 +1,128 @@
+import time
+
+from sqlalchemy import text
+
+
+def create_table_indexes(connection, table):
+    """
+    补建表上声明但数据库中还没有的索引（在一个事务中建立，建索引期间表不能写入）
+
+    Returns:
+        dict: {indexes_created, index_seconds}
+    """
+    started = time.perf_counter()
+    created = []
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if connection.dialect.has_index(connection, table.name, index.name):
+            continue
+        index.create(connection)
+        created.append(index.name)
+    return {
+        'indexes_created': created,
+        'index_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def _partition_index_name(index_name, partition_oid):
+    # 分区上的索引名：父索引名 + 分区 oid，不超过 PostgreSQL 63 字节的标识符长度
+    return f"{index_name[:50]}_{partition_oid}"
+
+
+def create_index_concurrently(engine, table, index):
+    """
+    PostgreSQL：不阻塞写入地建立一个索引（CREATE INDEX CONCURRENTLY 不能在事务中执行，使用自动提交连接）
+
+    分区表不支持直接 CONCURRENTLY：先在父表上 ON ONLY 建一个空的（无效）索引，
+    再在各分区上 CONCURRENTLY 建索引并挂到父索引下，全部挂上后父索引自动生效；中途失败可以重新执行
+
+    Returns:
+        bool: 是否新建了索引
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if connection.dialect.has_index(connection, table.name, index.name):
+            valid = connection.execute(text(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = CAST(:name AS regclass)"
+            ), {'name': index.name}).scalar()
+            if valid:
+                return False
+        columns = ', '.join(column.name for column in index.columns)
+        where = index.dialect_options['postgresql']['where']
+        condition = f" WHERE {where}" if where is not None else ''
+        partitions = connection.execute(text(
+            "SELECT h.inhrelid, CAST(CAST(h.inhrelid AS regclass) AS text) FROM pg_inherits h "
+            "WHERE h.inhparent = CAST(:table AS regclass) ORDER BY h.inhrelid"
+        ), {'table': table.name}).all()
+        if not partitions:
+            connection.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table.name} ({columns}){condition}"
+            ))
+            return True
+
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index.name} ON ONLY {table.name} ({columns}){condition}"))
+        # 上次中途失败时已经挂上的分区跳过
+        attached = set(connection.execute(text(
+            "SELECT i.indrelid FROM pg_inherits h JOIN pg_index i ON i.indexrelid = h.inhrelid "
+            "WHERE h.inhparent = CAST(:name AS regclass)"
+        ), {'name': index.name}).scalars())
+        for partition_oid, partition in partitions:
+            if partition_oid in attached:
+                continue
+            child = _partition_index_name(index.name, partition_oid)
+            connection.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} ({columns}){condition}"
+            ))
+            connection.execute(text(f"ALTER INDEX {index.name} ATTACH PARTITION {child}"))
+        return True
+
+
+def index_usage_report(connection, tables):
+    """
+    统计各表索引的使用情况，用于找出可以删除的索引
+
+    PostgreSQL 读取 pg_stat_user_indexes（自上次重置统计以来的扫描次数）；
+    SQLite 没有使用统计，只列出索引和所在的表
+
+    分区表的统计记在各分区的索引上，parent_index 为它所属的父表索引（删除索引时要删父表索引）
+
+    Returns:
+        list: [{table, index, parent_index, scans, tuples_read, size_bytes, unused}]
+    """
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(text("""
+            SELECT s.relname, s.indexrelname,
+                   COALESCE((SELECT CAST(CAST(h.inhparent AS regclass) AS text)
+                             FROM pg_inherits h WHERE h.inhrelid = s.indexrelid), s.indexrelname),
+                   s.idx_scan, s.idx_tup_read, pg_relation_size(s.indexrelid), i.indisprimary
+            FROM pg_stat_user_indexes s
+            JOIN pg_index i ON i.indexrelid = s.indexrelid
+            WHERE s.relname = ANY(:tables)
+            ORDER BY s.relname, s.idx_scan, s.indexrelname
+        """), {'tables': list(tables)}).all()
+        return [
+            {
+                'table': table_name,
+                'index': index_name,
+                'parent_index': parent_index,
+                'scans': scans,
+                'tuples_read': tuples_read,
+                'size_bytes': size,
+                'unused': scans == 0 and not primary
+            }
+            for table_name, index_name, parent_index, scans, tuples_read, size, primary in rows
+        ]
+
+    report = []
+    for table_name in tables:
+        for index_name, in connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table_name ORDER BY name"
+        ), {'table_name': table_name}):
+            report.append({
+                'table': table_name,
+                'index': index_name,
+                'parent_index': index_name,
+                'scans': None,
+                'tuples_read': None,
+                'size_bytes': None,
+                'unused': None
+            })
+    return report
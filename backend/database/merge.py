@@ -0,0 +1,108 @@
+from sqlalchemy import text
+
+# 合并按整行比较：除 snapshot 和 id（快照内的行号）以外所有列都相同才算同一行，
+# 任何一列变化（例如 gender、faculty）都按删除旧行、插入新行处理
+#
+# 同一内容的行可能重复出现，每行按在同内容行中的序号（occurrence）区分，比较的是多重集合：
+# 合并后快照中的行与上传文件逐行一致（只有行号不同），和整表重写的结果相同
+
+
+def incoming_name(table_name):
+    return f"{table_name}_incoming"
+
+
+def _diff_name(table_name):
+    return f"{table_name}_diff"
+
+
+def _compared_columns(table):
+    return [column.name for column in table.columns if column.name not in ('snapshot', 'id')]
+
+
+def create_incoming_table(connection, table):
+    """创建与目标表同列的临时表，用来接收本次上传的全部行（id 为行在上传文件中的序号），返回临时表名"""
+    incoming = incoming_name(table.name)
+    connection.execute(text(f"DROP TABLE IF EXISTS {incoming}"))
+    connection.execute(text(
+        f"CREATE TEMPORARY TABLE {incoming} AS SELECT * FROM {table.name} WHERE 1 = 0"
+    ))
+    return incoming
+
+
+def diff_incoming_table(connection, table, snapshot):
+    """
+    按整行把临时表与目标表中 snapshot 的数据做集合差异，结果存在差异临时表中（由 apply_incoming_diff 应用）
+
+    两边的行放在一起按 (所有列, occurrence) 分组，只出现在一边的组就是差异；
+    分组时空值视为相等，不需要在可为空的列上做等值连接
+
+    Returns:
+        dict: {added, removed, unchanged}
+    """
+    incoming = incoming_name(table.name)
+    diff = _diff_name(table.name)
+    compared = ', '.join(_compared_columns(table))
+
+    # 差异行：(线上行号, 空) 为要删除的行，(空, 上传序号) 为要插入的行
+    connection.execute(text(f"DROP TABLE IF EXISTS {diff}"))
+    connection.execute(text(f"""
+        CREATE TEMPORARY TABLE {diff} AS
+        SELECT MAX(live_id) AS live_id, MAX(incoming_id) AS incoming_id
+        FROM (
+            SELECT {compared}, ROW_NUMBER() OVER (PARTITION BY {compared} ORDER BY id) AS occurrence,
+                   id AS live_id, NULL AS incoming_id
+            FROM {table.name} WHERE snapshot = :snapshot
+            UNION ALL
+            SELECT {compared}, ROW_NUMBER() OVER (PARTITION BY {compared} ORDER BY id) AS occurrence,
+                   NULL AS live_id, id AS incoming_id
+            FROM {incoming}
+        ) compared_rows
+        GROUP BY {compared}, occurrence
+        HAVING COUNT(*) = 1
+    """), {'snapshot': snapshot})
+
+    incoming_rows = connection.execute(text(f"SELECT COUNT(*) FROM {incoming}")).scalar()
+    removed, added = connection.execute(text(f"SELECT COUNT(live_id), COUNT(incoming_id) FROM {diff}")).one()
+    return {
+        'added': added,
+        'removed': removed,
+        'unchanged': incoming_rows - added
+    }
+
+
+def apply_incoming_diff(connection, table, snapshot):
+    """
+    删除差异中已不存在的行，插入新出现的行，其余行不动，最后删除两个临时表
+
+    Returns:
+        bool: 合并后快照的行数与上传的行数是否一致
+    """
+    incoming = incoming_name(table.name)
+    diff = _diff_name(table.name)
+    columns = ', '.join(column.name for column in table.columns if column.name != 'id')
+    selected = ', '.join(f"i.{column.name}" for column in table.columns if column.name != 'id')
+    params = {'snapshot': snapshot}
+
+    connection.execute(text(f"""
+        DELETE FROM {table.name}
+        WHERE snapshot = :snapshot
+          AND id IN (SELECT live_id FROM {diff} WHERE live_id IS NOT NULL)
+    """), params)
+
+    # 新增的行号接在快照现有最大行号之后，按在上传文件中的顺序编号
+    connection.execute(text(f"""
+        INSERT INTO {table.name} (id, {columns})
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM {table.name} WHERE snapshot = :snapshot)
+               + ROW_NUMBER() OVER (ORDER BY i.id), {selected}
+        FROM {incoming} i
+        WHERE i.id IN (SELECT incoming_id FROM {diff} WHERE incoming_id IS NOT NULL)
+    """), params)
+
+    incoming_rows = connection.execute(text(f"SELECT COUNT(*) FROM {incoming}")).scalar()
+    connection.execute(text(f"DROP TABLE {diff}"))
+    connection.execute(text(f"DROP TABLE {incoming}"))
+
+    live_rows = connection.execute(text(
+        f"SELECT COUNT(*) FROM {table.name} WHERE snapshot = :snapshot"
+    ), params).scalar()
+    return live_rows == incoming_rows
@@ -0,0 +1,141 @@
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from .models import db, EnrollmentFact, SchemaMigration, SnapshotVersion, TableFingerprint
+from .indexes import create_table_indexes, create_index_concurrently
+from .snapshots import storage_tables, init_snapshot_storage
+
+# schema 迁移，按版本号顺序执行，执行过的记录在 schema_migration 表中
+#   version  版本号，只能在末尾追加，已发布的迁移不再修改
+#   name     迁移名
+#   upgrade  upgrade(engine)，自己决定在事务中执行还是使用自动提交连接
+#   offline  耗时的迁移（例如在已有数据上建索引），不在启动时执行，由 flask db-upgrade 执行
+Migration = namedtuple('Migration', ['version', 'name', 'upgrade', 'offline'])
+
+# 多个进程同时执行迁移时用 PostgreSQL advisory lock 排队
+MIGRATION_LOCK_KEY = 7301946
+
+
+def _baseline(engine):
+    """迁移机制之前由 create_all 建立的结构：建表、建快照分区、迁移旧的快照表、建视图（已存在的跳过）"""
+    with engine.begin() as connection:
+        db.metadata.create_all(connection, tables=storage_tables())
+        init_snapshot_storage(connection)
+
+
+def _snapshot_indexes(engine):
+    """事实表上声明的索引（见 schema.py 中的 SNAPSHOT_INDEXES），PostgreSQL 上不阻塞写入地建立"""
+    table = EnrollmentFact.__table__
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as connection:
+            create_table_indexes(connection, table)
+        return
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        create_index_concurrently(engine, table, index)
+
+
+def _drop_merge_fingerprints(engine):
+    """
+    之前的 merge 导入只按自然键比较，键不变、其它列变化的行没有更新，却照样记录了文件指纹，
+    同一文件再次上传会被跳过；删除线上版本由 merge 导入的快照的指纹，下次上传时重新导入
+    """
+    with engine.begin() as connection:
+        connection.execute(text(f"""
+            DELETE FROM {TableFingerprint.__tablename__}
+            WHERE content_hash IN (
+                SELECT content_hash FROM {SnapshotVersion.__tablename__}
+                WHERE live = :live AND load_mode = 'merge' AND content_hash IS NOT NULL
+            )
+        """), {'live': True})
+
+
+MIGRATIONS = [
+    Migration(1, 'baseline', _baseline, offline=False),
+    Migration(2, 'snapshot_indexes', _snapshot_indexes, offline=True),
+    Migration(3, 'drop_merge_fingerprints', _drop_merge_fingerprints, offline=False),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(engine):
+    """数据库当前的 schema 版本；还没有 schema_migration 表（新库或迁移机制之前的库）时为 0"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text(f"SELECT MAX(version) FROM {SchemaMigration.__tablename__}")).scalar() or 0
+    except DBAPIError:
+        return 0
+
+
+@contextmanager
+def _migration_lock(engine):
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+
+
+def pending_migrations(engine):
+    current = schema_version(engine)
+    return [migration for migration in MIGRATIONS if migration.version > current]
+
+
+def upgrade(engine, include_offline=True):
+    """
+    按顺序执行还没有执行的迁移；include_offline=False 时遇到离线迁移就停下（之后的迁移可能依赖它）
+
+    Returns:
+        list: 执行过的迁移版本号
+    """
+    applied = []
+    with _migration_lock(engine):
+        SchemaMigration.__table__.create(engine, checkfirst=True)
+        for migration in pending_migrations(engine):
+            if migration.offline and not include_offline:
+                print(f"Schema migration {migration.version} ({migration.name}) is pending and runs offline: "
+                      f"flask --app app db-upgrade")
+                break
+            started = time.perf_counter()
+            migration.upgrade(engine)
+            seconds = round(time.perf_counter() - started, 3)
+            with engine.begin() as connection:
+                connection.execute(SchemaMigration.__table__.insert().values(
+                    version=migration.version, name=migration.name, seconds=seconds, applied_at=datetime.now()
+                ))
+            print(f"Applied schema migration {migration.version} ({migration.name}) in {seconds}s")
+            applied.append(migration.version)
+    return applied
+
+
+def check_schema(engine, auto_migrate=True):
+    """
+    启动时的检查：正常情况下只读一次 schema_migration 中的版本号
+
+    版本落后时，auto_migrate 为 True 则执行在线迁移；新库（还没有事实表）没有数据，全部迁移都直接执行
+
+    Returns:
+        int: 检查（和迁移）之后的 schema 版本
+    """
+    current = schema_version(engine)
+    if current == LATEST_VERSION:
+        return current
+    if current > LATEST_VERSION:
+        print(f"Database schema version {current} is newer than this code ({LATEST_VERSION})")
+        return current
+    if not auto_migrate:
+        print(f"Database schema version {current} is behind {LATEST_VERSION}: run flask --app app db-upgrade")
+        return current
+
+    fresh = current == 0 and not inspect(engine).has_table(EnrollmentFact.__tablename__)
+    upgrade(engine, include_offline=fresh)
+    return schema_version(engine)
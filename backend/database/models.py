@@ -1,4 +1,6 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from .schema import ENROLMENT_SCHEMA, SNAPSHOT_INDEXES, schema_columns, storage_name
 
 db = SQLAlchemy()
 
@@ -61,86 +63,159 @@ class ExtraData(db.Model):
 # 2. 上传两个文件，一个before，一个after，用于Census Day的分析
 # 3. 上传两个文件，一个before，一个after，用于YoY的分析
 # 4. 上传两个文件，一个before，一个after，用于Census Day的分析和YoY的分析
+#
+# 三种快照的数据统一存放在事实表 enrollment_fact 中，用 snapshot 列区分
+# （PostgreSQL 上按 snapshot 做 LIST 分区，每种快照一个分区）；
+# CurrentData / BeforeCensusData / PreviousData 映射到同名视图，原有查询不用修改；
+# 重复的描述性字符串（faculty_descr、gender 等）在事实表中只存维度表的整数键，视图再把标签连接回来
 
-class CurrentData(db.Model):
-    """当前/最新数据表 - 默认上传和大部分分析都用这张表"""
-    id = db.Column(db.Integer, primary_key=True)
-    
-    residency_group_descr = db.Column(db.String(100))
-    academic_year = db.Column(db.Integer)
-    term = db.Column(db.Integer)
-    term_descr = db.Column(db.String(100))
-    academic_career_descr = db.Column(db.String(100))
-    acad_prog = db.Column(db.Integer)
-    academic_program_descr = db.Column(db.String(100))
-    course_id = db.Column(db.Integer)
-    offer_number = db.Column(db.Integer)
-    faculty = db.Column(db.String(100))
-    faculty_descr = db.Column(db.String(100))
-    school = db.Column(db.String(100))
-    school_name = db.Column(db.String(100))
-    course_name = db.Column(db.String(100))
-    gender = db.Column(db.String(100))
-    first_generation_ind = db.Column(db.String(100))
-    atsi_desc = db.Column(db.String(100))
-    atsi_group = db.Column(db.String(100))
-    regional_remote = db.Column(db.String(100))
-    ses = db.Column(db.String(100))
-    admission_pathway = db.Column(db.String(100))
-    course_code = db.Column(db.String(100))
-    catalog_number = db.Column(db.Integer)
-    crse_attr = db.Column(db.String(100))
-    masked_id = db.Column(db.String(100))
+def _enrolment_columns(name, extended):
+    """根据 schema.py 中的共享列定义生成快照视图的字段 mixin（列为标签字符串）"""
+    attrs = {'id': db.Column(db.Integer, primary_key=True)}
+    for spec in schema_columns(extended):
+        column_type = db.Integer if spec.dtype == 'int' else db.String(100)
+        attrs[spec.target] = db.Column(column_type, nullable=spec.nullable)
+    return type(name, (), attrs)
+
+
+def _fact_columns():
+    """事实表的字段 mixin：字典编码的列存为 <target>_id 整数键（不加外键约束，避免 COPY 时逐行检查）"""
+    attrs = {}
+    for spec in ENROLMENT_SCHEMA:
+        if spec.encoded:
+            attrs[storage_name(spec.target)] = db.Column(db.Integer)
+        else:
+            column_type = db.Integer if spec.dtype == 'int' else db.String(100)
+            attrs[spec.target] = db.Column(column_type, nullable=spec.nullable)
+    return type('FactColumns', (), attrs)
+
+
+# 含扩展字段（gender、ses 等，2025年格式）和只含基础字段（2024年格式）两种
+EnrolmentColumns = _enrolment_columns('EnrolmentColumns', extended=True)
+BaseEnrolmentColumns = _enrolment_columns('BaseEnrolmentColumns', extended=False)
+
+
+def _dimension_table(target):
+    """维度表 dim_<target>：每个不同的标签一行，标签只增不删，id 一经分配不再变化"""
+    return db.Table(
+        f"dim_{target}",
+        db.Column('id', db.Integer, primary_key=True),
+        db.Column('label', db.String(100), nullable=False, unique=True)
+    )
+
+
+# 字典编码的列对应的维度表 {target: Table}
+DIMENSION_TABLES = {spec.target: _dimension_table(spec.target) for spec in ENROLMENT_SCHEMA if spec.encoded}
+
+
+class EnrollmentFact(_fact_columns(), db.Model):
+    """选课事实表 - 所有快照的数据，snapshot 为 current / previous / before_census"""
+    __tablename__ = 'enrollment_fact'
+    __table_args__ = {'postgresql_partition_by': 'LIST (snapshot)'}
+
+    snapshot = db.Column(db.String(16), primary_key=True)
+    # 快照内的行号，由导入程序生成
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+
+def _add_snapshot_indexes(model):
+    """按 schema.py 中的索引定义给事实表加索引，snapshot 作为第一列（导入时先写数据、后建索引）"""
+    table = model.__table__
+    for spec in SNAPSHOT_INDEXES:
+        where = db.text(spec.where) if spec.where else None
+        db.Index(f"ix_{table.name}_{spec.name}", table.c.snapshot,
+                 *[table.c[storage_name(name)] for name in spec.columns],
+                 postgresql_where=where, sqlite_where=where)
+
+
+_add_snapshot_indexes(EnrollmentFact)
+
+
+def _snapshot_view(snapshot):
+    """视图模型的表参数：create_all 跳过视图，由 database/snapshots.py 按 snapshot 建视图"""
+    return {'info': {'is_view': True, 'snapshot': snapshot}}
+
+
+class CurrentData(EnrolmentColumns, db.Model):
+    """当前/最新数据（视图）- 默认上传和大部分分析都用这张表"""
+    __table_args__ = _snapshot_view('current')
+
+
+class BeforeCensusData(EnrolmentColumns, db.Model):
+    """Census Day之前数据（视图）- 用于Census Day对比分析"""
+    __table_args__ = _snapshot_view('before_census')
+
+
+class PreviousData(BaseEnrolmentColumns, db.Model):
+    """历史数据（视图）- 用于年度对比分析"""
+    __table_args__ = _snapshot_view('previous')
 
-class BeforeCensusData(db.Model):
-    """Census Day之前数据表 - 用于Census Day对比分析"""
-    id = db.Column(db.Integer, primary_key=True)
-    
-    residency_group_descr = db.Column(db.String(100))
-    academic_year = db.Column(db.Integer)
-    term = db.Column(db.Integer)
-    term_descr = db.Column(db.String(100))
-    academic_career_descr = db.Column(db.String(100))
-    acad_prog = db.Column(db.Integer)
-    academic_program_descr = db.Column(db.String(100))
-    course_id = db.Column(db.Integer)
-    offer_number = db.Column(db.Integer)
-    faculty = db.Column(db.String(100))
-    faculty_descr = db.Column(db.String(100))
-    school = db.Column(db.String(100))
-    school_name = db.Column(db.String(100))
-    course_name = db.Column(db.String(100))
-    gender = db.Column(db.String(100))
-    first_generation_ind = db.Column(db.String(100))
-    atsi_desc = db.Column(db.String(100))
-    atsi_group = db.Column(db.String(100))
-    regional_remote = db.Column(db.String(100))
-    ses = db.Column(db.String(100))
-    admission_pathway = db.Column(db.String(100))
-    course_code = db.Column(db.String(100))
-    catalog_number = db.Column(db.Integer)
-    crse_attr = db.Column(db.String(100))
-    masked_id = db.Column(db.String(100))
 
-class PreviousData(db.Model):
-    """历史数据表 - 用于年度对比分析"""
+class IngestJob(db.Model):
+    """后台导入任务表 - /batch_upload 入队后由后台线程执行，进程重启后可以恢复"""
+    id = db.Column(db.String(32), primary_key=True)
+    analysis_mode = db.Column(db.String(32), nullable=False)
+    # 为空时按 LOAD_MODE 配置导入，merge 表示增量合并
+    load_mode = db.Column(db.String(16))
+    # queued / running / succeeded / failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    stage = db.Column(db.String(16))
+    # 各阶段进度 {stage: {status, rows, elapsed}}
+    stages = db.Column(db.JSON, default=dict)
+    # 上传文件保存路径和原始文件名 [[path, filename], ...]
+    files = db.Column(db.JSON, nullable=False)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(64))
+    attempts = db.Column(db.Integer, default=0)
+    # 执行中的任务定期刷新心跳（epoch 秒），心跳过期的 running 任务视为进程已退出
+    heartbeat = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+
+class TableFingerprint(db.Model):
+    """快照表当前内容对应的源文件指纹 - 同一文件重复上传时跳过解析和导入"""
+    table_name = db.Column(db.String(64), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    schema_version = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    loaded_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class SnapshotAggregate(db.Model):
+    """快照的预聚合结果 - 每次导入时在同一事务中刷新，分析接口直接读取，不再逐行统计"""
+    snapshot = db.Column(db.String(16), primary_key=True)
+    cube = db.Column(db.String(32), primary_key=True)
+    # 生成时的分组定义，与 aggregates.py 中的定义不一致时视为过期，改用实时查询
+    definition = db.Column(db.String(255), nullable=False)
+    # [[分组键..., 人数], ...]，字典编码的列存维度键
+    rows = db.Column(db.JSON, nullable=False)
+    refreshed_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class SnapshotVersion(db.Model):
+    """快照的导入版本 - 每次导入生成一个版本，被覆盖的旧版本按保留策略留在事实表中，可以按版本查询"""
     id = db.Column(db.Integer, primary_key=True)
-    
-    residency_group_descr = db.Column(db.String(100))
-    academic_year = db.Column(db.Integer)
-    term = db.Column(db.Integer)
-    term_descr = db.Column(db.String(100))
-    academic_career_descr = db.Column(db.String(100))
-    acad_prog = db.Column(db.Integer)
-    academic_program_descr = db.Column(db.String(100))
-    course_id = db.Column(db.Integer)
-    offer_number = db.Column(db.Integer)
-    faculty = db.Column(db.String(100))
-    faculty_descr = db.Column(db.String(100))
-    school = db.Column(db.String(100))
-    school_name = db.Column(db.String(100))
-    course_name = db.Column(db.String(100))
-    course_code = db.Column(db.String(100))
-    catalog_number = db.Column(db.Integer)
-    crse_attr = db.Column(db.String(100))
-    masked_id = db.Column(db.String(100))
\ No newline at end of file
+    # current / previous / before_census
+    snapshot = db.Column(db.String(16), nullable=False)
+    # 数据在 enrollment_fact.snapshot 中的键：线上版本为快照类型本身，历史版本为 v<id>
+    storage_key = db.Column(db.String(16), nullable=False)
+    live = db.Column(db.Boolean, nullable=False, default=True)
+    # 导入任务 id（/batch_upload 返回的 job_id），直接导入时为空
+    upload_id = db.Column(db.String(32))
+    load_mode = db.Column(db.String(16))
+    content_hash = db.Column(db.String(64))
+    row_count = db.Column(db.Integer)
+    size_bytes = db.Column(db.BigInteger)
+    loaded_at = db.Column(db.DateTime, default=datetime.now)
+    # 被新的导入覆盖、转为历史版本的时间
+    retained_at = db.Column(db.DateTime)
+
+
+class SchemaMigration(db.Model):
+    """已执行的 schema 迁移 - 版本号最大的一行即数据库当前的 schema 版本（见 migrations.py）"""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(64), nullable=False)
+    seconds = db.Column(db.Float)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
@@ -1,13 +1,43 @@
-from .models import db, TermData, ExtraData, CurrentData, PreviousData, BeforeCensusData
+from .models import db, TermData, ExtraData, EnrollmentFact
+from .bulk_loader import bulk_insert, DEFAULT_BATCH_SIZE
+from .schema import coerce_frame, source_columns, READ_DTYPES
+from .staging import create_staging_table, build_staging_indexes, swap_staging_partition
+from .merge import create_incoming_table, diff_incoming_table, apply_incoming_diff
+from .dimensions import encode_frame
+from .aggregates import snapshot_counts, refresh_snapshot_aggregates, AGGREGATE_CUBES
+from .pivot import pivot_rows, run_presets, aggregate, aggregate_query, PRESETS as AGGREGATE_PRESETS
+from .census import census_drops, census_terms
+from .churn import census_churn_data, CHANGES as CHURN_CHANGES, MAX_PAGE_SIZE as CHURN_MAX_PAGE_SIZE
+from .student_index import refresh_student_index
+from .analytics_store import sync_analytics_store
+from .versions import (
+    live_version, retain_live_version, attach_retained_version, record_live_version, evict_versions, retained_keys
+)
+from .indexes import index_usage_report
+from .migrations import check_schema
+from .engines import configure_engines, watch_pools
+from .snapshots import SNAPSHOT_VIEWS, partition_name, clear_snapshot, analyze_snapshot
+from .fingerprints import file_fingerprint, fingerprint_matches, record_fingerprint
 from collections import defaultdict
+from utils.file_readers import iter_file_chunks, read_column_sample, DEFAULT_CHUNK_SIZE
+from services.parallel_parser import parse_uploads
+from flask import current_app
 import pandas as pd
-from io import StringIO
+
+# 各快照类型对应的数据视图（数据实际存放在 enrollment_fact 中）
+SNAPSHOT_MODELS = SNAPSHOT_VIEWS
+
+# 上传文件中导入会用到的列（含扩展字段，是三张表的全集）
+LOADER_COLUMNS = source_columns(extended=True)
 
 
 def init_db(app):
+    configure_engines(app)
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        watch_pools()
+        # 只比较 schema 版本号，表结构的变更由 migrations.py 中的迁移完成
+        check_schema(db.engine, app.config.get('SCHEMA_AUTO_MIGRATE', True))
 
 
 def save_excel_data(data_frame):
@@ -97,18 +127,17 @@ def save_gender_data(data_frame):
     db.session.commit()
 
 def read_file_data(file):
-    """读取单个文件的数据"""
-    file.stream.seek(0)  # 重置文件流位置
-    filename = file.filename.lower()
-    
-    if filename.endswith('.csv'):
-        data = pd.read_csv(StringIO(file.stream.read().decode("utf-8")))
-    elif filename.endswith(('.xlsx', '.xls')):
-        data = pd.read_excel(file.stream)
-    else:
-        raise ValueError(f"Unsupported file format: {filename}")
-    
-    return data
+    """读取单个文件的数据（只保留导入会用到的列）"""
+    chunks = list(iter_upload_chunks(file))
+    if not chunks:
+        return pd.DataFrame(columns=LOADER_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+def iter_upload_chunks(file):
+    """按配置的块大小流式读取上传文件，只解析导入会用到的列"""
+    chunk_size = current_app.config.get('INGEST_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    return iter_file_chunks(file, columns=LOADER_COLUMNS, dtype=READ_DTYPES, chunk_size=chunk_size,
+                            sheet_name=current_app.config.get('EXCEL_SHEET_NAME'))
 
 def get_file_year(data):
     """从数据中提取年份"""
@@ -119,209 +148,336 @@ def get_file_year(data):
     year = data['ACADEMIC_YEAR'].mode().iloc[0] if len(data['ACADEMIC_YEAR'].mode()) > 0 else data['ACADEMIC_YEAR'].iloc[0]
     return year
 
+def probe_file_year(file):
+    """只读表头和 ACADEMIC_YEAR 列的前若干行判断文件年份，缺失或无法判断时立即报错"""
+    nrows = current_app.config.get('YEAR_PROBE_ROWS', 1000)
+    sample = read_column_sample(file, 'ACADEMIC_YEAR', nrows, sheet_name=current_app.config.get('EXCEL_SHEET_NAME'))
+    if 'ACADEMIC_YEAR' not in sample.columns:
+        raise ValueError(f"ACADEMIC_YEAR column not found in {file.filename}")
+
+    years = pd.to_numeric(sample['ACADEMIC_YEAR'], errors='coerce').dropna()
+    if years.empty:
+        raise ValueError(f"No ACADEMIC_YEAR value found in {file.filename}")
+
+    modes = years.mode()
+    if len(modes) > 1:
+        raise ValueError(f"Ambiguous ACADEMIC_YEAR in {file.filename}: {sorted(int(y) for y in modes)}")
+    return int(modes.iloc[0])
+
 def sort_files_by_year(files):
-    """根据年份对文件进行排序，返回 (data, filename, year) 的列表，按年份从小到大排序"""
-    file_data_list = []
-    
-    for file in files:
-        data = read_file_data(file)
-        year = get_file_year(data)
-        file_data_list.append((data, file.filename, year))
-    
+    """根据年份对文件进行排序（只探测年份，不做完整解析），返回按年份从小到大排序的 (file, year) 列表"""
+    file_years = [(file, probe_file_year(file)) for file in files]
+
+    years = [year for _, year in file_years]
+    if len(set(years)) < len(years):
+        names = ', '.join(f"{file.filename} ({year})" for file, year in file_years)
+        raise ValueError(f"Cannot order files by year, duplicate ACADEMIC_YEAR: {names}")
+
     # 按年份排序（从小到大）
-    file_data_list.sort(key=lambda x: x[2])
-    return file_data_list
+    file_years.sort(key=lambda x: x[1])
+    return file_years
+
+# 各分析模式的导入计划：每组为 (文件下标, 目标表)
+# 单个文件的组按位置直接对应目标表；多个文件的组按年份从小到大依次对应目标表
+ANALYSIS_MODE_PLANS = {
+    # 默认模式：存储到当前数据表
+    'default': [((0,), ('current',))],
+    # YoY对比模式：年份较小的是previous，较大的是current
+    'yoy_comparison': [((0, 1), ('previous', 'current'))],
+    # Census Day模式：第一个文件存到before census表，第二个存到当前表
+    'census_day': [((0,), ('before_census',)), ((1,), ('current',))],
+    # Census Day + YoY模式：前两个文件年份较小的是previous，较大的是before_census，第三个文件为current
+    'census_yoy': [((0, 1), ('previous', 'before_census')), ((2,), ('current',))],
+}
+
+ANALYSIS_MODE_FLAGS = {
+    'yoy_comparison': 'comparison_ready',
+    'census_day': 'census_analysis_ready',
+    'census_yoy': 'complex_analysis_ready',
+}
+
+def classify_files(analysis_mode, files):
+    """
+    在完整解析之前按导入计划确定每个文件的目标表
 
-def process_analysis_mode(analysis_mode, files):
-    """根据分析模式处理文件"""
-    results = {}
-    
-    if analysis_mode == 'default':
-        # 默认模式：存储到当前数据表
-        data = read_file_data(files[0])
-        
-        print(f"========== Default Mode ==========")
-        print(f"FILE 1 (Current Data) - {files[0].filename}:")
-        print(data.head())
-        print(f"Shape: {data.shape}")
-        print(f"Columns: {list(data.columns)}")
-        print("=" * 50)
-        
-        save_to_table(data, 'current')
-        results['processed_files'] = 1
-        results['tables_updated'] = ['current_data']
-        
-    elif analysis_mode == 'yoy_comparison':
-        # YoY对比模式：根据年份数据自动判断哪个是current，哪个是previous
-        sorted_files = sort_files_by_year(files[:2])  # 只处理前两个文件
-        
-        # 按年份排序后：第一个是previous（年份较小），第二个是current（年份较大）
-        previous_data, previous_filename, previous_year = sorted_files[0]
-        current_data, current_filename, current_year = sorted_files[1]
-        
-        print(f"========== YoY Comparison Mode ==========")
-        print(f"Previous Year Data (Year {previous_year}) - {previous_filename}:")
-        print(previous_data.head())
-        print(f"Shape: {previous_data.shape}")
-        print(f"Columns: {list(previous_data.columns)}")
-        print(f"\nCurrent Year Data (Year {current_year}) - {current_filename}:")
-        print(current_data.head())
-        print(f"Shape: {current_data.shape}")
-        print(f"Columns: {list(current_data.columns)}")
-        print("=" * 50)
-        
-        save_to_table(previous_data, 'previous')
-        save_to_table(current_data, 'current')
-        
-        results['processed_files'] = 2
-        results['tables_updated'] = ['previous_data', 'current_data']
-        results['comparison_ready'] = True
-        
-    elif analysis_mode == 'census_day':
-        # Census Day模式：第一个文件存到before census表，第二个存到当前表
-        before_data = read_file_data(files[0])
-        after_data = read_file_data(files[1])
-        
-        print(f"========== Census Day Mode ==========")
-        print(f"FILE 1 (Before Census Day) - {files[0].filename}:")
-        print(before_data.head())
-        print(f"Shape: {before_data.shape}")
-        print(f"Columns: {list(before_data.columns)}")
-        print(f"\nFILE 2 (After Census Day) - {files[1].filename}:")
-        print(after_data.head())
-        print(f"Shape: {after_data.shape}")
-        print(f"Columns: {list(after_data.columns)}")
-        print("=" * 50)
-        
-        save_to_table(before_data, 'before_census')
-        save_to_table(after_data, 'current')
-        
-        results['processed_files'] = 2
-        results['tables_updated'] = ['before_census_data', 'current_data']
-        results['census_analysis_ready'] = True
-        
-    elif analysis_mode == 'census_yoy':
-        # Census Day + YoY模式：根据年份数据自动判断前两个文件哪个是previous，哪个是before_census，第三个文件为current
-        # 处理前两个文件，按年份排序
-        sorted_first_two = sort_files_by_year(files[:2])
-        
-        # 读取第三个文件（current data）
-        current_data = read_file_data(files[2])
-        
-        # 按年份排序后：第一个是previous（年份较小），第二个是before_census（年份较大）
-        previous_year_data, previous_filename, previous_year = sorted_first_two[0]
-        before_census_data, before_filename, before_year = sorted_first_two[1]
-        
-        print(f"========== Census Day + YoY Mode ==========")
-        print(f"Previous Year Data (Year {previous_year}) - {previous_filename}:")
-        print(previous_year_data.head())
-        print(f"Shape: {previous_year_data.shape}")
-        print(f"Columns: {list(previous_year_data.columns)}")
-        print(f"\nBefore Census Data (Year {before_year}) - {before_filename}:")
-        print(before_census_data.head())
-        print(f"Shape: {before_census_data.shape}")
-        print(f"Columns: {list(before_census_data.columns)}")
-        print(f"\nCurrent Year Data - {files[2].filename}:")
-        print(current_data.head())
-        print(f"Shape: {current_data.shape}")
-        print(f"Columns: {list(current_data.columns)}")
-        print("=" * 50)
-        
-        save_to_table(before_census_data, 'before_census')
-        save_to_table(previous_year_data, 'previous')
-        save_to_table(current_data, 'current')
-        
-        results['processed_files'] = 3
-        results['tables_updated'] = ['before_census_data', 'previous_data', 'current_data']
-        results['complex_analysis_ready'] = True
-    
+    Returns:
+        list: 与 files 一一对应的 (table_type, year)
+    """
+    if analysis_mode not in ANALYSIS_MODE_PLANS:
+        raise ValueError(f"Unknown analysis mode: {analysis_mode}")
+
+    targets = [None] * len(files)
+    for indices, tables in ANALYSIS_MODE_PLANS[analysis_mode]:
+        if len(indices) == 1:
+            # 单个文件位置固定，也探测一次年份以便尽早发现缺列
+            targets[indices[0]] = (tables[0], probe_file_year(files[indices[0]]))
+            continue
+        sorted_files = sort_files_by_year([files[i] for i in indices])
+        for (file, year), table_type in zip(sorted_files, tables):
+            targets[files.index(file)] = (table_type, year)
+    return targets
+
+def fingerprint_files(files, targets):
+    """
+    计算每个文件的内容指纹，并找出目标表当前内容已经就是该文件的那些文件
+
+    Returns:
+        tuple: (与 files 对应的指纹列表, 可以跳过的文件下标集合)
+    """
+    hashes = [file_fingerprint(file) for file in files]
+    unchanged = {
+        index for index, (table_type, _) in enumerate(targets)
+        if fingerprint_matches(SNAPSHOT_MODELS[table_type].__tablename__, hashes[index])
+    }
+    return hashes, unchanged
+
+def _report_progress(progress, stage, rows=0):
+    """把阶段进度交给回调（后台任务用来更新任务表），没有回调时什么也不做"""
+    if progress is not None:
+        progress(stage, rows)
+
+def _tracked_chunks(chunks, progress):
+    """流式导入时每解析出一块就上报 parse 进度"""
+    for chunk in chunks:
+        _report_progress(progress, 'parse', len(chunk))
+        yield chunk
+
+def process_analysis_mode(analysis_mode, files, progress=None, load_mode=None, upload_id=None):
+    """
+    根据分析模式处理文件：先探测年份确定目标表，单文件流式导入，多文件并行解析并在每个文件就绪后立即入库
+
+    progress(stage, rows) 可选，依次上报 validate / parse / load / index 各阶段的进度
+    load_mode 可选，覆盖 LOAD_MODE 配置（例如增量文件用 merge）
+    upload_id 可选，记录在新生成的快照版本上（后台任务的 job_id）
+    """
+    # 只读表头和年份列，批次有问题时在完整解析之前就拒绝
+    _report_progress(progress, 'validate')
+    targets = classify_files(analysis_mode, files)
+    _report_progress(progress, 'validate', len(files))
+
+    # 目标表已经是同一个文件（内容和列定义版本都相同）时跳过解析和导入
+    hashes, unchanged = fingerprint_files(files, targets)
+    pending = [index for index in range(len(files)) if index not in unchanged]
+
+    load_reports = []
+    tables_updated = []
+    skipped_tables = [f"{targets[index][0]}_data" for index in sorted(unchanged)]
+
+    for index, (file, (table_type, year)) in enumerate(zip(files, targets)):
+        current_app.logger.info("%s mode: %s (Year %s) - %s%s", analysis_mode, table_type, year, file.filename,
+                                " [unchanged, skipped]" if index in unchanged else "")
+
+    if len(pending) == 1:
+        index = pending[0]
+        table_type = targets[index][0]
+        chunks = _tracked_chunks(iter_upload_chunks(files[index]), progress)
+        load_reports.append(save_to_table(chunks, table_type, progress=progress,
+                                           content_hash=hashes[index], load_mode=load_mode,
+                                           upload_id=upload_id))
+        tables_updated.append(f"{table_type}_data")
+    elif pending:
+        max_workers = current_app.config.get('PARSE_WORKERS', 1)
+        _report_progress(progress, 'parse')
+        pending_files = [files[index] for index in pending]
+        for position, data in parse_uploads(pending_files, columns=LOADER_COLUMNS, dtype=READ_DTYPES,
+                                            max_workers=max_workers,
+                                            sheet_name=current_app.config.get('EXCEL_SHEET_NAME')):
+            _report_progress(progress, 'parse', len(data))
+            index = pending[position]
+            table_type = targets[index][0]
+            load_reports.append(save_to_table(data, table_type, progress=progress,
+                                               content_hash=hashes[index], load_mode=load_mode,
+                                               upload_id=upload_id))
+            tables_updated.append(f"{table_type}_data")
+
+    return batch_result(analysis_mode, len(files), tables_updated, skipped_tables, load_reports)
+
+def batch_result(analysis_mode, file_count, tables_updated, skipped_tables, load_reports):
+    """组装批量导入的返回结果"""
+    results = {
+        'processed_files': file_count,
+        'tables_updated': tables_updated,
+        'skipped_tables': skipped_tables
+    }
+    if analysis_mode in ANALYSIS_MODE_FLAGS:
+        results[ANALYSIS_MODE_FLAGS[analysis_mode]] = True
+    results['load_report'] = load_reports
     return results
 
-def save_to_table(data, table_type):
-    """将数据保存到指定的表"""
-    from database.models import CurrentData, PreviousData, BeforeCensusData
-    from database.operations import db
-    
-    # 清空目标表并获取目标模型
-    if table_type == 'current':
-        db.session.query(CurrentData).delete()
-        target_model = CurrentData
-        # CurrentData支持所有字段
-        supports_extended_fields = True
-    elif table_type == 'previous':
-        db.session.query(PreviousData).delete()
-        target_model = PreviousData
-        # PreviousData只支持基础字段（2024年格式）
-        supports_extended_fields = False
-    elif table_type == 'before_census':
-        db.session.query(BeforeCensusData).delete()
-        target_model = BeforeCensusData
-        # BeforeCensusData支持所有字段
-        supports_extended_fields = True
+LOAD_MODES = ('auto', 'swap', 'replace', 'merge')
+
+def resolve_load_mode(load_mode, connection):
+    """
+    auto 时 PostgreSQL 用 staging 换表，其它数据库（SQLite 测试库）清空后重写；
+    merge 按整行比较，只删除消失（或内容变化）的行、插入新增的行，两种数据库都支持
+    """
+    if load_mode == 'auto':
+        return 'swap' if connection.dialect.name == 'postgresql' else 'replace'
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode: {load_mode}")
+    if load_mode == 'swap' and connection.dialect.name != 'postgresql':
+        raise ValueError("Staging table swap requires PostgreSQL")
+    return load_mode
+
+def snapshot_index_usage():
+    """快照数据的索引使用情况（PostgreSQL 上按分区统计）"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        tables = [partition_name(snapshot) for snapshot in SNAPSHOT_MODELS]
     else:
+        tables = [EnrollmentFact.__tablename__]
+    return index_usage_report(connection, tables)
+
+def refresh_all_aggregates():
+    """重新计算每种快照（含保留的历史版本）的预聚合结果并提交，返回 {快照键: report}"""
+    try:
+        keys = list(SNAPSHOT_MODELS) + retained_keys()
+        reports = {key: refresh_snapshot_aggregates(key) for key in keys}
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return reports
+
+def save_to_table(data, table_type, method=None, progress=None, content_hash=None, load_mode=None,
+                  upload_id=None):
+    """
+    将数据保存到指定的表，返回行数和吞吐报告
+
+    Args:
+        data: 一个 DataFrame，或按块产出 DataFrame 的可迭代对象（流式导入，边解析边写入）
+        table_type (str): 'current' / 'previous' / 'before_census'
+        method (str): 批量写入方式，默认读取 BULK_LOAD_METHOD 配置
+        progress: 可选的进度回调 progress(stage, rows)
+        content_hash (str): 源文件指纹，与数据一起记录；为 None 时清除目标表的旧指纹
+        load_mode (str): auto / swap / replace / merge，默认读取 LOAD_MODE 配置
+        upload_id (str): 导入任务 id，记录在新生成的快照版本上
+    """
+    # 获取目标视图（PreviousData只支持基础字段，2024年格式），数据写入事实表中对应的快照
+    if table_type not in SNAPSHOT_MODELS:
         raise ValueError(f"Unknown table type: {table_type}")
-    
-    # 获取目标模型的所有列名（除了id）
-    model_columns = [column.name for column in target_model.__table__.columns if column.name != 'id']
-    
-    # 插入新数据
-    records = []
-    for _, row in data.iterrows():
-        # 基础字段映射
-        record_data = {
-            'residency_group_descr': row.get('RESIDENCY_GROUP_DESCR'),
-            'academic_year': row.get('ACADEMIC_YEAR'),
-            'term': row.get('TERM'),
-            'term_descr': row.get('TERM_DESCR'),
-            'academic_career_descr': row.get('ACADEMIC_CAREER_DESCR'),
-            'acad_prog': row.get('ACAD_PROG'),
-            'academic_program_descr': row.get('ACADEMIC_PROGRAM_DESCR'),
-            'course_id': row.get('COURSE_ID'),
-            'offer_number': row.get('OFFER_NUMBER'),
-            'faculty': row.get('FACULTY'),
-            'faculty_descr': row.get('FACULTY_DESCR'),
-            'school': row.get('SCHOOL'),
-            'school_name': row.get('SCHOOL_NAME'),
-            'course_name': row.get('COURSE_NAME'),
-            'course_code': row.get('COURSE_CODE'),
-            'catalog_number': row.get('CATALOG_NUMBER'),
-            'crse_attr': row.get('CRSE_ATTR'),
-            'masked_id': row.get('MASKED_ID')
-        }
-        
-        # 扩展字段映射（仅当目标表支持且数据中存在时）
-        if supports_extended_fields:
-            extended_field_mapping = {
-                'gender': 'GENDER',
-                'first_generation_ind': 'FIRST_GENERATION_IND',
-                'atsi_desc': 'ATSI_DESC',
-                'atsi_group': 'ATSI_GROUP',
-                'regional_remote': 'REGIONAL_REMOTE',
-                'ses': 'SES',
-                'admission_pathway': 'ADMISSION_PATHWAY'
-            }
-            
-            for db_field, excel_field in extended_field_mapping.items():
-                if db_field in model_columns and excel_field in data.columns:
-                    record_data[db_field] = row.get(excel_field)
-        
-        # 只保留目标模型实际支持的字段
-        filtered_record_data = {k: v for k, v in record_data.items() if k in model_columns}
-        
-        record = target_model(**filtered_record_data)
-        records.append(record)
-    
-    db.session.bulk_save_objects(records)
-    db.session.commit()
-    
-    print(f"Saved {len(records)} records to {table_type} table")
-    
-    # 输出调试信息
-    if supports_extended_fields:
-        extended_fields_found = [field for field in ['GENDER', 'FIRST_GENERATION_IND', 'ATSI_DESC', 'ATSI_GROUP', 'REGIONAL_REMOTE', 'SES', 'ADMISSION_PATHWAY'] if field in data.columns]
-        print(f"Extended fields detected in data: {extended_fields_found}")
-    else:
-        print(f"Table {table_type} supports basic fields only (2024 format)")
+    target_model = SNAPSHOT_MODELS[table_type]
+    fact = EnrollmentFact.__table__
+
+    if method is None:
+        method = current_app.config.get('BULK_LOAD_METHOD', 'auto')
+    batch_size = current_app.config.get('BULK_LOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+
+    if load_mode is None:
+        load_mode = current_app.config.get('LOAD_MODE', 'auto')
+    load_mode = resolve_load_mode(load_mode, db.session.connection())
+    table_name = target_model.__tablename__
+    report = {'table': table_name, 'load_mode': load_mode, 'method': None, 'rows': 0, 'chunks': 0, 'seconds': 0.0}
+
+    # swap: 写入 staging 表，建索引、ANALYZE、预聚合都在 staging 表上完成，最后替换该快照的分区；
+    # replace: 清空该快照后写入；merge: 写入临时表后按整行与该快照求差异，只改动增删的行
+    # 都在同一事务内完成，任何一块失败整体回滚，线上数据保持不变
+    # merge 没有改动任何行时沿用线上版本，不重新统计、不导出副本
+    changed = True
+    staging = None
+    try:
+        connection = db.session.connection()
+        # 覆盖之前先把线上版本复制成历史版本（按保留策略，默认不保留，直接丢弃）；merge 求出差异之后再决定
+        if load_mode != 'merge':
+            report['retained_version'] = retain_live_version(connection, table_type)
+        if load_mode == 'swap':
+            target_table = create_staging_table(connection, partition_name(table_type), template=fact.name)
+        elif load_mode == 'merge':
+            target_table = create_incoming_table(connection, fact)
+        else:
+            # 不删索引：分区上的索引挂在事实表的索引下，不能单独删除；SQLite 上的索引覆盖所有快照。
+            # 需要写完再建索引的大批量导入在 PostgreSQL 上用 swap（staging 表写完才建索引）
+            clear_snapshot(connection, table_type)
+            target_table = None
+
+        _report_progress(progress, 'load')
+        next_id = 1
+        for chunk in chunks:
+            # 按共享列定义整列重命名、转换类型并裁掉该快照不支持的字段
+            frame = coerce_frame(chunk, target_model.__table__)
+            # 描述性字符串换成维度表的整数键
+            frame = encode_frame(connection, frame)
+            frame.insert(0, 'snapshot', table_type)
+            frame.insert(1, 'id', range(next_id, next_id + len(frame)))
+            next_id += len(frame)
+            chunk_report = bulk_insert(frame, EnrollmentFact, method=method, batch_size=batch_size,
+                                       table_name=target_table)
+            report['method'] = chunk_report['method']
+            report['rows'] += chunk_report['rows']
+            report['seconds'] += chunk_report['seconds']
+            report['chunks'] += 1
+            _report_progress(progress, 'load', chunk_report['rows'])
+
+        _report_progress(progress, 'index')
+        if load_mode == 'swap':
+            staging = target_table
+            indexed = build_staging_indexes(connection, partition_name(table_type), 'snapshot', table_type)
+            report['index_seconds'] = indexed['index_seconds']
+        else:
+            if load_mode == 'merge':
+                report.update(diff_incoming_table(connection, fact, table_type))
+                changed = report['added'] > 0 or report['removed'] > 0 or live_version(table_type) is None
+                # 保留合并前的版本要复制整份快照，默认不保留（见 SNAPSHOT_HISTORY_ON_MERGE）
+                report['retained_version'] = retain_live_version(
+                    connection, table_type, keep=current_app.config.get('SNAPSHOT_HISTORY_ON_MERGE', False)
+                ) if changed else None
+                report['exact'] = apply_incoming_diff(connection, fact, table_type)
+            if changed:
+                analyze_snapshot(connection, table_type)
+        if changed:
+            # 分析接口读取的预聚合结果与数据在同一事务中提交，读到的统计总是和数据一致
+            report.update(refresh_snapshot_aggregates(table_type, table_name=staging))
+            report['version'] = record_live_version(connection, table_type, load_mode, content_hash, report['rows'],
+                                                    upload_id=upload_id, table_name=staging)
+        else:
+            version = live_version(table_type)
+            version.content_hash = content_hash
+            version.upload_id = upload_id
+            report['version'] = version.id
+        # 合并后快照与文件不一致（不应发生）时不记录指纹，下次上传同一文件仍会重新导入
+        exact = load_mode != 'merge' or report['exact']
+        record_fingerprint(table_name, content_hash if exact else None, report['rows'])
+        # 挂载保留的旧版本、删除超出保留策略的版本和换分区都要锁住整个事实表（锁到提交为止），放在提交之前最后执行
+        db.session.flush()
+        report['evicted_versions'] = evict_versions(connection)
+        attach_retained_version(connection, report.get('retained_version'), report['evicted_versions'])
+        if load_mode == 'swap':
+            report.update(swap_staging_partition(connection, fact.name, partition_name(table_type),
+                                                 'snapshot', table_type, indexed['renames']))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    report['seconds'] = round(report['seconds'], 3)
+    report['rows_per_second'] = round(report['rows'] / report['seconds']) if report['seconds'] > 0 else None
+
+    current_app.logger.info("Saved %s records to %s table (%s) in %s chunk(s) via %s in %ss (%s rows/s)",
+                            report['rows'], table_type, load_mode, report['chunks'], report['method'],
+                            report['seconds'], report['rows_per_second'])
+    if load_mode == 'merge':
+        current_app.logger.info("Merged %s table: %s added, %s removed, %s unchanged",
+                                table_type, report['added'], report['removed'], report['unchanged'])
+
+    if not changed:
+        return report
+
+    # 数据库是唯一的数据来源：提交后再导出分析后端的副本（Parquet 或列式快照），导出失败不影响这次导入，查询会回退到数据库
+    try:
+        report['analytics_store'] = sync_analytics_store()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Failed to export %s to the analytics store: %s", table_type, e)
+    # 学生位图索引同样在提交后建立，失败时分析接口回退到预聚合结果或实时查询
+    try:
+        report.update(refresh_student_index(table_type, AGGREGATE_CUBES))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Failed to build the student index for %s: %s", table_type, e)
+
+    return report
 
 
 def participation_gender_data():
@@ -331,7 +487,7 @@ def participation_gender_data():
         db.func.count().label('record_count')
     ).group_by(ExtraData.gender).all()
 
-    # 1. 获取每个 faculty_descr 和 gender 的数量
+    # 每个 faculty_descr 和 gender 的数量，按 faculty 展开成 gender_counts，合计为各 gender 相加
     gender_counts = db.session.query(
         ExtraData.faculty_descr,
         ExtraData.gender,
@@ -341,42 +497,10 @@ def participation_gender_data():
         ExtraData.gender
     ).all()
 
-    # 2. 获取每个 faculty_descr 的总人数
-    faculty_totals = db.session.query(
-        ExtraData.faculty_descr,
-        db.func.count(ExtraData.id).label("total_count")
-    ).group_by(ExtraData.faculty_descr).all()
-
-    # 3. 将数据组织成字典格式
-    faculty_dict = {}
-
-    # 填充每个 faculty_descr 下的 gender counts
-    for faculty_descr, gender, count in gender_counts:
-        if faculty_descr not in faculty_dict:
-            faculty_dict[faculty_descr] = {"gender_counts": {}, "total_count": 0}
-        faculty_dict[faculty_descr]["gender_counts"][gender] = count
-
-    # 填充每个 faculty_descr 的 total_count
-    for faculty_descr, total_count in faculty_totals:
-        if faculty_descr in faculty_dict:
-            faculty_dict[faculty_descr]["total_count"] = total_count
-
-    # 4. 根据总人数排序，倒序排列
-    sorted_faculty_list = sorted(
-        faculty_dict.items(),
-        key=lambda item: item[1]["total_count"],
-        reverse=True
-    )
-
     return {"participation by gender": [{"gender": r.gender, "count": r.record_count} for r in result_gender],
-            "gender proportion in WIL":[
-                                            {
-                                                "faculty_descr": faculty_descr,
-                                                "gender_counts": data["gender_counts"],
-                                                "total_count": data["total_count"]
-                                            }
-                                            for faculty_descr, data in sorted_faculty_list
-                                        ]
+            "gender proportion in WIL": pivot_rows(gender_counts, ('faculty_descr', 'gender'), ('count',),
+                                                   pivot='gender', into='gender_counts', total_key='total_count',
+                                                   sort='-total_count')
             }
 
 
@@ -489,26 +613,10 @@ def equity_cohort_data():
         ExtraData.first_generation_ind
     ).all()
 
-    # 构建数据结构 {faculty_descr: {first_generation_ind: count, ..., total: count}}
-    faculty_map = {}
-
-    for faculty_descr, first_gen_ind, count in results:
-        if faculty_descr not in faculty_map:
-            faculty_map[faculty_descr] = {"total": 0}
-        faculty_map[faculty_descr][first_gen_ind] = count
-        faculty_map[faculty_descr]["total"] += count
-
-    # 转为列表结构，准备排序
-    result_first_generation = []
-    for faculty_descr, values in faculty_map.items():
-        row = {"faculty_descr": faculty_descr}
-        row.update(values)
-        result_first_generation.append(row)
-
-    # 按总人数降序排序
-    result_first_generation.sort(key=lambda x: x["total"], reverse=True)
+    # 每个 faculty 一行 {faculty_descr, <first_generation_ind>: count, ..., total}，按总人数降序排序
     return {
-            "first generation": result_first_generation,
+            "first generation": pivot_rows(results, ('faculty_descr', 'first_generation_ind'), ('count',),
+                                           pivot='first_generation_ind', sort='-total'),
             "ses": ses_data(),
             "atsi group": atsi_group_data(),
             "regional remote": regional_remote_data()
@@ -524,25 +632,8 @@ def ses_data():
         ExtraData.ses
     ).all()
 
-    # 构建 faculty -> ses 分布映射
-    faculty_map = {}
-
-    for faculty_descr, ses_value, count in results:
-        if faculty_descr not in faculty_map:
-            faculty_map[faculty_descr] = {"total": 0}
-        faculty_map[faculty_descr][ses_value] = count
-        faculty_map[faculty_descr]["total"] += count
-
-    # 构建输出结果列表
-    output = []
-    for faculty_descr, values in faculty_map.items():
-        row = {"faculty_descr": faculty_descr}
-        row.update(values)
-        output.append(row)
-
-    # 按 total 倒序排序
-    output.sort(key=lambda x: x["total"], reverse=True)
-    return output
+    # faculty -> ses 分布，按 total 倒序排序
+    return pivot_rows(results, ('faculty_descr', 'ses'), ('count',), pivot='ses', sort='-total')
 
 def atsi_group_data():
     results = db.session.query(
@@ -554,25 +645,8 @@ def atsi_group_data():
         ExtraData.atsi_group
     ).all()
 
-    # 构建 faculty -> atsi_group 分布映射
-    faculty_map = {}
-
-    for faculty_descr, atsi_group_value, count in results:
-        if faculty_descr not in faculty_map:
-            faculty_map[faculty_descr] = {"total": 0}
-        faculty_map[faculty_descr][atsi_group_value] = count
-        faculty_map[faculty_descr]["total"] += count
-
-    # 构建输出结果列表
-    output = []
-    for faculty_descr, values in faculty_map.items():
-        row = {"faculty_descr": faculty_descr}
-        row.update(values)
-        output.append(row)
-
-    # 按 total 倒序排序
-    output.sort(key=lambda x: x["total"], reverse=True)
-    return output
+    # faculty -> atsi_group 分布，按 total 倒序排序
+    return pivot_rows(results, ('faculty_descr', 'atsi_group'), ('count',), pivot='atsi_group', sort='-total')
 
 def regional_remote_data():
     result_regional_remote = db.session.query(
@@ -598,29 +672,12 @@ def cdev_data():
         ExtraData.residency_group_descr
     ).all()
 
-    # 构建 course_code -> residency 分布映射
-    course_map = {}
-
-    for course_code, course_name, residency_descr, count in results:
-        if course_code not in course_map:
-            course_map[course_code] = {
-                "course_code": course_code,
-                "course_name": course_name,
-                "total": 0,
-                "residency_breakdown": []
-            }
-        course_map[course_code]["residency_breakdown"].append({
-            "residency_group_descr": residency_descr,
-            "count": count
-        })
-        course_map[course_code]["total"] += count
-
-    # 转成列表并排序
-    course_output = list(course_map.values())
-    course_output.sort(key=lambda x: x["total"], reverse=True)
-
+    # course_code -> residency 分布，按 total 倒序排序
     return {
-        "CDEV by Residency and Course": course_output,
+        "CDEV by Residency and Course": pivot_rows(
+            results, ('course_code', 'course_name', 'residency_group_descr'), ('count',),
+            breakdown='residency_group_descr', into='residency_breakdown', sort='-total'
+        ),
         "CDEV by Gender": cdev_gender_data()
     }
 
@@ -637,113 +694,24 @@ def cdev_gender_data():
         ExtraData.gender
     ).all()
 
-    # 构建 course_code -> gender 分布映射
-    course_map = {}
-
-    for course_code, gender, count in results:
-        if course_code not in course_map:
-            course_map[course_code] = {
-                "course_code": course_code,
-                "total": 0,
-                "gender_breakdown": []
-            }
-        course_map[course_code]["gender_breakdown"].append({
-            "gender": gender,
-            "count": count
-        })
-        course_map[course_code]["total"] += count
-
-    # 转成列表并按 total 降序排序
-    output = list(course_map.values())
-    output.sort(key=lambda x: x["total"], reverse=True)
-
-    return output
+    # course_code -> gender 分布，按 total 降序排序
+    return pivot_rows(results, ('course_code', 'gender'), ('count',), breakdown='gender', into='gender_breakdown',
+                      sort='-total')
 
 
 # 仿写上面逻辑，用ryan设计三张表来实现
-def current_participation_gender_data():
+def current_participation_gender_data(versions=None):
     """使用当前数据表进行性别参与度分析"""
-    # 示例聚合：按gender分组求count（按masked_id去重统计人数）
-    result_gender = db.session.query(
-        CurrentData.gender,
-        db.func.count(db.func.distinct(CurrentData.masked_id)).label('record_count')
-    ).filter(CurrentData.gender.isnot(None)).group_by(CurrentData.gender).all()
-
-    # 1. 获取每个 faculty_descr 和 gender 的人数（按masked_id去重）
-    gender_counts = db.session.query(
-        CurrentData.faculty_descr,
-        CurrentData.gender,
-        db.func.count(db.func.distinct(CurrentData.masked_id)).label("count")
-    ).filter(CurrentData.gender.isnot(None)).group_by(
-        CurrentData.faculty_descr,
-        CurrentData.gender
-    ).all()
-
-    # 2. 获取每个 faculty_descr 的总人数（按masked_id去重）
-    faculty_totals = db.session.query(
-        CurrentData.faculty_descr,
-        db.func.count(db.func.distinct(CurrentData.masked_id)).label("total_count")
-    ).filter(CurrentData.gender.isnot(None)).group_by(CurrentData.faculty_descr).all()
-
-    # 3. 将数据组织成字典格式
-    faculty_dict = {}
-
-    # 填充每个 faculty_descr 下的 gender counts
-    for faculty_descr, gender, count in gender_counts:
-        if faculty_descr not in faculty_dict:
-            faculty_dict[faculty_descr] = {"gender_counts": {}, "total_count": 0}
-        faculty_dict[faculty_descr]["gender_counts"][gender] = count
-
-    # 填充每个 faculty_descr 的 total_count
-    for faculty_descr, total_count in faculty_totals:
-        if faculty_descr in faculty_dict:
-            faculty_dict[faculty_descr]["total_count"] = total_count
-
-    # 4. 根据总人数排序，倒序排列
-    sorted_faculty_list = sorted(
-        faculty_dict.items(),
-        key=lambda item: item[1]["total_count"],
-        reverse=True
-    )
+    return chart_data(('gender_participation',), versions)['gender_participation']
 
-    return {"participation by gender": [{"gender": r.gender, "count": r.record_count} for r in result_gender],
-            "gender proportion in WIL": [
-                {
-                    "faculty_descr": faculty_descr,
-                    "gender_counts": data["gender_counts"],
-                    "total_count": data["total_count"]
-                }
-                for faculty_descr, data in sorted_faculty_list
-            ]}
-
-def yoy_comparison_faculty_data():
+def yoy_comparison_faculty_data(versions=None):
     """年度对比分析 - 使用历史表和当前表，包含residency breakdown"""
-    # 查询历史数据（按masked_id去重统计人数，包含residency信息）
-    previous_results = db.session.query(
-        PreviousData.faculty_descr,
-        PreviousData.residency_group_descr,
-        PreviousData.academic_year,
-        db.func.count(db.func.distinct(PreviousData.masked_id))
-    ).group_by(
-        PreviousData.faculty_descr, 
-        PreviousData.residency_group_descr,
-        PreviousData.academic_year
-    ).all()
-
-    # 查询当前数据（按masked_id去重统计人数，包含residency信息）
-    current_results = db.session.query(
-        CurrentData.faculty_descr,
-        CurrentData.residency_group_descr,
-        CurrentData.academic_year,
-        db.func.count(db.func.distinct(CurrentData.masked_id))
-    ).group_by(
-        CurrentData.faculty_descr,
-        CurrentData.residency_group_descr, 
-        CurrentData.academic_year
-    ).all()
-
-    # 合并结果
-    combined = previous_results + current_results
+    # 历史和当前两个快照各自按masked_id去重统计人数（包含residency信息）后相加
+    combined = [
+        (faculty_descr, residency_descr, year, previous_count + current_count)
+        for faculty_descr, residency_descr, year, previous_count, current_count
+        in snapshot_counts('faculty_residency_year', ('previous', 'current'), versions=versions)
+    ]
 
     faculty_map = {}
 
@@ -793,42 +761,22 @@ def yoy_comparison_faculty_data():
 
     return final_output
 
-def census_comparison_data():
-    """Census Day对比分析 - 使用before census表和当前表"""
-    # 查询before census数据（按masked_id去重统计人数）
-    before_results = db.session.query(
-        BeforeCensusData.faculty_descr,
-        db.func.count(db.func.distinct(BeforeCensusData.masked_id)).label('before_count')
-    ).group_by(BeforeCensusData.faculty_descr).all()
-
-    # 查询after census（当前）数据（按masked_id去重统计人数）
-    after_results = db.session.query(
-        CurrentData.faculty_descr,
-        db.func.count(db.func.distinct(CurrentData.masked_id)).label('after_count')
-    ).group_by(CurrentData.faculty_descr).all()
-
-    # 合并数据
+def census_comparison_data(versions=None):
+    """Census Day对比分析 - 对比before census和当前两个快照"""
+    # before census和after census（当前）两个快照的人数（按masked_id去重统计）
+    results = snapshot_counts('faculty', ('before_census', 'current'), versions=versions)
+
+    # 整理数据
     faculty_comparison = {}
-    
-    for faculty_descr, before_count in before_results:
+
+    for faculty_descr, before_count, after_count in results:
         faculty_comparison[faculty_descr] = {
             'faculty_descr': faculty_descr,
             'before_census': before_count,
-            'after_census': 0,
+            'after_census': after_count,
             'difference': 0
         }
     
-    for faculty_descr, after_count in after_results:
-        if faculty_descr not in faculty_comparison:
-            faculty_comparison[faculty_descr] = {
-                'faculty_descr': faculty_descr,
-                'before_census': 0,
-                'after_census': after_count,
-                'difference': 0
-            }
-        else:
-            faculty_comparison[faculty_descr]['after_census'] = after_count
-    
     # 计算差异
     for faculty_data in faculty_comparison.values():
         faculty_data['difference'] = faculty_data['after_census'] - faculty_data['before_census']
@@ -843,63 +791,23 @@ def census_comparison_data():
     return result
 
 
-def census_gender_drop_by_term_and_faculty(selected_term):
+def census_gender_drop_by_term_and_faculty(selected_term, versions=None):
     """
     根据选择的term分析census前后按faculty和gender分组的drop人数
     
     Args:
-        selected_term (str): 前端选择的term，格式如 'term1', 'term2', 'term3'
+        selected_term (str): 前端选择的term（去掉年份的学期名），如 'Term 1'、'Summer Term'
+        versions (dict): 可选，{快照类型: 数据键}，查询保留的历史版本
     
     Returns:
         list: 按faculty和gender分组的drop分析数据
     """
 
-    db_term_format = selected_term
-    if not db_term_format:
+    if not selected_term:
         return []
-    
-    # 查询before census数据（按faculty、gender和term过滤，按masked_id去重统计）
-    before_results = db.session.query(
-        BeforeCensusData.faculty_descr,
-        BeforeCensusData.gender,
-        db.func.count(db.func.distinct(BeforeCensusData.masked_id)).label('before_count')
-    ).filter(
-        BeforeCensusData.term_descr.like(f'%{db_term_format}%')
-    ).group_by(
-        BeforeCensusData.faculty_descr,
-        BeforeCensusData.gender
-    ).all()
 
-    # 查询after census数据（按faculty、gender和term过滤，按masked_id去重统计）
-    after_results = db.session.query(
-        CurrentData.faculty_descr,
-        CurrentData.gender,
-        db.func.count(db.func.distinct(CurrentData.masked_id)).label('after_count')
-    ).filter(
-        CurrentData.term_descr.like(f'%{db_term_format}%')
-    ).group_by(
-        CurrentData.faculty_descr,
-        CurrentData.gender
-    ).all()
-
-    # 构建数据结构 {faculty: {gender: {before: 0, after: 0}}}
-    faculty_gender_data = {}
-    
-    # 处理before census数据
-    for faculty_descr, gender, before_count in before_results:
-        if faculty_descr not in faculty_gender_data:
-            faculty_gender_data[faculty_descr] = {}
-        if gender not in faculty_gender_data[faculty_descr]:
-            faculty_gender_data[faculty_descr][gender] = {'before_census': 0, 'after_census': 0}
-        faculty_gender_data[faculty_descr][gender]['before_census'] = before_count
-
-    # 处理after census数据
-    for faculty_descr, gender, after_count in after_results:
-        if faculty_descr not in faculty_gender_data:
-            faculty_gender_data[faculty_descr] = {}
-        if gender not in faculty_gender_data[faculty_descr]:
-            faculty_gender_data[faculty_descr][gender] = {'before_census': 0, 'after_census': 0}
-        faculty_gender_data[faculty_descr][gender]['after_census'] = after_count
+    # 所有学期的before census和after census人数一次算好并缓存，这里只取选择的学期（按学期名精确匹配）
+    faculty_gender_data = census_drops(versions).get(selected_term, {})
 
     # 构建最终结果
     result = []
@@ -913,9 +821,7 @@ def census_gender_drop_by_term_and_faculty(selected_term):
         total_before = 0
         total_after = 0
         
-        for gender, counts in gender_data.items():
-            before_count = counts['before_census']
-            after_count = counts['after_census'] 
+        for gender, (before_count, after_count) in gender_data.items():
             drop_count = before_count - after_count
             drop_rate = (drop_count / before_count * 100) if before_count > 0 else 0
             
@@ -947,201 +853,65 @@ def census_gender_drop_by_term_and_faculty(selected_term):
     return result
 
 
-# 更新现有的分析函数，让它们使用当前数据表
-def current_equity_cohort_data():
+# 更新现有的分析函数，让它们使用当前数据表（图表的取数和整理见 pivot.py 中的预设）
+def current_equity_cohort_data(versions=None):
     """使用当前数据表进行公平性队列分析"""
-    # 查询当前数据表中的聚合结果（按masked_id去重统计人数）
-    results = db.session.query(
-        CurrentData.faculty_descr,
-        CurrentData.first_generation_ind,
-        db.func.count(db.func.distinct(CurrentData.masked_id))
-    ).filter(CurrentData.first_generation_ind.isnot(None)).group_by(
-        CurrentData.faculty_descr,
-        CurrentData.first_generation_ind
-    ).all()
-
-    # 构建数据结构 {faculty_descr: {first_generation_ind: count, ..., total: count}}
-    faculty_map = {}
-
-    for faculty_descr, first_gen_ind, count in results:
-        if faculty_descr not in faculty_map:
-            faculty_map[faculty_descr] = {"total": 0}
-        faculty_map[faculty_descr][first_gen_ind] = count
-        faculty_map[faculty_descr]["total"] += count
-
-    # 转为列表结构，准备排序
-    result_first_generation = []
-    for faculty_descr, values in faculty_map.items():
-        row = {"faculty_descr": faculty_descr}
-        row.update(values)
-        result_first_generation.append(row)
-
-    # 按总人数降序排序
-    result_first_generation.sort(key=lambda x: x["total"], reverse=True)
-    
-    return {
-        "first generation": result_first_generation,
-        "ses": current_ses_data(),
-        "atsi group": current_atsi_group_data(),
-        "regional remote": current_regional_remote_data()
-    }
+    return chart_data(('wil_participation',), versions)['wil_participation']
 
-def current_ses_data():
+def current_ses_data(versions=None):
     """当前数据表的SES分析"""
-    results = db.session.query(
-        CurrentData.faculty_descr,
-        CurrentData.ses,
-        db.func.count(db.func.distinct(CurrentData.masked_id))
-    ).filter(CurrentData.ses.isnot(None)).group_by(
-        CurrentData.faculty_descr,
-        CurrentData.ses
-    ).all()
-
-    # 构建 faculty -> ses 分布映射
-    faculty_map = {}
-
-    for faculty_descr, ses_value, count in results:
-        if faculty_descr not in faculty_map:
-            faculty_map[faculty_descr] = {"total": 0}
-        faculty_map[faculty_descr][ses_value] = count
-        faculty_map[faculty_descr]["total"] += count
-
-    # 构建输出结果列表
-    output = []
-    for faculty_descr, values in faculty_map.items():
-        row = {"faculty_descr": faculty_descr}
-        row.update(values)
-        output.append(row)
-
-    # 按 total 倒序排序
-    output.sort(key=lambda x: x["total"], reverse=True)
-    return output
+    return run_presets(('faculty_ses',), versions)['faculty_ses']
 
-def current_atsi_group_data():
+def current_atsi_group_data(versions=None):
     """当前数据表的ATSI分析"""
-    results = db.session.query(
-        CurrentData.faculty_descr,
-        CurrentData.atsi_group,
-        db.func.count(db.func.distinct(CurrentData.masked_id))
-    ).filter(CurrentData.atsi_group.isnot(None)).group_by(
-        CurrentData.faculty_descr,
-        CurrentData.atsi_group
-    ).all()
+    return run_presets(('faculty_atsi_group',), versions)['faculty_atsi_group']
 
-    # 构建 faculty -> atsi_group 分布映射
-    faculty_map = {}
-
-    for faculty_descr, atsi_group_value, count in results:
-        if faculty_descr not in faculty_map:
-            faculty_map[faculty_descr] = {"total": 0}
-        faculty_map[faculty_descr][atsi_group_value] = count
-        faculty_map[faculty_descr]["total"] += count
-
-    # 构建输出结果列表
-    output = []
-    for faculty_descr, values in faculty_map.items():
-        row = {"faculty_descr": faculty_descr}
-        row.update(values)
-        output.append(row)
-
-    # 按 total 倒序排序
-    output.sort(key=lambda x: x["total"], reverse=True)
-    return output
-
-def current_regional_remote_data():
+def current_regional_remote_data(versions=None):
     """当前数据表的地区分析"""
-    result_regional_remote = db.session.query(
-        CurrentData.regional_remote,
-        db.func.count(db.func.distinct(CurrentData.masked_id)).label('record_count')
-    ).filter(CurrentData.regional_remote.isnot(None)).group_by(CurrentData.regional_remote).all()
+    return run_presets(('regional_remote',), versions)['regional_remote']
 
-    output = [{"regional_remote": r.regional_remote, "count": r.record_count} for r in result_regional_remote]
-    return output
-
-def current_cdev_data():
+def current_cdev_data(versions=None):
     """使用当前数据表进行CDEV分析"""
-    # 查询以 CDEV 开头的课程（按masked_id去重统计人数）
-    results = db.session.query(
-        CurrentData.course_code,
-        CurrentData.course_name,
-        CurrentData.residency_group_descr,
-        db.func.count(db.func.distinct(CurrentData.masked_id))
-    ).filter(
-        CurrentData.course_code.startswith("CDEV")
-    ).group_by(
-        CurrentData.course_code,
-        CurrentData.course_name,
-        CurrentData.residency_group_descr
-    ).all()
-
-    # 构建 course_code -> residency 分布映射
-    course_map = {}
-
-    for course_code, course_name, residency_descr, count in results:
-        if course_code not in course_map:
-            course_map[course_code] = {
-                "course_code": course_code,
-                "course_name": course_name,
-                "total": 0,
-                "residency_breakdown": []
-            }
-        course_map[course_code]["residency_breakdown"].append({
-            "residency_group_descr": residency_descr,
-            "count": count
-        })
-        course_map[course_code]["total"] += count
+    return chart_data(('cdev_enrolments',), versions)['cdev_enrolments']
 
-    # 转成列表并排序
-    course_output = list(course_map.values())
-    course_output.sort(key=lambda x: x["total"], reverse=True)
-
-    return {
-        "CDEV by Residency and Course": course_output,
-        "CDEV by Gender": current_cdev_gender_data()
-    }
-
-def current_cdev_gender_data():
-    # 查询以 CDEV 开头的课程，按 course_code 和 gender 分类
+def current_cdev_gender_data(versions=None):
+    """以 CDEV 开头的课程，按 course_code 和 gender 分类"""
     try:
-        print("Starting current_cdev_gender_data function")
-        
-        # 查询以 CDEV 开头的课程，按 course_code 和 gender 分组统计
-        query = db.session.query(
-            CurrentData.course_code,
-            CurrentData.gender,
-            db.func.count(CurrentData.masked_id).label('count')
-        ).filter(
-            CurrentData.course_code.like('CDEV%'),
-            CurrentData.gender.isnot(None)
-        ).group_by(
-            CurrentData.course_code,
-            CurrentData.gender
-        ).all()
-        
-        print(f"Query results: {query}")
-        
-        # 构建 course_code -> gender 分布映射
-        course_map = {}
-        
-        for course_code, gender, count in query:
-            if course_code not in course_map:
-                course_map[course_code] = {
-                    "course_code": course_code,
-                    "total": 0,
-                    "gender_breakdown": []
-                }
-            course_map[course_code]["gender_breakdown"].append({
-                "gender": gender,
-                "count": count
-            })
-            course_map[course_code]["total"] += count
-        
-        # 转换为列表并按 total 降序排序
-        result = list(course_map.values())
-        result.sort(key=lambda x: x["total"], reverse=True)
-        
-        print(f"Final result: {result}")
-        return result
+        return run_presets(('cdev_gender',), versions)['cdev_gender']
     except Exception as e:
         print(f"Error in current_cdev_gender_data: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+# 报告中基于当前数据表的图表：(用到的预设, 预设结果 -> 接口返回的结构)，均按masked_id去重统计人数（CDEV按gender为行数）
+CHART_PRESETS = {
+    'gender_participation': (
+        ('gender', 'faculty_gender'),
+        lambda results: {"participation by gender": results['gender'],
+                         "gender proportion in WIL": results['faculty_gender']}
+    ),
+    'wil_participation': (
+        ('faculty_first_gen', 'faculty_ses', 'faculty_atsi_group', 'regional_remote'),
+        lambda results: {"first generation": results['faculty_first_gen'],
+                         "ses": results['faculty_ses'],
+                         "atsi group": results['faculty_atsi_group'],
+                         "regional remote": results['regional_remote']}
+    ),
+    'cdev_enrolments': (
+        ('cdev', 'cdev_gender'),
+        lambda results: {"CDEV by Residency and Course": results['cdev'],
+                         "CDEV by Gender": results['cdev_gender']}
+    ),
+}
+
+
+def chart_data(charts, versions=None):
+    """
+    多个图表一起取数：所有图表用到的预设合在一起执行（需要实时统计时在数据库上一次扫描完成）
+
+    Returns:
+        dict: {图表: 接口返回的结构}
+    """
+    presets = list(dict.fromkeys(preset for chart in charts for preset in CHART_PRESETS[chart][0]))
+    results = run_presets(presets, versions)
+    return {chart: CHART_PRESETS[chart][1](results) for chart in charts}
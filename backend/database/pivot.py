@@ -0,0 +1,308 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .schema import ENROLMENT_SCHEMA, ENCODED_COLUMNS, storage_name
+from .dimensions import dimension_labels, labels_like
+from .aggregates import cube_spec, spec_counts_many
+from .engines import read_session
+from .snapshots import SNAPSHOT_VIEWS
+
+# 通用分组统计：分析图表的取数由一个声明式的查询描述，不再为每个图表手写 group by 和 faculty_map 循环
+#   dims      分组列（事实表字段名，见 DIMENSIONS）
+#   measure   students 按 masked_id 去重统计人数，rows 统计行数
+#   filters   {列: 条件}，条件为 值（含 % 时为 LIKE）、值列表（IN）、None（IS NULL）或 NOT_NULL
+#   snapshots 快照，多个快照时每个快照一个计数列（列名为快照名），一个快照时计数列为 count
+#   pivot     把这一列的取值展开成字段 {取值: 人数}（放在 into 字段下，into 为空时直接放在每行中）
+#   breakdown 把这一列的取值展开成列表 [{列: 取值, count: 人数}]（放在 into 字段下，默认 <列>_breakdown）
+#   total     展开后每行的合计：sum 为展开值相加，distinct 为按其余分组列去重统计的人数（另一个分组统计）
+#   total_key 合计的字段名
+#   sort      排序字段，- 开头为降序；为空时按分组标签排序
+AggregateQuery = namedtuple('AggregateQuery', [
+    'dims', 'measure', 'filters', 'snapshots', 'pivot', 'breakdown', 'into', 'total', 'total_key', 'sort'
+])
+
+# 可以分组和过滤的列（masked_id 只用于去重统计）
+DIMENSIONS = {spec.target: spec for spec in ENROLMENT_SCHEMA if spec.target != 'masked_id'}
+MEASURES = {'students': True, 'rows': False}
+TOTALS = ('sum', 'distinct')
+NOT_NULL = {'not': None}
+
+
+def aggregate_query(dims, measure='students', filters=None, snapshots=('current',), pivot=None, breakdown=None,
+                    into=None, total='sum', total_key='total', sort=None):
+    """检查参数并构造 AggregateQuery；参数无效时抛出 ValueError"""
+    dims = tuple(dims)
+    filters = dict(filters or {})
+    snapshots = tuple(snapshots)
+    for column in (*dims, *filters):
+        if column not in DIMENSIONS:
+            raise ValueError(f"Unknown column '{column}'. Valid columns are: {', '.join(DIMENSIONS)}")
+    if len(set(dims)) != len(dims):
+        raise ValueError("Each column can only appear once in dims")
+    if measure not in MEASURES:
+        raise ValueError(f"Invalid measure '{measure}'. Valid measures are: {', '.join(MEASURES)}")
+    for snapshot in snapshots:
+        if snapshot not in SNAPSHOT_VIEWS:
+            raise ValueError(f"Invalid snapshot '{snapshot}'. Valid snapshots are: {', '.join(SNAPSHOT_VIEWS)}")
+    if not snapshots:
+        raise ValueError("At least one snapshot is required")
+    if pivot and breakdown:
+        raise ValueError("Only one of pivot and breakdown can be used")
+    nested = pivot or breakdown
+    if nested and nested not in dims:
+        raise ValueError(f"'{nested}' must be one of the dims")
+    if total not in TOTALS:
+        raise ValueError(f"Invalid total '{total}'. Valid totals are: {', '.join(TOTALS)}")
+    return AggregateQuery(dims, measure, filters, snapshots, pivot, breakdown, into, total, total_key, sort)
+
+
+def _literal(column, value):
+    """条件中的常量：整数列只接受整数，字符串不能包含引号、冒号和反斜杠（条件以文本形式传给各分析后端）"""
+    if DIMENSIONS[column].dtype == 'int':
+        try:
+            return str(int(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"'{column}' filter values must be integers")
+    value = str(value)
+    if any(char in value for char in "':\\"):
+        raise ValueError(f"'{column}' filter values cannot contain quotes, colons or backslashes")
+    return f"'{value}'"
+
+
+def _label_ids(column, values):
+    """维度列按标签过滤时先在维度表上把标签换成维度键（LIKE 模式在数据库中匹配）"""
+    ids = set()
+    for value in values:
+        if '%' in str(value):
+            ids.update(read_session().execute(labels_like(column, str(value))).scalars().all())
+        else:
+            ids.update(key for key, label in dimension_labels(column).items() if label == str(value))
+    return sorted(ids)
+
+
+def compile_filters(dims, filters):
+    """
+    把过滤条件编译成事实表上的 SQL 条件和标签过滤
+
+    字典编码的列：不参与分组时，单个值作为标签过滤（与预聚合结果的过滤方式相同，可以直接用预聚合结果）；
+    其它情况先换成维度键，条件为 <列>_id IN (...)。条件按列名排序，定义相同的查询得到相同的条件文本
+
+    Returns:
+        tuple: (SQL 条件（没有条件时为 None）, {列: LIKE 模式})
+    """
+    conditions, label_filters = [], {}
+    for column in sorted(filters):
+        value = filters[column]
+        field = storage_name(column)
+        if value is None:
+            conditions.append(f"{field} IS NULL")
+        elif value == NOT_NULL:
+            conditions.append(f"{field} IS NOT NULL")
+        elif column in ENCODED_COLUMNS:
+            values = value if isinstance(value, (list, tuple)) else [value]
+            if len(values) == 1 and column not in dims and '_' not in str(values[0]):
+                label_filters[column] = str(values[0])
+            else:
+                ids = _label_ids(column, values)
+                conditions.append(f"{field} IN ({', '.join(map(str, ids))})" if ids else "1 = 0")
+        elif isinstance(value, (list, tuple)):
+            if not value:
+                conditions.append("1 = 0")
+            else:
+                conditions.append(f"{field} IN ({', '.join(_literal(column, item) for item in value)})")
+        elif '%' in str(value) and DIMENSIONS[column].dtype != 'int':
+            conditions.append(f"{field} LIKE {_literal(column, value)}")
+        else:
+            conditions.append(f"{field} = {_literal(column, value)}")
+    return (' AND '.join(conditions) or None), label_filters
+
+
+def _reordered(spec, label_filters, dims, rows):
+    """预聚合统计的分组列顺序与查询不同时，把结果换成查询的列顺序"""
+    columns = [column for column in spec.columns if column not in label_filters]
+    if columns == list(dims):
+        return rows
+    positions = [columns.index(column) for column in dims]
+    reordered = [tuple(row[position] for position in positions) + tuple(row[len(columns):]) for row in rows]
+    return sorted(reordered, key=lambda row: tuple((value is None, value) for value in row[:len(dims)]))
+
+
+def _group_numbers(frame, columns):
+    """每行的分组编号（按第一次出现的顺序，空值也是一个分组）"""
+    if not columns:
+        return np.zeros(len(frame), dtype=np.int64)
+    return frame.groupby(list(columns), sort=False, dropna=False).ngroup().to_numpy(dtype=np.int64)
+
+
+def pivot_rows(rows, dims, measures, pivot=None, breakdown=None, into=None, totals=None, total_key='total',
+               sort=None):
+    """
+    把分组统计结果 [(分组值..., 计数...)] 整理成接口输出的每行一个字典
+
+    分组键相同的行先合并（多个来源的结果拼在一起时），计数的合并、合计都在 NumPy 上按分组编号完成
+
+    Args:
+        rows (list): [(dims 的值..., measures 的计数...)]
+        dims (tuple): 分组列
+        measures (tuple): 计数列名
+        pivot (str): 展开成字段的列
+        breakdown (str): 展开成列表的列
+        into (str): 展开结果放在哪个字段下
+        totals (dict): {其余分组列的值: 合计}，为空时合计为展开值相加
+        total_key (str): 合计的字段名
+        sort (str): 排序字段，- 开头为降序
+
+    Returns:
+        list: [{分组列: 值, ..., 计数或展开结果, 合计}]
+    """
+    dims, measures = list(dims), list(measures)
+    values = list(zip(*rows)) if rows else [()] * (len(dims) + len(measures))
+    keys = pd.DataFrame({dim: pd.Series(column, dtype=object) for dim, column in zip(dims, values)})
+    counts = np.array(values[len(dims):], dtype=np.int64).reshape(len(measures), -1).T
+
+    numbers = _group_numbers(keys, dims)
+    _, first = np.unique(numbers, return_index=True)
+    combined = np.zeros((len(first), len(measures)), dtype=np.int64)
+    np.add.at(combined, numbers, counts)
+    keys = keys.iloc[first].reset_index(drop=True)
+    counts = combined
+
+    def value(column, row):
+        return keys[column].iat[row]
+
+    nested = pivot or breakdown
+    if nested is None:
+        records = []
+        for row in range(len(keys)):
+            record = {dim: value(dim, row) for dim in dims}
+            record.update({measure: int(count) for measure, count in zip(measures, counts[row])})
+            if len(measures) > 1:
+                record[total_key] = int(counts[row].sum())
+            records.append(record)
+        return _sorted(records, sort)
+
+    index = [dim for dim in dims if dim != nested]
+    groups = _group_numbers(keys, index)
+    group_totals = np.bincount(groups, weights=counts.sum(axis=1), minlength=groups.max() + 1 if len(groups) else 0)
+    order = np.argsort(groups, kind='stable')
+    bounds = np.searchsorted(groups[order], np.arange(len(group_totals) + 1))
+
+    records = []
+    for group in range(len(group_totals)):
+        members = order[bounds[group]:bounds[group + 1]]
+        record = {dim: value(dim, members[0]) for dim in index}
+        if pivot:
+            expanded = {
+                value(pivot, row): int(counts[row][0]) if len(measures) == 1
+                else {measure: int(count) for measure, count in zip(measures, counts[row])}
+                for row in members
+            }
+            if into:
+                record[into] = expanded
+            else:
+                record.update(expanded)
+        else:
+            record[into or f"{breakdown}_breakdown"] = [
+                {breakdown: value(breakdown, row), **{measure: int(count) for measure, count in zip(measures, counts[row])}}
+                for row in members
+            ]
+        key = tuple(record[dim] for dim in index)
+        record[total_key] = int(totals.get(key, 0)) if totals is not None else int(group_totals[group])
+        records.append(record)
+    return _sorted(records, sort)
+
+
+def _sorted(records, sort):
+    """按 sort 字段排序（稳定排序，空值在最后）"""
+    if not sort:
+        return records
+    field, descending = sort.lstrip('-'), sort.startswith('-')
+    if descending:
+        return sorted(records, key=lambda record: (record.get(field) is not None, record.get(field)), reverse=True)
+    return sorted(records, key=lambda record: (record.get(field) is None, record.get(field)))
+
+
+def aggregate_many(queries, versions=None):
+    """
+    执行多个 AggregateQuery：同一组快照上的查询一起取数
+
+    每个查询编译成一个分组统计（与预聚合统计定义相同时直接用预聚合结果或位图索引，否则实时统计，
+    多个实时统计在数据库上一次扫描完成），total 为 distinct 时另加一个按其余分组列的统计
+
+    Returns:
+        list: 与 queries 对应的接口输出（见 pivot_rows）
+    """
+    plans = []
+    for query in queries:
+        where, label_filters = compile_filters(query.dims, query.filters)
+        distinct = MEASURES[query.measure]
+        main = cube_spec((*query.dims, *label_filters), where, distinct)
+        subtotal = None
+        nested = query.pivot or query.breakdown
+        if nested and query.total == 'distinct' and distinct:
+            index = [dim for dim in query.dims if dim != nested]
+            subtotal = cube_spec((*index, *label_filters), where, distinct)
+        plans.append((query, label_filters, main, subtotal))
+
+    # 按快照分批取数
+    counts = {}
+    for snapshots in dict.fromkeys(query.snapshots for query in queries):
+        requests = []
+        for number, (query, label_filters, main, subtotal) in enumerate(plans):
+            if query.snapshots == snapshots:
+                requests.append(((number, 'main'), main, label_filters))
+                if subtotal is not None:
+                    requests.append(((number, 'subtotal'), subtotal, label_filters))
+        results = spec_counts_many([(spec, label_filters) for _, spec, label_filters in requests], snapshots, versions)
+        for (key, spec, label_filters), rows in zip(requests, results):
+            counts[key] = (spec, label_filters, rows)
+
+    outputs = []
+    for number, (query, label_filters, main, subtotal) in enumerate(plans):
+        measures = ('count',) if len(query.snapshots) == 1 else query.snapshots
+        spec, _, rows = counts[(number, 'main')]
+        rows = _reordered(spec, label_filters, query.dims, rows)
+        totals = None
+        if subtotal is not None:
+            index = tuple(dim for dim in query.dims if dim != (query.pivot or query.breakdown))
+            spec, _, subtotal_rows = counts[(number, 'subtotal')]
+            totals = {
+                tuple(row[:len(index)]): sum(row[len(index):])
+                for row in _reordered(spec, label_filters, index, subtotal_rows)
+            }
+        outputs.append(pivot_rows(rows, query.dims, measures, query.pivot, query.breakdown, query.into, totals,
+                                  query.total_key, query.sort))
+    return outputs
+
+
+def aggregate(query, versions=None):
+    """执行一个 AggregateQuery，返回接口输出"""
+    return aggregate_many([query], versions)[0]
+
+
+# 分析接口的图表，都是通用分组统计的预设
+PRESETS = {
+    'gender': aggregate_query(('gender',), filters={'gender': NOT_NULL}),
+    'faculty_gender': aggregate_query(('faculty_descr', 'gender'), filters={'gender': NOT_NULL}, pivot='gender',
+                                      into='gender_counts', total='distinct', total_key='total_count',
+                                      sort='-total_count'),
+    'faculty_first_gen': aggregate_query(('faculty_descr', 'first_generation_ind'),
+                                         filters={'first_generation_ind': NOT_NULL}, pivot='first_generation_ind',
+                                         sort='-total'),
+    'faculty_ses': aggregate_query(('faculty_descr', 'ses'), filters={'ses': NOT_NULL}, pivot='ses', sort='-total'),
+    'faculty_atsi_group': aggregate_query(('faculty_descr', 'atsi_group'), filters={'atsi_group': NOT_NULL},
+                                          pivot='atsi_group', sort='-total'),
+    'regional_remote': aggregate_query(('regional_remote',), filters={'regional_remote': NOT_NULL}),
+    'cdev': aggregate_query(('course_code', 'course_name', 'residency_group_descr'), filters={'course_code': 'CDEV%'},
+                            breakdown='residency_group_descr', into='residency_breakdown', sort='-total'),
+    'cdev_gender': aggregate_query(('course_code', 'gender'), measure='rows',
+                                   filters={'course_code': 'CDEV%', 'gender': NOT_NULL}, breakdown='gender',
+                                   into='gender_breakdown', sort='-total'),
+}
+
+
+def run_presets(names, versions=None):
+    """一起执行多个预设，返回 {预设名: 接口输出}"""
+    return dict(zip(names, aggregate_many([PRESETS[name] for name in names], versions)))
@@ -0,0 +1,140 @@
+from collections import namedtuple
+
+import pandas as pd
+
+# 快照数据（事实表 enrollment_fact 及 CurrentData / PreviousData / BeforeCensusData 三个视图）共用的列定义
+#   source   上传文件中的表头
+#   target   数据库字段名
+#   dtype    导入时的类型：int -> 可空整数，category -> 分类（描述性字符串），string -> 普通字符串
+#   nullable 不允许为空的列出现空值时整批拒绝
+#   extended 扩展字段（2025年格式才有），PreviousData 不包含
+#   encoded  重复的描述性字符串：事实表中只存维度表 dim_<target> 的整数键 <target>_id，标签在输出时再查回
+# 列定义或导入时的类型转换规则变化时加 1，旧指纹随之失效，同一文件会被重新导入
+SCHEMA_VERSION = 1
+
+ColumnSpec = namedtuple('ColumnSpec', ['source', 'target', 'dtype', 'nullable', 'extended', 'encoded'])
+
+
+def _col(source, dtype, nullable=True, extended=False, encoded=False):
+    return ColumnSpec(source, source.lower(), dtype, nullable, extended, encoded)
+
+
+ENROLMENT_SCHEMA = [
+    _col('RESIDENCY_GROUP_DESCR', 'category', encoded=True),
+    _col('ACADEMIC_YEAR', 'int', nullable=False),
+    _col('TERM', 'int'),
+    _col('TERM_DESCR', 'category', encoded=True),
+    _col('ACADEMIC_CAREER_DESCR', 'category', encoded=True),
+    _col('ACAD_PROG', 'int'),
+    _col('ACADEMIC_PROGRAM_DESCR', 'category', encoded=True),
+    _col('COURSE_ID', 'int'),
+    _col('OFFER_NUMBER', 'int'),
+    _col('FACULTY', 'category'),
+    _col('FACULTY_DESCR', 'category', encoded=True),
+    _col('SCHOOL', 'category'),
+    _col('SCHOOL_NAME', 'category', encoded=True),
+    _col('COURSE_NAME', 'category', encoded=True),
+    _col('GENDER', 'category', extended=True, encoded=True),
+    _col('FIRST_GENERATION_IND', 'category', extended=True, encoded=True),
+    _col('ATSI_DESC', 'category', extended=True, encoded=True),
+    _col('ATSI_GROUP', 'category', extended=True, encoded=True),
+    _col('REGIONAL_REMOTE', 'category', extended=True, encoded=True),
+    _col('SES', 'category', extended=True, encoded=True),
+    _col('ADMISSION_PATHWAY', 'category', extended=True, encoded=True),
+    _col('COURSE_CODE', 'category'),
+    _col('CATALOG_NUMBER', 'int'),
+    _col('CRSE_ATTR', 'category'),
+    _col('MASKED_ID', 'string', nullable=False),
+]
+
+ENCODED_COLUMNS = frozenset(spec.target for spec in ENROLMENT_SCHEMA if spec.encoded)
+
+# 事实表 enrollment_fact 上的索引，按 operations.py 中的查询形状设计：
+#   分组列在前、masked_id 在最后，COUNT(DISTINCT masked_id) 可以只扫索引（覆盖索引，SQLite 也适用）
+#   实际建索引时最前面再加 snapshot 列（见 models.py），各快照的数据在索引中也是分开的
+#   name     索引名后缀，完整名为 ix_enrollment_fact_<name>
+#   columns  索引列（数据库字段名，字典编码的列实际索引的是 <target>_id）
+#   where    部分索引条件，只对满足条件的行建索引
+IndexSpec = namedtuple('IndexSpec', ['name', 'columns', 'where'])
+
+
+def _index(name, *columns, where=None):
+    return IndexSpec(name, columns, where)
+
+
+SNAPSHOT_INDEXES = [
+    # census_comparison_data：按学院统计人数
+    _index('faculty', 'faculty_descr', 'masked_id'),
+    # yoy_comparison_faculty_data：学院 × 生源地 × 年份
+    _index('faculty_residency', 'faculty_descr', 'residency_group_descr', 'academic_year', 'masked_id'),
+    # 各 equity 分析：学院 × 分组字段
+    _index('faculty_gender', 'faculty_descr', 'gender', 'masked_id'),
+    _index('faculty_first_gen', 'faculty_descr', 'first_generation_ind', 'masked_id'),
+    _index('faculty_ses', 'faculty_descr', 'ses', 'masked_id'),
+    _index('faculty_atsi_group', 'faculty_descr', 'atsi_group', 'masked_id'),
+    _index('regional_remote', 'regional_remote', 'masked_id'),
+    # census_gender_drop：按学期过滤后按学院 × 性别统计
+    _index('term_faculty_gender', 'term_descr', 'faculty_descr', 'gender', 'masked_id'),
+    # CDEV 课程只占很小一部分，部分索引只覆盖这些行
+    _index('cdev', 'course_code', 'course_name', 'residency_group_descr', 'masked_id',
+           where="course_code LIKE 'CDEV%'"),
+    _index('cdev_gender', 'course_code', 'gender', 'masked_id', where="course_code LIKE 'CDEV%'"),
+    # 行的自然键：同一学生、同一课程开课、同一学期
+    _index('natural_key', 'masked_id', 'course_id', 'offer_number', 'term'),
+]
+
+# 各导入类型对应的 pandas dtype
+PANDAS_DTYPES = {'int': 'Int64', 'category': 'category', 'string': 'string'}
+
+# 解析阶段就使用的类型：字符串列直接读成 category/string，整数列在 coerce_frame 中统一转换
+READ_DTYPES = {spec.source: spec.dtype for spec in ENROLMENT_SCHEMA if spec.dtype != 'int'}
+
+
+def schema_columns(extended=True):
+    """返回表包含的列定义（extended=False 时只含基础字段）"""
+    return [spec for spec in ENROLMENT_SCHEMA if extended or not spec.extended]
+
+
+def storage_name(target):
+    """列在事实表中的字段名：字典编码的列存为 <target>_id"""
+    return f"{target}_id" if target in ENCODED_COLUMNS else target
+
+
+def source_columns(extended=True):
+    """上传文件中需要解析的表头"""
+    return [spec.source for spec in schema_columns(extended)]
+
+
+def coerce_frame(data, table):
+    """
+    按列定义整列完成重命名、类型转换和裁剪，得到可直接写入 table 的 DataFrame
+
+    不在 table 中的列被丢弃；文件中缺失的列补空值；非空列出现空值时抛出 ValueError
+    """
+    frame = pd.DataFrame(index=data.index)
+
+    for spec in ENROLMENT_SCHEMA:
+        if spec.target not in table.columns:
+            continue
+
+        if spec.source not in data.columns:
+            if not spec.nullable:
+                raise ValueError(f"{spec.source} column not found in file")
+            values = pd.Series(pd.NA, index=data.index, dtype=PANDAS_DTYPES[spec.dtype])
+        elif spec.dtype == 'int':
+            values = pd.to_numeric(data[spec.source], errors='coerce').round().astype('Int64')
+        elif spec.dtype == 'category':
+            values = data[spec.source]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('string').astype('category')
+        else:
+            values = data[spec.source].astype('string')
+
+        if not spec.nullable:
+            missing = int(values.isna().sum())
+            if missing:
+                raise ValueError(f"{spec.source} has {missing} empty value(s)")
+
+        frame[spec.target] = values
+
+    return frame
@@ -0,0 +1,125 @@
+from sqlalchemy import inspect, text
+
+from .models import db, EnrollmentFact, CurrentData, PreviousData, BeforeCensusData
+from .schema import ENCODED_COLUMNS, storage_name
+
+# 各快照对应的视图模型
+SNAPSHOT_VIEWS = {
+    'current': CurrentData,
+    'previous': PreviousData,
+    'before_census': BeforeCensusData,
+}
+
+
+def partition_name(snapshot):
+    """PostgreSQL 上每种快照对应的分区表名"""
+    return f"{EnrollmentFact.__tablename__}_{snapshot}"
+
+
+def storage_tables():
+    """create_all 需要创建的表（视图模型由 create_snapshot_views 单独创建）"""
+    return [table for table in db.metadata.sorted_tables if not table.info.get('is_view')]
+
+
+def create_snapshot_partitions(connection):
+    """PostgreSQL：为每种快照创建 LIST 分区，已存在的跳过"""
+    if connection.dialect.name != 'postgresql':
+        return
+    fact = EnrollmentFact.__tablename__
+    for snapshot in SNAPSHOT_VIEWS:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(snapshot)} "
+            f"PARTITION OF {fact} FOR VALUES IN ('{snapshot}')"
+        ))
+
+
+def migrate_legacy_snapshot_tables(connection):
+    """
+    旧版本中三种快照各是一张独立的表：把数据搬进事实表后删除旧表，之后同名视图取而代之
+
+    旧表中的描述性字符串先补进维度表，再按标签换成维度键写入事实表
+
+    Returns:
+        list: 迁移过的旧表名
+    """
+    existing = set(inspect(connection).get_table_names())
+    fact = EnrollmentFact.__tablename__
+    migrated = []
+    for snapshot, model in SNAPSHOT_VIEWS.items():
+        table_name = model.__tablename__
+        if table_name not in existing:
+            continue
+        columns = [column.name for column in model.__table__.columns]
+        values, joins = [], []
+        for name in columns:
+            if name in ENCODED_COLUMNS:
+                connection.execute(text(
+                    f"INSERT INTO dim_{name} (label) SELECT DISTINCT l.{name} FROM {table_name} l "
+                    f"WHERE l.{name} IS NOT NULL "
+                    f"AND NOT EXISTS (SELECT 1 FROM dim_{name} d WHERE d.label = l.{name})"
+                ))
+                values.append(f"d_{name}.id")
+                joins.append(f"LEFT JOIN dim_{name} d_{name} ON d_{name}.label = l.{name}")
+            else:
+                values.append(f"l.{name}")
+        connection.execute(text(
+            f"INSERT INTO {fact} (snapshot, {', '.join(storage_name(name) for name in columns)}) "
+            f"SELECT :snapshot, {', '.join(values)} FROM {table_name} l {' '.join(joins)}"
+        ), {'snapshot': snapshot})
+        connection.execute(text(f"DROP TABLE {table_name}"))
+        migrated.append(table_name)
+    if migrated:
+        print(f"Migrated legacy snapshot tables into {fact}: {migrated}")
+    return migrated
+
+
+def _view_select(model, snapshot):
+    """视图的查询：事实表中 snapshot 的行，编码列连接维度表换回标签，列名与原来的表相同"""
+    values, joins = [], []
+    for column in model.__table__.columns:
+        name = column.name
+        if name in ENCODED_COLUMNS:
+            values.append(f"d_{name}.label AS {name}")
+            joins.append(f"LEFT JOIN dim_{name} d_{name} ON d_{name}.id = f.{storage_name(name)}")
+        else:
+            values.append(f"f.{name}")
+    return (f"SELECT {', '.join(values)} FROM {EnrollmentFact.__tablename__} f {' '.join(joins)} "
+            f"WHERE f.snapshot = '{snapshot}'")
+
+
+def create_snapshot_views(connection):
+    """创建（或更新）三个快照视图：事实表中对应 snapshot 的行，列与原来的表相同"""
+    for snapshot, model in SNAPSHOT_VIEWS.items():
+        view = model.__tablename__
+        select = _view_select(model, snapshot)
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text(f"CREATE OR REPLACE VIEW {view} AS {select}"))
+        else:
+            connection.execute(text(f"DROP VIEW IF EXISTS {view}"))
+            connection.execute(text(f"CREATE VIEW {view} AS {select}"))
+
+
+def init_snapshot_storage(connection):
+    """create_all 之后调用：建分区、迁移旧表、建视图"""
+    create_snapshot_partitions(connection)
+    migrate_legacy_snapshot_tables(connection)
+    create_snapshot_views(connection)
+
+
+def clear_snapshot(connection, snapshot):
+    """清空一种快照的数据（PostgreSQL 上直接 TRUNCATE 对应分区，不留死元组）"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"TRUNCATE {partition_name(snapshot)}"))
+    else:
+        connection.execute(text(
+            f"DELETE FROM {EnrollmentFact.__tablename__} WHERE snapshot = :snapshot"
+        ), {'snapshot': snapshot})
+
+
+def analyze_snapshot(connection, snapshot):
+    """导入后更新统计信息（PostgreSQL 只分析被改动的分区）"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"ANALYZE {partition_name(snapshot)}"))
+    else:
+        connection.execute(text(f"ANALYZE {EnrollmentFact.__tablename__}"))
+
@@ -0,0 +1,123 @@
+import re
+import time
+
+from sqlalchemy import text
+
+# 换分区时等待读锁释放的上限，超时则整个导入回滚，线上数据保持不变
+SWAP_LOCK_TIMEOUT = '5s'
+
+
+def staging_name(table_name):
+    return f"{table_name}_staging"
+
+
+def _index_definitions(connection, table_name):
+    """读取线上分区当前的（非主键）索引定义，staging 表按同样的定义重建"""
+    rows = connection.execute(text("""
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema()
+          AND i.tablename = :table_name
+          AND i.indexname NOT IN (
+              SELECT c.conname FROM pg_constraint c
+              WHERE c.conrelid = CAST(:table_name AS regclass) AND c.contype = 'p'
+          )
+    """), {'table_name': table_name}).all()
+    return [(name, definition) for name, definition in rows]
+
+
+def _primary_key(connection, table_name):
+    """线上分区的主键约束名和定义，例如 ('enrollment_fact_current_pkey', 'PRIMARY KEY (snapshot, id)')"""
+    return connection.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = CAST(:table_name AS regclass) AND contype = 'p'
+    """), {'table_name': table_name}).one()
+
+
+def create_staging_table(connection, table_name, template=None):
+    """
+    按 template（默认为 table_name 本身，分区时传父表）的结构创建 table_name 的空 staging 表，
+    不带索引，导入更快；返回 staging 表名
+
+    上一次失败残留的 staging 表会被直接删除
+    """
+    staging = staging_name(table_name)
+    connection.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    connection.execute(text(
+        f"CREATE TABLE {staging} (LIKE {template or table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    ))
+    return staging
+
+
+def build_staging_indexes(connection, table_name, key_column, value, template=None):
+    """
+    导入完成后给 staging 表建主键、索引和分区约束，然后 ANALYZE（不锁线上分区，读请求照常进行）
+
+    索引定义与 template（默认为线上分区 table_name 本身）相同，挂载分区时 PostgreSQL 直接复用而不是重建；
+    CHECK 约束证明所有行都属于该分区，挂载时不再整表校验
+
+    Returns:
+        dict: {index_seconds, renames}，renames 交给 attach_staging_partition 在挂载后改回线上的索引名
+    """
+    staging = staging_name(table_name)
+    source = template or table_name
+    # 换掉已有分区时先用 staging 的名字，换入后改回原名；新建的分区直接用最终的名字
+    prefix = staging if template is None else table_name
+    started = time.perf_counter()
+
+    pkey_name, pkey_definition = _primary_key(connection, source)
+    staging_pkey = f"{prefix}_pkey"
+    connection.execute(text(f"ALTER TABLE {staging} ADD CONSTRAINT {staging_pkey} {pkey_definition}"))
+    connection.execute(text(
+        f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_{key_column}_check CHECK ({key_column} = '{value}')"
+    ))
+
+    renames = [(staging_pkey, pkey_name)]
+    for number, (index_name, definition) in enumerate(_index_definitions(connection, source)):
+        # 分区索引名由 PostgreSQL 自动生成且常被截断到 63 个字符，加后缀可能又被截回原名，这里另起短名
+        staging_index = f"{prefix}_ix{number}"
+        definition = re.sub(rf"INDEX {re.escape(index_name)} ON", f"INDEX {staging_index} ON", definition, count=1)
+        definition = re.sub(rf" ON (\w+\.)?{re.escape(source)} ", f" ON {staging} ", definition, count=1)
+        connection.execute(text(definition))
+        renames.append((staging_index, index_name))
+
+    connection.execute(text(f"ANALYZE {staging}"))
+    return {'index_seconds': round(time.perf_counter() - started, 3),
+            'renames': renames if template is None else []}
+
+
+def attach_staging_partition(connection, parent, table_name, key_column, value, renames=()):
+    """
+    把建好索引的 staging 表挂成 parent 中 value 对应的分区 table_name
+
+    挂载分区同样要锁 parent 直到提交，在导入事务提交之前最后执行
+    """
+    staging = staging_name(table_name)
+    connection.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    connection.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {staging} FOR VALUES IN ('{value}')"))
+    connection.execute(text(f"ALTER TABLE {staging} RENAME TO {table_name}"))
+    connection.execute(text(
+        f"ALTER TABLE {table_name} RENAME CONSTRAINT {staging}_{key_column}_check TO {table_name}_{key_column}_check"
+    ))
+    for staging_index, index_name in renames:
+        connection.execute(text(f"ALTER INDEX {staging_index} RENAME TO {index_name}"))
+
+
+def swap_staging_partition(connection, parent, table_name, key_column, value, renames):
+    """
+    把建好索引的 staging 表换成 parent 中 value 对应的分区
+
+    DETACH 会对 parent 加 ACCESS EXCLUSIVE 锁，直到事务提交才释放，期间所有快照的读请求都要等待；
+    因此这里只有换分区和改名这几条语句，预聚合、版本记录等都在调用之前基于 staging 表做完，
+    调用之后立即提交。旧分区被整体删除，不会留下 DELETE 产生的死元组
+
+    Returns:
+        dict: {swap_seconds}
+    """
+    started = time.perf_counter()
+    connection.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {table_name}"))
+    connection.execute(text(f"DROP TABLE {table_name}"))
+    attach_staging_partition(connection, parent, table_name, key_column, value, renames)
+    return {'swap_seconds': round(time.perf_counter() - started, 3)}
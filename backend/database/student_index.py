@@ -0,0 +1,140 @@
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+
+from .models import db, EnrollmentFact, SnapshotVersion
+from .schema import storage_name
+from .engines import read_session
+
+try:
+    from pyroaring import BitMap
+    HAS_ROARING = True
+except ImportError:
+    BitMap = None
+    HAS_ROARING = False
+
+# 学生位图索引：每个版本内把 masked_id 映射为从 0 开始的连续整数，每个统计的每个分组键保存一个学生集合，
+# 去重人数为集合中的学生数，合并标签为集合的并集。
+# 安装了 pyroaring 时使用压缩位图，否则用排好序、去重的 NumPy 整数数组，并集和差集都是向量运算
+#
+# 学生编号只在一个版本内有效，随索引一起释放，不会随导入次数增长；masked_id 为空的行不计入人数，
+# 不分配编号（分组键仍然保留，人数为 0，与 COUNT(DISTINCT masked_id) 一致）
+
+# 已建好的索引 {版本 id: SnapshotIndex}；版本的数据不会变化，转为历史版本后索引原样可用
+_indexes = {}
+_build_lock = threading.Lock()
+
+
+class SnapshotIndex:
+    """一个快照版本的学生位图：cubes = {统计名: {分组键: 位图}}"""
+
+    def __init__(self, version_id, loaded_at):
+        self.version_id = version_id
+        self.loaded_at = loaded_at
+        self.cubes = {}
+
+
+def _bitmap(numbers):
+    if HAS_ROARING:
+        return BitMap(numbers)
+    return np.unique(np.asarray(numbers, dtype=np.int64))
+
+
+def union(bitmaps):
+    """位图并集"""
+    bitmaps = list(bitmaps)
+    if not bitmaps:
+        return _bitmap(())
+    if HAS_ROARING:
+        return BitMap.union(*bitmaps)
+    return np.unique(np.concatenate(bitmaps))
+
+
+def difference(left, right):
+    """在 left 中、不在 right 中的学生"""
+    return left - right if HAS_ROARING else np.setdiff1d(left, right, assume_unique=True)
+
+
+def student_count(bitmap):
+    """位图中的学生数（与 COUNT(DISTINCT masked_id) 一致）"""
+    return len(bitmap)
+
+
+def index_enabled():
+    return current_app.config.get('STUDENT_INDEX', True)
+
+
+def _build(session, version, specs):
+    """每个统计一次 SELECT DISTINCT 分组键, masked_id，按分组键收集学生编号（编号在这个版本内分配）"""
+    index = SnapshotIndex(version.id, version.loaded_at)
+    numbers = {}
+    for spec in specs:
+        keys = [EnrollmentFact.__table__.c[storage_name(column)] for column in spec.columns]
+        query = session.query(*keys, EnrollmentFact.masked_id).filter(
+            EnrollmentFact.snapshot == version.storage_key
+        ).distinct()
+        if spec.where:
+            query = query.filter(db.text(spec.where))
+        groups = {}
+        for row in query:
+            students = groups.setdefault(tuple(row[:-1]), [])
+            if row[-1] is not None:
+                students.append(numbers.setdefault(row[-1], len(numbers)))
+        index.cubes[spec.name] = {key: _bitmap(numbers) for key, numbers in groups.items()}
+    return index
+
+
+def _indexable(specs):
+    # 位图只能回答去重人数，按行数统计的不建索引
+    return [spec for spec in specs if spec.distinct]
+
+
+def snapshot_index(key, specs):
+    """
+    快照键对应版本的索引，当前进程还没有（或版本已更新）时从数据库建立
+
+    Returns:
+        SnapshotIndex: 没有版本记录的数据（例如旧表迁移过来的数据）返回 None
+    """
+    version = read_session().query(SnapshotVersion).filter_by(storage_key=key).first()
+    if version is None:
+        return None
+    index = _indexes.get(version.id)
+    if index is None or index.loaded_at != version.loaded_at:
+        with _build_lock:
+            index = _indexes.get(version.id)
+            if index is None or index.loaded_at != version.loaded_at:
+                # 其它进程导入后被删除的版本，本进程中的索引在这里一起丢弃
+                _discard_evicted({version_id for (version_id,) in read_session().query(SnapshotVersion.id)})
+                index = _indexes[version.id] = _build(read_session(), version, _indexable(specs))
+    return index
+
+
+def _discard_evicted(version_ids):
+    for version_id in [version_id for version_id in _indexes if version_id not in version_ids]:
+        del _indexes[version_id]
+
+
+def refresh_student_index(snapshot, specs):
+    """
+    导入提交后为 snapshot 的新线上版本建立索引，并丢弃已删除版本的索引
+
+    在写连接上读取，刚提交的数据不受只读副本延迟的影响
+
+    Returns:
+        dict: {student_index_seconds}
+    """
+    if not index_enabled():
+        _indexes.clear()
+        return {'student_index_seconds': 0.0}
+
+    started = time.perf_counter()
+    versions = {version.id: version for version in SnapshotVersion.query}
+    _discard_evicted(versions)
+    live = next((version for version in versions.values() if version.snapshot == snapshot and version.live), None)
+    if live is not None:
+        with _build_lock:
+            _indexes[live.id] = _build(db.session, live, _indexable(specs))
+    return {'student_index_seconds': round(time.perf_counter() - started, 3)}
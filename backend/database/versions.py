@@ -0,0 +1,272 @@
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from .models import db, EnrollmentFact, SnapshotAggregate, SnapshotVersion
+from .snapshots import partition_name
+from .staging import staging_name, create_staging_table, build_staging_indexes, attach_staging_partition
+from .engines import read_session
+
+
+class SnapshotVersionNotFound(LookupError):
+    """请求的历史版本不存在（或已按保留策略删除）"""
+
+
+def version_key(version_id):
+    """历史版本在 enrollment_fact.snapshot 中的键"""
+    return f"v{version_id}"
+
+
+def _history_limits():
+    """保留策略：每种快照保留的历史版本数，以及所有历史版本合计的字节上限（0 表示不限制）"""
+    count = current_app.config.get('SNAPSHOT_HISTORY_COUNT', 0)
+    max_bytes = current_app.config.get('SNAPSHOT_HISTORY_MAX_MB', 0) * 1024 * 1024
+    return count, max_bytes
+
+
+def _storage_bytes(connection, key, table_name=None):
+    """
+    一个快照键的数据占用的空间
+
+    PostgreSQL 为对应分区（或还没有换入的 staging 表 table_name，含索引）的大小；
+    SQLite 没有按表统计，按行数占比估算数据库文件大小
+    """
+    if connection.dialect.name == 'postgresql':
+        return connection.execute(text(
+            "SELECT pg_total_relation_size(CAST(:partition AS regclass))"
+        ), {'partition': table_name or partition_name(key)}).scalar()
+
+    fact = EnrollmentFact.__tablename__
+    rows, total = connection.execute(text(
+        f"SELECT SUM(CASE WHEN snapshot = :key THEN 1 ELSE 0 END), COUNT(*) FROM {fact}"
+    ), {'key': key}).one()
+    if not total:
+        return 0
+    file_bytes = connection.execute(text("PRAGMA page_count")).scalar() * \
+        connection.execute(text("PRAGMA page_size")).scalar()
+    return int(file_bytes * (rows or 0) / total)
+
+
+def live_version(snapshot):
+    return SnapshotVersion.query.filter_by(snapshot=snapshot, live=True).first()
+
+
+def retain_live_version(connection, snapshot, keep=True):
+    """
+    在覆盖 snapshot 之前把线上版本复制到 v<id> 下保留（在导入事务中调用，导入失败时一起回滚）
+
+    只在服务端复制已有数据，不需要重新解析源文件；不保留历史（或 keep 为 False）时直接丢弃旧版本的记录。
+    PostgreSQL 上复制到一张独立的表并建好索引，由 attach_retained_version 在提交前挂成分区，
+    复制期间不锁事实表
+
+    Returns:
+        int: 保留下来的版本 id，没有可保留的版本时为 None
+    """
+    version = live_version(snapshot)
+    if version is None:
+        return None
+
+    count, _ = _history_limits()
+    if count <= 0 or not keep:
+        db.session.delete(version)
+        return None
+
+    key = version_key(version.id)
+    fact = EnrollmentFact.__tablename__
+    columns = ', '.join(column.name for column in EnrollmentFact.__table__.columns if column.name != 'snapshot')
+    storage_table = None
+    if connection.dialect.name == 'postgresql':
+        storage_table = create_staging_table(connection, partition_name(key), template=fact)
+        connection.execute(text(
+            f"INSERT INTO {storage_table} (snapshot, {columns}) "
+            f"SELECT :key, {columns} FROM {partition_name(snapshot)}"
+        ), {'key': key})
+        build_staging_indexes(connection, partition_name(key), 'snapshot', key, template=partition_name(snapshot))
+    else:
+        connection.execute(text(
+            f"INSERT INTO {fact} (snapshot, {columns}) SELECT :key, {columns} FROM {fact} WHERE snapshot = :snapshot"
+        ), {'key': key, 'snapshot': snapshot})
+
+    # 预聚合结果随版本一起保留，按版本查询时同样不用逐行统计
+    for aggregate in SnapshotAggregate.query.filter_by(snapshot=snapshot):
+        db.session.add(SnapshotAggregate(snapshot=key, cube=aggregate.cube, definition=aggregate.definition,
+                                         rows=aggregate.rows, refreshed_at=aggregate.refreshed_at))
+
+    version.storage_key = key
+    version.live = False
+    version.retained_at = datetime.now()
+    version.size_bytes = _storage_bytes(connection, key, storage_table)
+    return version.id
+
+
+def attach_retained_version(connection, version_id, evicted=()):
+    """
+    PostgreSQL：把 retain_live_version 复制好的表挂成事实表的分区（会锁住事实表，在导入事务提交之前执行）；
+    已经按保留策略删除（在 evicted 中）的版本不再挂载
+    """
+    if version_id is None or version_id in evicted or connection.dialect.name != 'postgresql':
+        return
+    key = version_key(version_id)
+    attach_staging_partition(connection, EnrollmentFact.__tablename__, partition_name(key), 'snapshot', key)
+
+
+def record_live_version(connection, snapshot, load_mode, content_hash, row_count, upload_id=None, table_name=None):
+    """记录刚导入的线上版本，返回版本 id（swap 导入在换分区之前记录，大小按 staging 表 table_name 统计）"""
+    version = SnapshotVersion(
+        snapshot=snapshot,
+        storage_key=snapshot,
+        live=True,
+        upload_id=upload_id,
+        load_mode=load_mode,
+        content_hash=content_hash,
+        row_count=row_count,
+        size_bytes=_storage_bytes(connection, snapshot, table_name)
+    )
+    db.session.add(version)
+    db.session.flush()
+    return version.id
+
+
+def _drop_version_storage(connection, key):
+    """
+    删除一个历史版本的数据：PostgreSQL 上直接删除分区（本次导入刚复制、还没有挂载的表一起删除）
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"DROP TABLE IF EXISTS {partition_name(key)}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {staging_name(partition_name(key))}"))
+    else:
+        connection.execute(text(
+            f"DELETE FROM {EnrollmentFact.__tablename__} WHERE snapshot = :key"
+        ), {'key': key})
+
+
+def evict_versions(connection):
+    """
+    按保留策略从最旧的开始删除历史版本：每种快照超过 SNAPSHOT_HISTORY_COUNT 个，
+    或所有历史版本合计超过 SNAPSHOT_HISTORY_MAX_MB 时删除
+
+    版本记录和预聚合结果先删除，删除分区会锁住事实表，放在最后
+
+    Returns:
+        list: 被删除的版本 id
+    """
+    count, max_bytes = _history_limits()
+    retained = SnapshotVersion.query.filter_by(live=False).order_by(SnapshotVersion.id.desc()).all()
+
+    kept = defaultdict(int)
+    total_bytes = 0
+    evicted = []
+    for version in retained:
+        kept[version.snapshot] += 1
+        total_bytes += version.size_bytes or 0
+        if kept[version.snapshot] > count or (max_bytes and total_bytes > max_bytes):
+            evicted.append(version)
+    for version in evicted:
+        SnapshotAggregate.query.filter_by(snapshot=version.storage_key).delete()
+        db.session.delete(version)
+    db.session.flush()
+    for version in evicted:
+        _drop_version_storage(connection, version.storage_key)
+    return [version.id for version in evicted]
+
+
+def retained_keys():
+    """所有历史版本的快照键"""
+    return [version.storage_key for version in SnapshotVersion.query.filter_by(live=False)]
+
+
+def version_stamps(keys):
+    """
+    快照键当前对应的版本，用作按版本缓存计算结果的键
+
+    Returns:
+        tuple: ((快照键, 版本 id, 导入时间), ...)；有快照键没有版本记录（例如旧表迁移过来的数据）时为 None
+    """
+    versions = {
+        version.storage_key: version
+        for version in read_session().query(SnapshotVersion).filter(SnapshotVersion.storage_key.in_(keys))
+    }
+    if any(key not in versions for key in keys):
+        return None
+    return tuple((key, versions[key].id, versions[key].loaded_at) for key in keys)
+
+
+class VersionedCache:
+    """
+    按 version_stamps 缓存的计算结果（版本的数据不会变化）
+
+    同一快照键换了版本后旧版本的结果不会再用到，放入新结果时一起删除；最多保留 size 份
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, stamps):
+        return self._entries.get(stamps) if stamps is not None else None
+
+    def put(self, stamps, value):
+        if stamps is None:
+            return
+        with self._lock:
+            for stale in [cached for cached in self._entries if any(
+                entry[0] == current[0] and entry != current for entry, current in zip(cached, stamps)
+            )]:
+                del self._entries[stale]
+            while len(self._entries) >= self.size:
+                del self._entries[next(iter(self._entries))]
+            self._entries[stamps] = value
+
+    def clear(self):
+        self._entries.clear()
+
+
+def resolve_snapshot_versions(value):
+    """
+    解析分析接口的 snapshot 参数：逗号分隔的版本 id，每种快照最多一个
+
+    Returns:
+        dict: {快照类型: 数据键}，未指定的快照类型继续使用线上版本
+
+    Raises:
+        ValueError: 参数格式错误
+        SnapshotVersionNotFound: 版本不存在或已被删除
+    """
+    if not value:
+        return {}
+
+    keys = {}
+    for part in value.split(','):
+        part = part.strip()
+        if not part.isdigit():
+            raise ValueError(f"Invalid snapshot version: {part}")
+        version = read_session().get(SnapshotVersion, int(part))
+        if version is None:
+            raise SnapshotVersionNotFound(f"Snapshot version {part} not found (it may have been evicted)")
+        if version.snapshot in keys:
+            raise ValueError(f"Only one version per snapshot type can be selected ({version.snapshot})")
+        keys[version.snapshot] = version.storage_key
+    return keys
+
+
+def list_versions():
+    """所有保留中的版本（线上版本和历史版本），新的在前"""
+    return [
+        {
+            'version': version.id,
+            'snapshot': version.snapshot,
+            'live': version.live,
+            'upload_id': version.upload_id,
+            'load_mode': version.load_mode,
+            'content_hash': version.content_hash,
+            'rows': version.row_count,
+            'size_bytes': version.size_bytes,
+            'loaded_at': version.loaded_at.isoformat() if version.loaded_at else None,
+            'retained_at': version.retained_at.isoformat() if version.retained_at else None
+        }
+        for version in read_session().query(SnapshotVersion).order_by(SnapshotVersion.id.desc())
+    ]
@@ -1,13 +1,21 @@
 import openai
 import pandas as pd
 from config import Config
+from utils.file_readers import read_excel_frame
 
 openai.api_key = Config.OPENAI_API_KEY
 
 
-def process_with_gpt(file_path):
-    # 读取Excel内容
-    df = pd.read_excel(file_path)
+# 发给 GPT 的文本只截取前 3000 个字符，读取前若干行就足够
+GPT_PREVIEW_ROWS = 200
+
+
+def process_with_gpt(file_path, sheet_name=None):
+    # 读取Excel内容（.xlsx 只读流式读取前若干行，不加载整个工作簿）
+    if file_path.lower().endswith('.xlsx'):
+        df = read_excel_frame(file_path, sheet_name=sheet_name or Config.EXCEL_SHEET_NAME, nrows=GPT_PREVIEW_ROWS)
+    else:
+        df = pd.read_excel(file_path, nrows=GPT_PREVIEW_ROWS)
 
     # 转换为文本格式
     text_data = df.to_string()
@@ -0,0 +1,255 @@
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database.models import db, IngestJob
+from database.operations import process_analysis_mode
+from utils.file_handlers import save_job_files, StoredUpload
+
+# 任务阶段按执行顺序排列
+JOB_STAGES = ('validate', 'parse', 'load', 'index')
+
+_app = None
+_executor = None
+# 本进程中正在执行的任务的实时进度 {job_id: stages}
+_live_stages = {}
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _worker_alive(worker):
+    """
+    记录的执行进程是否还在运行：同一台机器上直接检查进程，其它机器上无法判断时返回 None
+
+    进程号与本进程相同时视为已退出（容器重启后新进程常拿到同一个进程号，本进程刚启动，不可能在执行旧任务）
+    """
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def init_ingest_jobs(app):
+    """创建后台线程池，并恢复上次进程退出时未完成的任务"""
+    global _app, _executor
+    _app = app
+    _executor = ThreadPoolExecutor(
+        max_workers=app.config.get('INGEST_WORKERS', 2),
+        thread_name_prefix='ingest'
+    )
+    with app.app_context():
+        resume_unfinished_jobs()
+
+
+def enqueue_ingest_job(analysis_mode, files, load_mode=None):
+    """保存上传文件、写入任务表并提交到后台线程池，立即返回任务 id"""
+    job_id = uuid.uuid4().hex
+    saved = save_job_files(job_id, files)
+
+    job = IngestJob(
+        id=job_id,
+        analysis_mode=analysis_mode,
+        load_mode=load_mode,
+        status='queued',
+        stages={},
+        files=[list(item) for item in saved]
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _executor.submit(_run_job, job_id)
+    return job_id
+
+
+def resume_unfinished_jobs():
+    """
+    重新提交排队中的任务，以及执行进程已经退出的 running 任务
+
+    执行进程在本机时直接检查进程是否还在；在其它机器上时按心跳判断，心跳超过 JOB_STALE_SECONDS 视为已退出。
+    SQLite 上不写心跳（见 JobHeartbeat），无法判断的任务不恢复
+    """
+    stale_before = time.time() - _app.config.get('JOB_STALE_SECONDS', 300)
+    heartbeats = db.engine.dialect.name != 'sqlite'
+    jobs = IngestJob.query.filter(IngestJob.status.in_(('queued', 'running'))).all()
+
+    resumed = []
+    for job in jobs:
+        if job.status == 'running':
+            alive = _worker_alive(job.worker)
+            if alive is None:
+                alive = not heartbeats or (job.heartbeat is not None and job.heartbeat > stale_before)
+            if alive:
+                continue
+            job.status = 'queued'
+        resumed.append(job.id)
+    db.session.commit()
+
+    for job_id in resumed:
+        _executor.submit(_run_job, job_id)
+    if resumed:
+        _app.logger.info("Resumed %s ingest job(s): %s", len(resumed), resumed)
+    return resumed
+
+
+def _update_job(job_id, **values):
+    """用独立连接更新任务表，不会提交或打断导入事务"""
+    values['heartbeat'] = time.time()
+    table = IngestJob.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.id == job_id).values(**values))
+
+
+def _claim_job(job_id):
+    """原子地把 queued 任务标记为 running，多个进程同时恢复任务时只有一个能领到"""
+    table = IngestJob.__table__
+    with db.engine.begin() as connection:
+        claimed = connection.execute(
+            table.update()
+            .where(table.c.id == job_id, table.c.status == 'queued')
+            .values(status='running', worker=_worker_name(), heartbeat=time.time(),
+                    attempts=table.c.attempts + 1, stages={}, error=None)
+        ).rowcount
+    return claimed == 1
+
+
+class JobHeartbeat:
+    """
+    任务执行期间在独立线程中定期刷新心跳
+
+    解析、预聚合、导出分析副本、建学生索引等阶段可能长时间没有进度回调，心跳仍然按时刷新，
+    其它进程启动时不会把仍在执行的任务当作过期任务重新执行。
+    SQLite 只允许一个写事务，导入事务提交前无法另开连接写任务表，不启动心跳线程
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.interval = _app.config.get('JOB_HEARTBEAT_SECONDS', 30)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if db.engine.dialect.name == 'sqlite':
+            return self
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        with _app.app_context():
+            while not self._stopped.wait(self.interval):
+                try:
+                    _update_job(self.job_id)
+                except Exception as e:
+                    _app.logger.warning("Failed to refresh the heartbeat of ingest job %s: %s", self.job_id, e)
+
+
+class JobProgress:
+    """process_analysis_mode 的进度回调：记录每个阶段的行数和耗时并写入任务表"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stages = {}
+        self.started = {}
+        self.current = None
+
+    def __call__(self, stage, rows=0):
+        now = time.time()
+        if stage not in self.stages:
+            self.started[stage] = now
+            self.stages[stage] = {'status': 'running', 'rows': 0, 'elapsed': 0.0}
+        self.stages[stage]['rows'] += rows
+        self.stages[stage]['elapsed'] = round(now - self.started[stage], 3)
+        self.current = stage
+        _live_stages[self.job_id] = (stage, self.stages)
+        # SQLite 只允许一个写事务，导入事务提交前无法另开连接写任务表，只保留内存中的进度
+        if db.engine.dialect.name != 'sqlite':
+            _update_job(self.job_id, stage=stage, stages=self.stages)
+
+    def finish(self):
+        for info in self.stages.values():
+            info['status'] = 'done'
+        return self.stages
+
+
+def _run_job(job_id):
+    """后台线程入口"""
+    with _app.app_context():
+        if not _claim_job(job_id):
+            return
+
+        job = db.session.get(IngestJob, job_id)
+        uploads = []
+        progress = JobProgress(job_id)
+        heartbeat = JobHeartbeat(job_id).start()
+        succeeded = False
+        try:
+            uploads = [StoredUpload(path, filename) for path, filename in job.files]
+            result = process_analysis_mode(job.analysis_mode, uploads, progress=progress,
+                                           load_mode=job.load_mode, upload_id=job_id)
+            _update_job(job_id, status='succeeded', stage=None, stages=progress.finish(),
+                        result=result, finished_at=datetime.now())
+            succeeded = True
+        except Exception as e:
+            traceback.print_exc()
+            if progress.current:
+                progress.stages[progress.current]['status'] = 'failed'
+            _update_job(job_id, status='failed', stages=progress.stages, error=str(e),
+                        finished_at=datetime.now())
+        finally:
+            heartbeat.stop()
+            _live_stages.pop(job_id, None)
+            for upload in uploads:
+                upload.close()
+            db.session.remove()
+
+        # 成功后删除保存的上传文件（失败的任务保留文件以便排查）
+        if succeeded and uploads:
+            shutil.rmtree(os.path.dirname(uploads[0].path), ignore_errors=True)
+
+
+def job_status(job_id):
+    """返回任务状态，任务不存在时返回 None"""
+    job = db.session.get(IngestJob, job_id)
+    if job is None:
+        return None
+
+    stage, stages = job.stage, job.stages or {}
+    if job.status == 'running' and job_id in _live_stages:
+        # 任务在本进程中执行时直接读取内存中的实时进度
+        stage, stages = _live_stages[job_id]
+
+    return {
+        'job_id': job.id,
+        'analysis_mode': job.analysis_mode,
+        'load_mode': job.load_mode,
+        'status': job.status,
+        'stage': stage,
+        'stages': [dict(name=name, **stages[name]) for name in JOB_STAGES if name in stages],
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'files': [filename for _, filename in job.files],
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+import pandas as pd
+
+from utils.file_readers import read_excel_frame
+
+# pyarrow 可选：有则用 Parquet 缓冲在进程间传递 DataFrame，否则退回 pickle
+try:
+    import pyarrow  # noqa: F401
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# 工作进程用 spawn 启动：进程池在后台导入线程中按需创建，此时进程里已有数据库连接池、其它线程和它们持有的锁，
+# fork 会把这些（可能正处于加锁状态）原样复制给子进程；spawn 的子进程是全新的解释器，按模块路径导入 _parse_in_worker
+_MP_CONTEXT = multiprocessing.get_context('spawn')
+
+_executor = None
+_executor_workers = None
+
+
+def _get_executor(max_workers):
+    """进程池在进程内复用，避免每个请求都重新启动工作进程"""
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != max_workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT)
+        _executor_workers = max_workers
+    return _executor
+
+
+def _read_frame(path, filename, columns, dtype, sheet_name=None):
+    """在工作进程中整表解析单个文件（.xlsx 用只读流式读取）"""
+    wanted = set(columns) if columns is not None else None
+    usecols = (lambda name: name in wanted) if wanted is not None else None
+    lower = filename.lower()
+
+    if lower.endswith('.csv'):
+        return pd.read_csv(path, encoding='utf-8', usecols=usecols, dtype=dtype)
+    if lower.endswith('.xlsx'):
+        return read_excel_frame(path, columns=columns, dtype=dtype, sheet_name=sheet_name)
+    if lower.endswith('.xls'):
+        return pd.read_excel(path, sheet_name=sheet_name or 0, usecols=usecols, dtype=dtype)
+    raise ValueError(f"Unsupported file format: {filename}")
+
+
+def _parse_in_worker(path, filename, columns, dtype, sheet_name=None):
+    """工作进程入口：返回 Parquet 字节（有 pyarrow 时）或 DataFrame 本身（由 pickle 传回）"""
+    frame = _read_frame(path, filename, columns, dtype, sheet_name)
+    if HAS_ARROW:
+        buffer = BytesIO()
+        frame.to_parquet(buffer, engine='pyarrow', index=False)
+        return buffer.getvalue()
+    return frame
+
+
+def _decode(payload):
+    if isinstance(payload, bytes):
+        return pd.read_parquet(BytesIO(payload), engine='pyarrow')
+    return payload
+
+
+def _spool_upload(file, directory):
+    """把上传文件落到临时目录，工作进程按路径读取（FileStorage 本身无法跨进程传递）"""
+    if getattr(file, 'path', None):
+        # 已经保存在磁盘上的文件（后台任务）直接按原路径读取
+        return file.path
+    file.stream.seek(0)
+    path = os.path.join(directory, f"{len(os.listdir(directory))}_{os.path.basename(file.filename)}")
+    with open(path, 'wb') as target:
+        shutil.copyfileobj(file.stream, target)
+    return path
+
+
+def parse_uploads(files, columns=None, dtype=None, max_workers=None, sheet_name=None):
+    """
+    并行解析一批上传文件，按解析完成的先后顺序产出 (文件下标, DataFrame)
+
+    max_workers <= 1 或只有一个文件时在当前进程内顺序解析
+    """
+    directory = tempfile.mkdtemp(prefix='batch_upload_')
+    futures = {}
+    try:
+        paths = [_spool_upload(file, directory) for file in files]
+
+        if not max_workers or max_workers <= 1 or len(files) == 1:
+            for index, (path, file) in enumerate(zip(paths, files)):
+                yield index, _read_frame(path, file.filename, columns, dtype, sheet_name)
+            return
+
+        executor = _get_executor(max_workers)
+        for index, (path, file) in enumerate(zip(paths, files)):
+            futures[executor.submit(_parse_in_worker, path, file.filename, columns, dtype, sheet_name)] = index
+        for future in as_completed(futures):
+            yield futures[future], _decode(future.result())
+    finally:
+        # 调用方中途放弃（例如入库失败）时取消尚未开始的解析任务
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(directory, ignore_errors=True)
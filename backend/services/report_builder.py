@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.operations import (
+    CHART_PRESETS, chart_data, yoy_comparison_faculty_data, census_gender_drop_by_term_and_faculty, census_terms
+)
+
+# 报告中的图表（与前端 EditReport 页面的图表 id 一致）
+BASE_CHARTS = ('gender_participation', 'wil_participation', 'cdev_enrolments')
+YOY_CHART = 'yoy_comparison'
+CENSUS_CHART = 'chart_census1'
+
+# 各分析模式可用的图表
+MODE_CHARTS = {
+    'default': BASE_CHARTS,
+    'yoy_comparison': BASE_CHARTS + (YOY_CHART,),
+    'census_day': BASE_CHARTS + (CENSUS_CHART,),
+    'census_yoy': BASE_CHARTS + (YOY_CHART, CENSUS_CHART),
+}
+
+_app = None
+_executor = None
+
+
+def init_report_builder(app):
+    """创建报告取数的线程池：报告中互不依赖的取数任务在各自的线程（各自的分析连接）上并发执行"""
+    global _app, _executor
+    _app = app
+    _executor = ThreadPoolExecutor(
+        max_workers=app.config.get('REPORT_WORKERS', 3),
+        thread_name_prefix='report'
+    )
+
+
+def _census_drop(term, versions):
+    if not term:
+        raise ValueError("Missing 'term' parameter for the census day drop chart")
+    terms = census_terms(versions)
+    if term not in terms:
+        raise ValueError(f"Invalid term '{term}'. Valid terms are: {', '.join(terms)}")
+    return {CENSUS_CHART: census_gender_drop_by_term_and_faculty(term, versions)}
+
+
+def _plan(charts, term, versions):
+    """
+    报告的取数任务 {任务名: (图表, 函数)}
+
+    基于当前数据表的图表合成一个任务（预设一起规划，需要实时统计时一次扫描完成），
+    YoY 对比和 Census Day drop 分别查询其它快照，各自一个任务
+    """
+    tasks = {}
+    base = [chart for chart in charts if chart in CHART_PRESETS]
+    if base:
+        tasks['current'] = (base, lambda: chart_data(base, versions))
+    if YOY_CHART in charts:
+        tasks['yoy'] = ([YOY_CHART], lambda: {YOY_CHART: yoy_comparison_faculty_data(versions)})
+    if CENSUS_CHART in charts:
+        tasks['census'] = ([CENSUS_CHART], lambda: _census_drop(term, versions))
+    return tasks
+
+
+def _run(function):
+    """在线程中执行一个取数任务：使用自己的应用上下文，因此也使用自己的分析连接，结束时归还"""
+    started = time.perf_counter()
+    with _app.app_context():
+        try:
+            return function(), None, round(time.perf_counter() - started, 3)
+        except Exception as e:
+            return None, str(e), round(time.perf_counter() - started, 3)
+
+
+def build_report(analysis_mode, charts=None, term=None, versions=None):
+    """
+    一次取齐报告中所有图表的数据
+
+    Args:
+        analysis_mode (str): 分析模式（见 MODE_CHARTS）
+        charts (list): 需要的图表，为空时取该模式下的全部图表
+        term (str): Census Day drop 图表的学期名
+        versions (dict): 可选，{快照类型: 数据键}，查询保留的历史版本
+
+    Returns:
+        dict: {mode, charts: {图表: 数据}, errors: {图表: 错误信息}, seconds: {任务名: 耗时}}
+
+    Raises:
+        ValueError: 分析模式未知，或图表不属于该模式
+    """
+    if not analysis_mode:
+        raise ValueError("Missing 'mode' parameter")
+    if analysis_mode not in MODE_CHARTS:
+        raise ValueError(f"Invalid mode '{analysis_mode}'. Valid modes are: {', '.join(MODE_CHARTS)}")
+    available = MODE_CHARTS[analysis_mode]
+    charts = list(dict.fromkeys(charts or available))
+    invalid = [chart for chart in charts if chart not in available]
+    if invalid:
+        raise ValueError(f"Chart(s) {', '.join(invalid)} are not available in mode '{analysis_mode}'. "
+                         f"Available charts are: {', '.join(available)}")
+
+    tasks = _plan(charts, term, versions)
+    if len(tasks) > 1:
+        futures = {name: _executor.submit(_run, function) for name, (_, function) in tasks.items()}
+        outcomes = {name: future.result() for name, future in futures.items()}
+    else:
+        outcomes = {name: _run(function) for name, (_, function) in tasks.items()}
+
+    report = {'mode': analysis_mode, 'charts': {}, 'errors': {}, 'seconds': {}}
+    for name, (task_charts, _) in tasks.items():
+        data, error, seconds = outcomes[name]
+        report['seconds'][name] = seconds
+        for chart in task_charts:
+            if error is None:
+                report['charts'][chart] = data[chart]
+            else:
+                report['errors'][chart] = error
+    return report
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pandas as pd
+import sqlalchemy as sa
+from flask import Flask
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from config import Config  # noqa: E402
+from database import operations  # noqa: E402
+from database.census import _drops  # noqa: E402
+from database.churn import _churns  # noqa: E402
+from database.dimensions import _label_cache  # noqa: E402
+from database.schema import READ_DTYPES  # noqa: E402
+
+# 测试数据：仓库中的两份样例文件
+CSV_2024 = os.path.join(BACKEND_DIR, 'database', 'Detail_WIL_Participation_Course_Monthly_2024(in).csv')
+CSV_2025 = os.path.join(BACKEND_DIR, 'database', 'Detail_WIL_Participation_Course_Monthly_2025(in)_after.csv')
+
+# 默认每个测试模块用临时目录中的 SQLite 库；设置下面的环境变量后改用 PostgreSQL。
+# 这两个库会被清空重建（DROP SCHEMA public CASCADE），只能指向测试专用的库
+#   TEST_DATABASE_URI            主库
+#   TEST_ANALYTICS_DATABASE_URI  第二个库，作为分析查询的只读副本（test_analytics_routing.py）
+DATABASE_URI_ENV = 'TEST_DATABASE_URI'
+ANALYTICS_DATABASE_URI_ENV = 'TEST_ANALYTICS_DATABASE_URI'
+
+
+def _reset_postgres(uri):
+    engine = sa.create_engine(uri)
+    with engine.begin() as connection:
+        connection.execute(sa.text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+    engine.dispose()
+
+
+def database_uri(tmp_path_factory, name, env=DATABASE_URI_ENV):
+    """测试用的空库：环境变量指定的 PostgreSQL 库（清空），否则为临时目录中的 SQLite 文件"""
+    uri = os.getenv(env)
+    if uri:
+        _reset_postgres(uri)
+        return uri
+    return f"sqlite:///{tmp_path_factory.mktemp(name) / 'test.db'}"
+
+
+def reset_caches():
+    """清空进程内按版本或按维度缓存的结果（切换分析后端或数据库之后调用）"""
+    _drops.clear()
+    _churns.clear()
+    _label_cache.clear()
+
+
+def make_app(uri, tmp_path_factory, **config):
+    """按 Config 建一个只初始化数据库的 Flask 应用（不注册接口，测试直接调用 operations 中的函数）"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=uri,
+        ANALYTICS_STORE_FOLDER=str(tmp_path_factory.mktemp('analytics_store')),
+        ANALYTICS_BACKEND='database',
+        PARSE_WORKERS=1,
+        **config
+    )
+    operations.init_db(app)
+    reset_caches()
+    return app
+
+
+def read_fixture(path):
+    return pd.read_csv(path, usecols=lambda name: name in operations.LOADER_COLUMNS, dtype=READ_DTYPES)
+
+
+def load_fixture(app):
+    """
+    三种快照都导入数据，current 导入两次（第一次的版本保留为历史版本）
+
+    before_census 为 2025 年数据去掉一部分行、再加上一部分 2024 年的行，census 分析中有退出也有新增
+
+    Returns:
+        str: current 历史版本的快照键
+    """
+    previous = read_fixture(CSV_2024)
+    current = read_fixture(CSV_2025)
+    before_census = pd.concat([current.iloc[::7], previous.iloc[:500]], ignore_index=True)
+    with app.app_context():
+        operations.save_to_table(previous, 'previous', content_hash='previous')
+        operations.save_to_table(current.iloc[::2], 'current', content_hash='current-half')
+        operations.save_to_table(current, 'current', content_hash='current')
+        operations.save_to_table(before_census, 'before_census', content_hash='before_census')
+        retained = operations.retained_keys()
+    assert len(retained) == 1
+    return retained[0]
@@ -0,0 +1,141 @@
+import importlib.util
+
+import pytest
+from sqlalchemy import text
+
+from conftest import database_uri, make_app, load_fixture, reset_caches
+from database import aggregates, columnar, operations, student_index
+from database.analytics_store import sync_analytics_store
+from database.census import census_terms
+from database.models import db
+from database.pivot import PRESETS, aggregate, aggregate_query
+
+# 分析后端与数据库的一致性：同一份数据分别在数据库、DuckDB（Parquet 副本）和列式快照上统计，
+# operations.py 中每个分析函数的结果都必须完全相同
+#
+# 预聚合结果和学生位图索引都关闭，所有统计都是实时统计，走的是 ANALYTICS_BACKEND 指定的后端
+BACKENDS = [
+    pytest.param('duckdb', marks=pytest.mark.skipif(
+        importlib.util.find_spec('duckdb') is None, reason='duckdb is not installed'
+    )),
+    'columnar',
+]
+
+# 临时统计：按标签过滤（LIKE）、统计行数、多个快照
+AD_HOC_QUERIES = {
+    'term_1_faculty_gender': aggregate_query(('faculty_descr', 'gender'), filters={'term_descr': '%Term 1'},
+                                             pivot='gender', total='distinct'),
+    'engineering_gender_rows': aggregate_query(('gender',), measure='rows',
+                                               filters={'faculty_descr': 'Faculty of Engineering'}),
+    'faculty_by_snapshot': aggregate_query(('faculty_descr',), snapshots=('before_census', 'current'),
+                                           sort='-total'),
+}
+
+
+def analytics_results(versions):
+    """operations.py 中全部分析函数（以及 /aggregate 的预设和临时统计）的结果"""
+    results = {
+        name: getattr(operations, name)(versions)
+        for name in ('current_participation_gender_data', 'current_equity_cohort_data', 'current_ses_data',
+                     'current_atsi_group_data', 'current_regional_remote_data', 'current_cdev_data',
+                     'current_cdev_gender_data', 'yoy_comparison_faculty_data', 'census_comparison_data')
+    }
+    results['chart_data'] = operations.chart_data(list(operations.CHART_PRESETS), versions)
+    results['census_terms'] = census_terms(versions)
+    for term in results['census_terms']:
+        results[f"census_gender_drop {term}"] = operations.census_gender_drop_by_term_and_faculty(term, versions)
+    for name, query in {**PRESETS, **AD_HOC_QUERIES}.items():
+        results[f"aggregate {name}"] = aggregate(query, versions)
+    return results
+
+
+def run_on_backend(app, backend, versions, monkeypatch=None):
+    """在 backend 上计算全部结果；monkeypatch 时记录后端是否每次都给出了结果（没有回退到数据库）"""
+    app.config['ANALYTICS_BACKEND'] = backend
+    reset_caches()
+    answered = []
+    if monkeypatch is not None:
+        original = aggregates.backend_counts
+
+        def recording(*args, **kwargs):
+            rows = original(*args, **kwargs)
+            answered.append(rows is not None)
+            return rows
+        monkeypatch.setattr(aggregates, 'backend_counts', recording)
+    with app.app_context():
+        sync_analytics_store()
+        return analytics_results(versions), answered
+
+
+@pytest.fixture(scope='module')
+def parity_app(tmp_path_factory):
+    app = make_app(database_uri(tmp_path_factory, 'parity'), tmp_path_factory,
+                   AGGREGATE_CUBES=False, STUDENT_INDEX=False, SNAPSHOT_HISTORY_COUNT=1)
+    app.retained_key = load_fixture(app)
+    return app
+
+
+@pytest.fixture(scope='module')
+def expected(parity_app):
+    return {
+        version: run_on_backend(parity_app, 'database', versions)[0]
+        for version, versions in (('live', None), ('retained', {'current': parity_app.retained_key}))
+    }
+
+
+@pytest.mark.parametrize('version', ['live', 'retained'])
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_matches_database(parity_app, expected, backend, version, monkeypatch):
+    versions = {'current': parity_app.retained_key} if version == 'retained' else None
+    # 列式快照分块写入，块的边界不对齐时结果也要一致
+    monkeypatch.setattr(columnar, 'EXPORT_CHUNK_SIZE', 997)
+    actual, answered = run_on_backend(parity_app, backend, versions, monkeypatch)
+
+    assert answered and all(answered), f"{backend} fell back to the database"
+    assert actual.keys() == expected[version].keys()
+    for name, result in expected[version].items():
+        assert actual[name] == result, name
+
+
+@pytest.mark.parametrize('version', ['live', 'retained'])
+def test_student_index_matches_database(parity_app, expected, version, monkeypatch):
+    """去重人数由学生位图索引回答（没有安装 pyroaring 时为 NumPy 数组）时结果同样一致"""
+    versions = {'current': parity_app.retained_key} if version == 'retained' else None
+    monkeypatch.setitem(parity_app.config, 'STUDENT_INDEX', True)
+    monkeypatch.setattr(student_index, '_indexes', {})
+    answered = []
+    original = aggregates._index_counts
+
+    def recording(*args, **kwargs):
+        rows = original(*args, **kwargs)
+        answered.append(rows is not None)
+        return rows
+    monkeypatch.setattr(aggregates, '_index_counts', recording)
+
+    actual, _ = run_on_backend(parity_app, 'database', versions)
+    assert any(answered)
+    assert actual == expected[version]
+
+
+def test_student_numbers_do_not_grow_across_rebuilds(parity_app, monkeypatch):
+    """学生编号在每个版本内分配：重复建立同一版本的索引，编号范围不变"""
+    monkeypatch.setitem(parity_app.config, 'STUDENT_INDEX', True)
+    monkeypatch.setattr(student_index, '_indexes', {})
+    with parity_app.app_context():
+        largest = []
+        for _ in range(3):
+            student_index.refresh_student_index('current', aggregates.AGGREGATE_CUBES)
+            (index,) = [index for index in student_index._indexes.values()]
+            largest.append(max(max(bitmap) for bitmap in index.cubes['faculty'].values() if len(bitmap)))
+        students = db.session.execute(text(
+            "SELECT COUNT(DISTINCT masked_id) FROM enrollment_fact WHERE snapshot = 'current'"
+        )).scalar()
+    # faculty 统计覆盖全部行：编号正好是 0 .. 学生数 - 1
+    assert largest == [students - 1] * 3
+
+
+def test_fixture_covers_every_analysis(expected):
+    """数据要让每个分析都有结果，否则上面的比较没有意义"""
+    for name, result in expected['live'].items():
+        assert result, name
+    assert expected['live'] != expected['retained']
@@ -0,0 +1,143 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask
+from sqlalchemy import event, text
+
+from config import Config
+from conftest import (database_uri, make_app, read_fixture, reset_caches, CSV_2024, CSV_2025,
+                      ANALYTICS_DATABASE_URI_ENV)
+from database import operations
+from database.engines import ANALYTICS_BIND, configure_engines, pool_stats, read_session
+from database.models import db
+from database.pivot import PRESETS, aggregate
+
+# 读写分离：导入走写连接池（主库），分析查询走 analytics 连接池（ANALYTICS_DATABASE_URI 指定的第二个库）
+#
+# 第二个库充当只读副本，但故意放不同的数据（副本中是 2024 年的 current，主库中是 2025 年的），
+# 分析结果与副本一致就说明查询确实发到了副本
+WRITE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|CREATE|DROP|ALTER|COPY|TRUNCATE)\b', re.IGNORECASE)
+FACT_READ = re.compile(r'^\s*SELECT\b.*\benrollment_fact\b', re.IGNORECASE | re.DOTALL)
+
+ANALYTICS_TIMEOUT_MS = 45000
+
+
+def analytics_results():
+    return {
+        'participation': operations.current_participation_gender_data(),
+        'faculty_ses': aggregate(PRESETS['faculty_ses']),
+    }
+
+
+@contextmanager
+def recorded_statements(engine):
+    """记录 engine 上执行的 SQL（PostgreSQL 上的 COPY 走原始游标，不会出现在这里）"""
+    statements = []
+
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def _fact_rows(session):
+    return session.execute(text("SELECT COUNT(*) FROM enrollment_fact WHERE snapshot = 'current'")).scalar()
+
+
+@pytest.fixture(scope='module')
+def databases(tmp_path_factory):
+    writer = database_uri(tmp_path_factory, 'writer')
+    replica = database_uri(tmp_path_factory, 'replica', env=ANALYTICS_DATABASE_URI_ENV)
+    options = dict(AGGREGATE_CUBES=False, STUDENT_INDEX=False)
+
+    replica_app = make_app(replica, tmp_path_factory, **options)
+    with replica_app.app_context():
+        operations.save_to_table(read_fixture(CSV_2024), 'current')
+        replica_results = analytics_results()
+
+    writer_app = make_app(writer, tmp_path_factory, **options)
+    # 最后初始化的应用的连接池由 pool_stats 统计
+    app = make_app(writer, tmp_path_factory, ANALYTICS_DATABASE_URI=replica,
+                   ANALYTICS_STATEMENT_TIMEOUT_MS=ANALYTICS_TIMEOUT_MS, **options)
+    return {'app': app, 'writer_app': writer_app, 'replica_results': replica_results}
+
+
+def test_save_to_table_writes_through_writer(databases):
+    app = databases['app']
+    with app.app_context():
+        replica_rows = _fact_rows(read_session())
+        with recorded_statements(db.engine) as writer_sql, \
+                recorded_statements(db.engines[ANALYTICS_BIND]) as analytics_sql:
+            report = operations.save_to_table(read_fixture(CSV_2025), 'current')
+
+        assert any(WRITE.match(statement) for statement in writer_sql)
+        assert not [statement for statement in analytics_sql if WRITE.match(statement)]
+        assert _fact_rows(db.session) == report['rows']
+        reset_caches()
+        assert _fact_rows(read_session()) == replica_rows != report['rows']
+
+
+def test_analytics_reads_go_to_the_analytics_bind(databases):
+    app = databases['app']
+    with databases['writer_app'].app_context():
+        reset_caches()
+        writer_results = analytics_results()
+
+    with app.app_context():
+        reset_caches()
+        with recorded_statements(db.engine) as writer_sql, \
+                recorded_statements(db.engines[ANALYTICS_BIND]) as analytics_sql:
+            results = analytics_results()
+
+    assert any(FACT_READ.match(statement) for statement in analytics_sql)
+    assert not [statement for statement in writer_sql if FACT_READ.match(statement)]
+    assert results == databases['replica_results']
+    assert results != writer_results
+
+
+def test_pool_stats_reports_both_pools(databases):
+    app = databases['app']
+    with app.app_context():
+        stats = pool_stats()
+        assert stats['writer']['url'] == db.engine.url.render_as_string(hide_password=True)
+        assert stats[ANALYTICS_BIND]['url'] == db.engines[ANALYTICS_BIND].url.render_as_string(hide_password=True)
+    assert stats['writer']['url'] != stats[ANALYTICS_BIND]['url']
+    for name in ('writer', ANALYTICS_BIND):
+        assert stats[name]['checkouts'] > 0
+        assert stats[name]['peak_in_use'] >= 1
+
+
+def test_pools_are_configured_separately():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='postgresql://writer-host/wil', ANALYTICS_DATABASE_URI='postgresql://replica-host/wil',
+        WRITER_POOL_SIZE=3, WRITER_MAX_OVERFLOW=1, WRITER_STATEMENT_TIMEOUT_MS=0,
+        ANALYTICS_POOL_SIZE=7, ANALYTICS_MAX_OVERFLOW=2, ANALYTICS_STATEMENT_TIMEOUT_MS=1500
+    )
+    configure_engines(app)
+
+    writer = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    analytics = app.config['SQLALCHEMY_BINDS'][ANALYTICS_BIND]
+    assert (writer['pool_size'], writer['max_overflow']) == (3, 1)
+    assert 'connect_args' not in writer
+    assert analytics['url'] == 'postgresql://replica-host/wil'
+    assert (analytics['pool_size'], analytics['max_overflow']) == (7, 2)
+    assert analytics['connect_args'] == {'options': '-c statement_timeout=1500'}
+
+
+def test_statement_timeouts_apply_per_pool(databases):
+    app = databases['app']
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('statement_timeout is only set on PostgreSQL')
+        with db.engine.connect() as connection:
+            writer_timeout = connection.execute(text("SHOW statement_timeout")).scalar()
+        with db.engines[ANALYTICS_BIND].connect() as connection:
+            analytics_timeout = connection.execute(text("SHOW statement_timeout")).scalar()
+    assert writer_timeout == '0'
+    assert analytics_timeout == f"{ANALYTICS_TIMEOUT_MS // 1000}s"
@@ -0,0 +1,72 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import database_uri, make_app
+from database.models import db, IngestJob
+from services import ingest_jobs
+
+# 后台导入任务的恢复：只重新执行执行进程已经退出的 running 任务，仍在执行的任务（即使很久没有进度）不重复执行
+HOST = socket.gethostname()
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, job_id):
+        self.submitted.append(job_id)
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def app(tmp_path_factory, monkeypatch):
+    app = make_app(database_uri(tmp_path_factory, 'jobs'), tmp_path_factory, JOB_HEARTBEAT_SECONDS=0.05)
+    monkeypatch.setattr(ingest_jobs, '_app', app)
+    monkeypatch.setattr(ingest_jobs, '_executor', RecordingExecutor())
+    return app
+
+
+def _add_job(job_id, worker, heartbeat):
+    db.session.add(IngestJob(id=job_id, analysis_mode='default', status='running', stages={}, files=[],
+                             worker=worker, heartbeat=heartbeat))
+    db.session.commit()
+
+
+def test_resume_only_jobs_whose_worker_is_gone(app):
+    stale = time.time() - app.config['JOB_STALE_SECONDS'] - 1
+    with app.app_context():
+        _add_job('alive', f"{HOST}:{os.getppid()}", stale)
+        _add_job('exited', f"{HOST}:{_dead_pid()}", stale)
+        _add_job('restarted', f"{HOST}:{os.getpid()}", stale)
+        _add_job('remote_fresh', 'other-host:1', time.time())
+        _add_job('remote_stale', 'other-host:2', stale)
+        resumed = ingest_jobs.resume_unfinished_jobs()
+        sqlite = db.engine.dialect.name == 'sqlite'
+
+    expected = {'exited', 'restarted'} if sqlite else {'exited', 'restarted', 'remote_stale'}
+    assert set(resumed) == expected
+    assert set(ingest_jobs._executor.submitted) == expected
+
+
+def test_heartbeat_runs_without_progress_callbacks(app):
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            pytest.skip('heartbeats are not written on SQLite')
+        _add_job('long_phase', f"{HOST}:{os.getpid()}", 0.0)
+        heartbeat = ingest_jobs.JobHeartbeat('long_phase').start()
+        try:
+            time.sleep(0.3)
+        finally:
+            heartbeat.stop()
+        db.session.expire_all()
+        assert db.session.get(IngestJob, 'long_phase').heartbeat > time.time() - 1
@@ -0,0 +1,88 @@
+import re
+
+import pytest
+from sqlalchemy import event, text
+
+from conftest import database_uri, make_app, read_fixture, CSV_2024, CSV_2025
+from database import operations
+from database.aggregates import AGGREGATE_CUBES, _database_counts
+from database.models import db, SnapshotAggregate
+from database.versions import version_key
+
+# 导入过程：PostgreSQL 上 swap 导入的换分区必须是提交前的最后一步，
+# 之前的建索引、预聚合、版本记录都在 staging 表上完成，期间其它快照（和本快照的旧数据）照常可读
+LOCKING = re.compile(r'^\s*(ALTER TABLE \w+ (DETACH|ATTACH) PARTITION|DROP TABLE|ALTER (TABLE|INDEX) \w+ RENAME)\b',
+                     re.IGNORECASE)
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    app = make_app(database_uri(tmp_path_factory, 'loads'), tmp_path_factory, STUDENT_INDEX=False)
+    with app.app_context():
+        operations.save_to_table(read_fixture(CSV_2024), 'previous')
+        operations.save_to_table(read_fixture(CSV_2024), 'current')
+    return app
+
+
+def _blocked_read(snapshot):
+    """在另一个连接上读取 snapshot，拿不到锁时立即失败"""
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text("SET lock_timeout = '200ms'"))
+        return connection.execute(text(
+            "SELECT COUNT(*) FROM enrollment_fact WHERE snapshot = :snapshot"
+        ), {'snapshot': snapshot}).scalar()
+
+
+@pytest.mark.parametrize('history', [0, 1])
+def test_swap_is_the_last_step_before_commit(app, history, monkeypatch):
+    monkeypatch.setitem(app.config, 'SNAPSHOT_HISTORY_COUNT', history)
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            pytest.skip('partition swap only runs on PostgreSQL')
+
+        statements = []
+        reads = {}
+        original = operations.record_fingerprint
+
+        def reading(*args, **kwargs):
+            # 预聚合和版本记录已经在导入事务中完成，此时其它连接仍然可以读取所有快照
+            reads['previous'] = _blocked_read('previous')
+            reads['current'] = _blocked_read('current')
+            return original(*args, **kwargs)
+        monkeypatch.setattr(operations, 'record_fingerprint', reading)
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        before = _blocked_read('current')
+        rows = read_fixture(CSV_2025)
+        if len(rows) == before:
+            rows = read_fixture(CSV_2024)
+        try:
+            report = operations.save_to_table(rows, 'current', load_mode='swap')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert reads['previous'] > 0 and reads['current'] > 0
+        assert reads['current'] == before != report['rows']
+        # 第一次挂载（保留的旧版本）或卸载分区之后只剩下锁事实表的语句
+        first = next(number for number, statement in enumerate(statements) if 'TACH PARTITION' in statement)
+        tail = [statement for statement in statements[first:] if not statement.lstrip().upper().startswith('SET')]
+        assert all(LOCKING.match(statement) for statement in tail), tail
+        assert _blocked_read('current') == report['rows']
+        # 从 staging 表算出的预聚合结果与换入后的分区上实时统计的结果相同
+        assert report['aggregates_refreshed'] == len(AGGREGATE_CUBES)
+        for spec in AGGREGATE_CUBES:
+            stored = db.session.get(SnapshotAggregate, ('current', spec.name)).rows
+            live = _database_counts(spec, ('current',), spec.columns, {}, session=db.session)
+            assert sorted(map(tuple, stored), key=repr) == sorted(live, key=repr), spec.name
+
+        # 默认不保留历史；保留时旧数据复制到独立的表，最后才挂成分区，同样可以按版本查询
+        if history:
+            key = version_key(report['retained_version'])
+            assert _blocked_read(key) == before
+            assert key in operations.retained_keys()
+        else:
+            assert report['retained_version'] is None
+            assert not [statement for statement in statements if 'INSERT INTO enrollment_fact_v' in statement]
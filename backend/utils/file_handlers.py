@@ -15,4 +15,28 @@ def save_uploaded_file(file):
     filename = secure_filename(file.filename)
     file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
     file.save(file_path)
-    return file_path
\ No newline at end of file
+    return file_path
+
+def save_job_files(job_id, files):
+    """把一批上传文件保存到任务目录，返回 [(path, 原始文件名), ...]"""
+    job_folder = os.path.join(Config.UPLOAD_FOLDER, 'jobs', job_id)
+    os.makedirs(job_folder, exist_ok=True)
+
+    saved = []
+    for index, file in enumerate(files):
+        file_path = os.path.join(job_folder, f"{index}_{secure_filename(file.filename)}")
+        file.save(file_path)
+        saved.append((file_path, file.filename))
+    return saved
+
+
+class StoredUpload:
+    """磁盘上已保存的上传文件，提供和 FileStorage 一样的 filename / stream 接口"""
+
+    def __init__(self, path, filename):
+        self.path = path
+        self.filename = filename
+        self.stream = open(path, 'rb')
+
+    def close(self):
+        self.stream.close()
@@ -0,0 +1,143 @@
+from operator import itemgetter
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# 默认每块解析的行数，峰值内存由它决定而不是由文件大小决定
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def _usecols(columns):
+    """只解析需要的列；用 callable 以便容忍文件里缺失的列"""
+    if columns is None:
+        return None
+    wanted = set(columns)
+    return lambda name: name in wanted
+
+
+def iter_csv_chunks(stream, columns=None, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """直接从字节流分块解析 CSV，不先整体 read()/decode 到内存"""
+    stream.seek(0)
+    reader = pd.read_csv(
+        stream,
+        encoding='utf-8',
+        usecols=_usecols(columns),
+        dtype=dtype,
+        chunksize=chunk_size
+    )
+    for chunk in reader:
+        yield chunk
+
+
+def _apply_dtype(frame, dtype):
+    if dtype:
+        frame = frame.astype({name: kind for name, kind in dtype.items() if name in frame.columns})
+    return frame
+
+
+def _typed_frame(rows, names, dtype):
+    """把一批行元组整列构造成 DataFrame，并按 dtype 转换列类型"""
+    return _apply_dtype(pd.DataFrame.from_records(rows, columns=names), dtype)
+
+
+def iter_excel_chunks(source, columns=None, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                      sheet_name=None, nrows=None):
+    """
+    用 openpyxl 只读模式逐行流式读取 .xlsx，每 chunk_size 行产出一个 DataFrame
+
+    不加载样式和单元格对象树，峰值内存只与块大小有关；
+    sheet_name 为空时读取第一个工作表，nrows 限制最多读取的数据行数
+    """
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        if sheet_name is None:
+            sheet = workbook.worksheets[0]
+        elif sheet_name in workbook.sheetnames:
+            sheet = workbook[sheet_name]
+        else:
+            raise ValueError(f"Worksheet {sheet_name} not found, available: {workbook.sheetnames}")
+
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        # 只取需要的列（文件里缺失的列直接忽略），空表头的列跳过
+        wanted = set(columns) if columns is not None else None
+        positions = [
+            position for position, name in enumerate(header)
+            if name is not None and (wanted is None or name in wanted)
+        ]
+        names = [str(header[position]) for position in positions]
+        if not positions:
+            yield pd.DataFrame(columns=names)
+            return
+        width = max(positions) + 1
+        pick = itemgetter(*positions) if len(positions) > 1 else (lambda row: (row[positions[0]],))
+
+        batch = []
+        read = 0
+        for row in rows:
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            values = pick(row)
+            # 只读模式下表尾常有整行空白，跳过
+            if all(value is None for value in values):
+                continue
+            batch.append(values)
+            read += 1
+            if len(batch) >= chunk_size:
+                yield _typed_frame(batch, names, dtype)
+                batch = []
+            if nrows is not None and read >= nrows:
+                break
+        if batch or read == 0:
+            yield _typed_frame(batch, names, dtype)
+    finally:
+        workbook.close()
+
+
+def read_excel_frame(source, columns=None, dtype=None, sheet_name=None, nrows=None):
+    """流式读取 .xlsx 并拼成一个 DataFrame（需要整表时使用）"""
+    chunks = list(iter_excel_chunks(source, columns=columns, dtype=dtype,
+                                    sheet_name=sheet_name, nrows=nrows))
+    if not chunks:
+        return pd.DataFrame(columns=list(columns or []))
+    if len(chunks) == 1:
+        return chunks[0]
+    # 各块的 category 取值不同，拼接后会退化成普通字符串列，需要重新转换
+    return _apply_dtype(pd.concat(chunks, ignore_index=True), dtype)
+
+
+def iter_file_chunks(file, columns=None, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE, sheet_name=None):
+    """按文件类型分块读取上传文件（CSV 和 .xlsx 流式，旧版 .xls 整表读取后作为一块返回）"""
+    filename = file.filename.lower()
+
+    if filename.endswith('.csv'):
+        yield from iter_csv_chunks(file.stream, columns=columns, dtype=dtype, chunk_size=chunk_size)
+    elif filename.endswith('.xlsx'):
+        yield from iter_excel_chunks(file.stream, columns=columns, dtype=dtype, chunk_size=chunk_size,
+                                     sheet_name=sheet_name)
+    elif filename.endswith('.xls'):
+        file.stream.seek(0)
+        yield pd.read_excel(file.stream, sheet_name=sheet_name or 0, usecols=_usecols(columns), dtype=dtype)
+    else:
+        raise ValueError(f"Unsupported file format: {filename}")
+
+
+def read_column_sample(file, column, nrows, sheet_name=None):
+    """只读取表头和指定列的前 nrows 行，用于在完整解析之前快速探测文件内容"""
+    filename = file.filename.lower()
+    file.stream.seek(0)
+    try:
+        if filename.endswith('.csv'):
+            return pd.read_csv(file.stream, encoding='utf-8', usecols=_usecols([column]), nrows=nrows)
+        if filename.endswith('.xlsx'):
+            return read_excel_frame(file.stream, columns=[column], sheet_name=sheet_name, nrows=nrows)
+        if filename.endswith('.xls'):
+            return pd.read_excel(file.stream, sheet_name=sheet_name or 0, usecols=_usecols([column]), nrows=nrows)
+        raise ValueError(f"Unsupported file format: {filename}")
+    finally:
+        file.stream.seek(0)
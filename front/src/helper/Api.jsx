@@ -19,12 +19,44 @@ export const uploadFile = (file, fileType = 2) => {
   });
 };
 
-// 批量文件上传（新版接口）
-export const batchUploadFiles = (files, analysisMode) => {
+// 查询后台导入任务状态
+export const getJobStatus = (jobId) => {
+  return axios.get(`${baseURL}/jobs/${jobId}`);
+};
+
+// 轮询导入任务直到完成，返回与原同步接口相同结构的响应（data.result 为导入结果）
+const JOB_POLL_INTERVAL = 1000;
+
+export const waitForJob = async (jobId, onProgress) => {
+  for (;;) {
+    const response = await getJobStatus(jobId);
+    const job = response.data.result;
+    if (response.data.code !== 200) {
+      throw new Error(response.data.message);
+    }
+    if (onProgress) {
+      onProgress(job);
+    }
+    if (job.status === 'succeeded') {
+      return { ...response, data: { ...response.data, result: job.result } };
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Ingest job failed');
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+  }
+};
+
+// 批量文件上传（新版接口）：后端入队后立即返回任务id，这里轮询到导入完成
+export const batchUploadFiles = async (files, analysisMode, onProgress, loadMode) => {
   const formData = new FormData();
   
   // 添加分析模式
   formData.append("analysis_mode", analysisMode);
+  // 可选导入方式，增量文件传 'merge'
+  if (loadMode) {
+    formData.append("load_mode", loadMode);
+  }
   
   // 添加文件列表
   files.forEach((file) => {
@@ -32,11 +64,19 @@ export const batchUploadFiles = (files, analysisMode) => {
   });
   
 
-  return axios.post(`${baseURL}/batch_upload`, formData, {
+  const response = await axios.post(`${baseURL}/batch_upload`, formData, {
     headers: {
       "Content-Type": "multipart/form-data",
     },
   });
+  if (response.data.code !== 200) {
+    throw new Error(response.data.message);
+  }
+  // 文件与目标表现有内容完全相同时后端不入队，直接返回结果
+  if (response.data.result.status === 'succeeded') {
+    return { ...response, data: { ...response.data, result: response.data.result.result } };
+  }
+  return waitForJob(response.data.result.job_id, onProgress);
 };
 
 // 智能上传：根据选择的模式自动选择合适的上传方式
@@ -120,6 +160,11 @@ export const getCensusComparison = () => {
   return axios.get(`${baseURL}/census_comparison`);
 };
 
+// 获取Census Day drop分析可选的term（来自已上传的数据）
+export const getCensusTerms = () => {
+  return axios.get(`${baseURL}/census_terms`);
+};
+
 // 获取Census Day性别drop分析
 export const getCensusGenderDrop = (term) => {
   return axios.get(`${baseURL}/census_gender_drop`, {
@@ -127,6 +172,13 @@ export const getCensusGenderDrop = (term) => {
   });
 };
 
+// 一次获取报告中所有图表的数据（charts 为图表 id 列表，term 为 Census Day drop 图表的学期）
+export const getReport = (mode, charts, term) => {
+  return axios.get(`${baseURL}/report`, {
+    params: { mode: mode, charts: charts.join(','), term: term }
+  });
+};
+
 // ===== 通用分析 API =====
 
 // 获取聚合数据（旧版接口）
@@ -254,6 +306,8 @@ export const getFileRequirements = (reportOptions) => {
 export default {
   uploadFile,
   batchUploadFiles,
+  getJobStatus,
+  waitForJob,
   smartUpload,
   getAnalysisMode,
   getParticipationGenderData,
@@ -261,6 +315,8 @@ export default {
   getCdevData,
   getYoYComparison,
   getCensusComparison,
+  getCensusTerms,
+  getReport,
   getAggData,
   getCurrentAnalysis,
   sendEmail,
@@ -12,7 +12,7 @@ import Chart10YoYResidency from './Chart10YoYResidency';
 import Chart_Census1 from './Chart_Census1';
 import AISummary from './AISummary';
 import ChartOptions from './ChartOptions';
-import { getParticipationGenderData, getEquityCohortData, getCdevData, getYoYComparison, getCensusGenderDrop } from '../../helper/Api';
+import { getReport } from '../../helper/Api';
 import { Box, Typography } from '@mui/material';
 import { Context } from '../../context/context';
 import html2canvas from 'html2canvas';
@@ -104,347 +104,330 @@ const EditReport = () => {
     setChartOptions(options);
   }, [analysisMode]);
 
-  useEffect(() => {
-    getParticipationGenderData()
-      .then(res => {
-        // chart1: 按faculty展示Female和Male百分比
-        let chart1 = [];
-        let chart2 = [];
-        if (res.data && res.data.result) {
-          // chart1数据
-          const facultyArr = res.data.result["gender proportion in WIL"];
-          if (Array.isArray(facultyArr)) {
-            chart1 = facultyArr.map(faculty => {
-              const f = faculty.gender_counts.F || 0;
-              const m = faculty.gender_counts.M || 0;
-              const u = faculty.gender_counts.U || 0;
-              const total = faculty.total_count || 1;
-              return {
-                name: faculty.faculty_descr,
-                Female: Number(((f / total) * 100).toFixed(2)),
-                Male: Number(((m / total) * 100).toFixed(2)),
-                U: Number(((u / total) * 100).toFixed(2))
-              };
-            });
-          }
-          // chart2数据（原有逻辑）
-          const facultyData = res.data.result["gender proportion in WIL"];
-          if (Array.isArray(facultyData)) {
-            const genderTotals = {};
-            facultyData.forEach(faculty => {
-              if (faculty && faculty.gender_counts && typeof faculty.gender_counts === 'object') {
-                Object.entries(faculty.gender_counts).forEach(([genderKey, count]) => {
-                  let genderName = genderKey;
-                  switch(genderKey.toUpperCase()) {
-                    case 'F': genderName = 'Female'; break;
-                    case 'M': genderName = 'Male'; break;
-                    case 'U': genderName = 'Unspecified'; break;
-                    default: genderName = genderKey;
-                  }
-                  genderTotals[genderName] = (genderTotals[genderName] || 0) + count;
-                });
+  // 以下函数把 /report 返回的各图表数据整理成图表组件需要的结构（数据缺失时清空图表）
+
+  // Gender Participation数据（Chart1和Chart2）
+  const applyGenderData = (result) => {
+    // chart1: 按faculty展示Female和Male百分比
+    let chart1 = [];
+    let chart2 = [];
+    if (result) {
+      // chart1数据
+      const facultyArr = result["gender proportion in WIL"];
+      if (Array.isArray(facultyArr)) {
+        chart1 = facultyArr.map(faculty => {
+          const f = faculty.gender_counts.F || 0;
+          const m = faculty.gender_counts.M || 0;
+          const u = faculty.gender_counts.U || 0;
+          const total = faculty.total_count || 1;
+          return {
+            name: faculty.faculty_descr,
+            Female: Number(((f / total) * 100).toFixed(2)),
+            Male: Number(((m / total) * 100).toFixed(2)),
+            U: Number(((u / total) * 100).toFixed(2))
+          };
+        });
+      }
+      // chart2数据（原有逻辑）
+      const facultyData = result["gender proportion in WIL"];
+      if (Array.isArray(facultyData)) {
+        const genderTotals = {};
+        facultyData.forEach(faculty => {
+          if (faculty && faculty.gender_counts && typeof faculty.gender_counts === 'object') {
+            Object.entries(faculty.gender_counts).forEach(([genderKey, count]) => {
+              let genderName = genderKey;
+              switch(genderKey.toUpperCase()) {
+                case 'F': genderName = 'Female'; break;
+                case 'M': genderName = 'Male'; break;
+                case 'U': genderName = 'Unspecified'; break;
+                default: genderName = genderKey;
               }
+              genderTotals[genderName] = (genderTotals[genderName] || 0) + count;
             });
-            chart2 = Object.entries(genderTotals)
-              .filter(([gender, count]) => count > 0)
-              .map(([gender, count]) => ({ gender, count }))
-              .sort((a, b) => {
-                // 确保Female在左侧，Male在右侧
-                if (a.gender === 'Female' && b.gender === 'Male') return -1;
-                if (a.gender === 'Male' && b.gender === 'Female') return 1;
-                if (a.gender === 'Female') return -1;
-                if (b.gender === 'Female') return 1;
-                return b.count - a.count; // 其他按数量排序
-              });
           }
-        }
-        setChart1Data(chart1);
-        setChart2Data(chart2);
-      })
-      .catch(() => {
-        setChart1Data([]);
-        setChart2Data([]);
-      });
-  }, []);
+        });
+        chart2 = Object.entries(genderTotals)
+          .filter(([gender, count]) => count > 0)
+          .map(([gender, count]) => ({ gender, count }))
+          .sort((a, b) => {
+            // 确保Female在左侧，Male在右侧
+            if (a.gender === 'Female' && b.gender === 'Male') return -1;
+            if (a.gender === 'Male' && b.gender === 'Female') return 1;
+            if (a.gender === 'Female') return -1;
+            if (b.gender === 'Female') return 1;
+            return b.count - a.count; // 其他按数量排序
+          });
+      }
+    }
+    setChart1Data(chart1);
+    setChart2Data(chart2);
+  };
 
-  // 获取Equity Cohort数据（Chart3, Chart4, Chart5, Chart6）
-  useEffect(() => {
-    setEquityDataLoading(true);
-    getEquityCohortData()
-      .then(res => {
-        let chart3 = [];
-        let chart4 = [];
-        let chart5 = [];
-        let chart6 = [];
-        
+  // Equity Cohort数据（Chart3, Chart4, Chart5, Chart6）
+  const applyEquityData = (result) => {
+    let chart3 = [];
+    let chart4 = [];
+    let chart5 = [];
+    let chart6 = [];
+
+
+    if (result) {
+      // Chart3: First Generation数据
+      const firstGenData = result["first generation"];
+      if (Array.isArray(firstGenData)) {
+        chart3 = firstGenData.map(faculty => {
+          const firstGen = faculty["First Generation"] || 0;
+          const nonFirstGen = faculty["Non First Generation"] || 0;
+          const total = faculty.total || 1;
+          return {
+            name: faculty.faculty_descr,
+            FirstGeneration: Number(((firstGen / total) * 100).toFixed(2)),
+            NonFirstGeneration: Number(((nonFirstGen / total) * 100).toFixed(2))
+          };
+        });
+      }
 
-        if (res.data && res.data.result) {
-          // Chart3: First Generation数据
-          const firstGenData = res.data.result["first generation"];
-          if (Array.isArray(firstGenData)) {
-            chart3 = firstGenData.map(faculty => {
-              const firstGen = faculty["First Generation"] || 0;
-              const nonFirstGen = faculty["Non First Generation"] || 0;
-              const total = faculty.total || 1;
-              return {
-                name: faculty.faculty_descr,
-                FirstGeneration: Number(((firstGen / total) * 100).toFixed(2)),
-                NonFirstGeneration: Number(((nonFirstGen / total) * 100).toFixed(2))
-              };
-            });
-          }
+      // Chart4: SES数据
+      const sesData = result["ses"];
+      if (Array.isArray(sesData)) {
+        chart4 = sesData.map(faculty => {
+          const high = faculty.High || 0;
+          const low = faculty.Low || 0;
+          const medium = faculty.Medium || 0;
+          const unknown = faculty.Unknown || 0;
+          const total = faculty.total || 1;
+          return {
+            name: faculty.faculty_descr,
+            High: Number(((high / total) * 100).toFixed(2)),
+            Low: Number(((low / total) * 100).toFixed(2)),
+            Medium: Number(((medium / total) * 100).toFixed(2)),
+            Unknown: Number(((unknown / total) * 100).toFixed(2))
+          };
+        });
+      }
 
-          // Chart4: SES数据
-          const sesData = res.data.result["ses"];
-          if (Array.isArray(sesData)) {
-            chart4 = sesData.map(faculty => {
-              const high = faculty.High || 0;
-              const low = faculty.Low || 0;
-              const medium = faculty.Medium || 0;
-              const unknown = faculty.Unknown || 0;
-              const total = faculty.total || 1;
-              return {
-                name: faculty.faculty_descr,
-                High: Number(((high / total) * 100).toFixed(2)),
-                Low: Number(((low / total) * 100).toFixed(2)),
-                Medium: Number(((medium / total) * 100).toFixed(2)),
-                Unknown: Number(((unknown / total) * 100).toFixed(2))
-              };
+      // Chart5: Indigenous数据
+      const indigenousData = result["atsi group"];
+
+      if (Array.isArray(indigenousData)) {
+        chart5 = indigenousData.map(faculty => {
+          const indigenous = faculty["Indigenous"] || 0;
+          const nonIndigenous = faculty["Non Indigenous"] || 0;
+          const total = faculty.total || 1;
+          return {
+            name: faculty.faculty_descr,
+            Indigenous: Number(((indigenous / total) * 100).toFixed(2)),
+            NonIndigenous: Number(((nonIndigenous / total) * 100).toFixed(2))
+          };
+        });
+      }
+
+      // Chart6: Regional Remote数据
+      const regionalData = result["regional remote"];
+      if (Array.isArray(regionalData)) {
+        chart6 = regionalData.map(region => ({
+          regional_remote: region.regional_remote,
+          count: region.count
+        }));
+      }
+    }
+
+    setChart3Data(chart3);
+    setChart4Data(chart4);
+    setChart5Data(chart5);
+    setChart6Data(chart6);
+  };
+
+  // CDEV数据（Chart7和Chart8）
+  const applyCdevData = (result) => {
+    if (!result) {
+      setChart7ResidencyTypes([]);
+    }
+    let chart7 = [];
+    let chart8 = [];
+
+    if (result) {
+      // Chart7: CDEV Residency数据
+      const residencyData = result["CDEV by Residency and Course"];
+      if (Array.isArray(residencyData)) {
+        // 首先收集所有可能的residency类别
+        const allResidencyTypes = new Set();
+        residencyData.forEach(course => {
+          if (Array.isArray(course.residency_breakdown)) {
+            course.residency_breakdown.forEach(item => {
+              allResidencyTypes.add(item.residency_group_descr);
             });
           }
+        });
+
+        // 转换数据，动态处理所有residency类别
+        chart7 = residencyData.map(course => {
+          const courseData = { 
+            name: course.course_name || course.course_code,
+            total: course.total || 0  // 保留total字段
+          };
+
+          // 为所有类别初始化为0
+          allResidencyTypes.forEach(type => {
+            courseData[type] = 0;
+          });
 
-          // Chart5: Indigenous数据
-          const indigenousData = res.data.result["atsi group"];
-          
-          if (Array.isArray(indigenousData)) {
-            chart5 = indigenousData.map(faculty => {
-              const indigenous = faculty["Indigenous"] || 0;
-              const nonIndigenous = faculty["Non Indigenous"] || 0;
-              const total = faculty.total || 1;
-              return {
-                name: faculty.faculty_descr,
-                Indigenous: Number(((indigenous / total) * 100).toFixed(2)),
-                NonIndigenous: Number(((nonIndigenous / total) * 100).toFixed(2))
-              };
+          // 处理residency_breakdown数据
+          if (Array.isArray(course.residency_breakdown)) {
+            course.residency_breakdown.forEach(item => {
+              courseData[item.residency_group_descr] = item.count;
             });
           }
 
-          // Chart6: Regional Remote数据
-          const regionalData = res.data.result["regional remote"];
-          if (Array.isArray(regionalData)) {
-            chart6 = regionalData.map(region => ({
-              regional_remote: region.regional_remote,
-              count: region.count
-            }));
-          }
-        }
-        
-        setChart3Data(chart3);
-        setChart4Data(chart4);
-        setChart5Data(chart5);
-        setChart6Data(chart6);
-      })
-      .catch(() => {
-        setChart3Data([]);
-        setChart4Data([]);
-        setChart5Data([]);
-        setChart6Data([]);
-      })
-      .finally(() => {
-        setEquityDataLoading(false);
-      });
-  }, []);
+          return courseData;
+        });
 
-  // 获取CDEV数据（Chart7和Chart8）
-  useEffect(() => {
-    setCdevDataLoading(true);
-    getCdevData()
-      .then(res => {
-        let chart7 = [];
-        let chart8 = [];
-        
-        if (res.data && res.data.result) {
-          // Chart7: CDEV Residency数据
-          const residencyData = res.data.result["CDEV by Residency and Course"];
-          if (Array.isArray(residencyData)) {
-            // 首先收集所有可能的residency类别
-            const allResidencyTypes = new Set();
-            residencyData.forEach(course => {
-              if (Array.isArray(course.residency_breakdown)) {
-                course.residency_breakdown.forEach(item => {
-                  allResidencyTypes.add(item.residency_group_descr);
-                });
-              }
-            });
-            
-            // 转换数据，动态处理所有residency类别
-            chart7 = residencyData.map(course => {
-              const courseData = { 
-                name: course.course_name || course.course_code,
-                total: course.total || 0  // 保留total字段
-              };
-              
-              // 为所有类别初始化为0
-              allResidencyTypes.forEach(type => {
-                courseData[type] = 0;
-              });
-              
-              // 处理residency_breakdown数据
-              if (Array.isArray(course.residency_breakdown)) {
-                course.residency_breakdown.forEach(item => {
-                  courseData[item.residency_group_descr] = item.count;
-                });
+        // 保存residency类别信息
+        setChart7ResidencyTypes(Array.from(allResidencyTypes));
+      }
+
+      // Chart8: CDEV Gender数据
+      const genderData = result["CDEV by Gender"];
+      console.log('Chart8 - Raw gender data:', genderData);
+      if (Array.isArray(genderData)) {
+        chart8 = genderData.map(course => {
+          const total = course.total || 1;
+          const courseData = { name: course.course_code };
+
+          // 初始化性别比例为0
+          courseData.Female = 0;
+          courseData.Male = 0;
+
+          // 处理gender_breakdown数据并转换为百分比
+          if (Array.isArray(course.gender_breakdown)) {
+            course.gender_breakdown.forEach(item => {
+              const percentage = Number(((item.count / total) * 100).toFixed(1));
+              if (item.gender === 'F') {
+                courseData.Female = percentage;
+              } else if (item.gender === 'M') {
+                courseData.Male = percentage;
               }
-              
-              return courseData;
             });
-            
-            // 保存residency类别信息
-            setChart7ResidencyTypes(Array.from(allResidencyTypes));
           }
 
-          // Chart8: CDEV Gender数据
-          const genderData = res.data.result["CDEV by Gender"];
-          console.log('Chart8 - Raw gender data:', genderData);
-          if (Array.isArray(genderData)) {
-            chart8 = genderData.map(course => {
-              const total = course.total || 1;
-              const courseData = { name: course.course_code };
-              
-              // 初始化性别比例为0
-              courseData.Female = 0;
-              courseData.Male = 0;
-              
-              // 处理gender_breakdown数据并转换为百分比
-              if (Array.isArray(course.gender_breakdown)) {
-                course.gender_breakdown.forEach(item => {
-                  const percentage = Number(((item.count / total) * 100).toFixed(1));
-                  if (item.gender === 'F') {
-                    courseData.Female = percentage;
-                  } else if (item.gender === 'M') {
-                    courseData.Male = percentage;
-                  }
-                });
-              }
-              
-              console.log('Chart8 - Processed course data:', courseData);
-              return courseData;
+          console.log('Chart8 - Processed course data:', courseData);
+          return courseData;
+        });
+      }
+      console.log('Chart8 - Final processed data:', chart8);
+    }
+
+    setChart7Data(chart7);
+    setChart8Data(chart8);
+  };
+
+  // YoY数据（Chart9和Chart10）
+  const applyYoYData = (result) => {
+    let chart9 = [];
+    let chart10 = [];
+
+    if (Array.isArray(result)) {
+      // Chart9: 简单的Faculty对比数据
+      chart9 = result.map(item => ({
+        faculty_descr: item.faculty_descr,
+        "2024": item["2024"] || 0,
+        "2025": item["2025"] || 0
+      }));
+
+      // Chart10: Faculty + Residency细分数据
+      const chart10Data = [];
+      result.forEach(facultyData => {
+        if (facultyData.residency_breakdown && facultyData.residency_breakdown.length > 0) {
+          facultyData.residency_breakdown.forEach(residencyData => {
+            const residencyLabel = residencyData.residency_group_descr === 'International' ? 'International' : 'Local';
+            chart10Data.push({
+              faculty_residency: `${residencyLabel}\n${facultyData.faculty_descr.replace('Faculty of ', '').replace('UNSW ', '')}`,
+              faculty_full: facultyData.faculty_descr,
+              residency_type: residencyData.residency_group_descr,
+              "2024": residencyData["2024"] || 0,
+              "2025": residencyData["2025"] || 0
             });
-          }
-          console.log('Chart8 - Final processed data:', chart8);
+          });
         }
-        
-        setChart7Data(chart7);
-        setChart8Data(chart8);
-      })
-      .catch(() => {
-        setChart7Data([]);
-        setChart7ResidencyTypes([]);
-        setChart8Data([]);
-      })
-      .finally(() => {
-        setCdevDataLoading(false);
       });
-  }, []);
 
-  // 获取YoY数据（Chart9和Chart10）
-  useEffect(() => {
-    // 只有在YoY模式下才获取数据
-    if (analysisMode === 'yoy_comparison' || analysisMode === 'census_yoy') {
-      setYoyDataLoading(true);
-      getYoYComparison()
-        .then(res => {
-          let chart9 = [];
-          let chart10 = [];
-          
-          if (res.data && res.data.result && Array.isArray(res.data.result)) {
-            // Chart9: 简单的Faculty对比数据
-            chart9 = res.data.result.map(item => ({
-              faculty_descr: item.faculty_descr,
-              "2024": item["2024"] || 0,
-              "2025": item["2025"] || 0
-            }));
-
-            // Chart10: Faculty + Residency细分数据
-            const chart10Data = [];
-            res.data.result.forEach(facultyData => {
-              if (facultyData.residency_breakdown && facultyData.residency_breakdown.length > 0) {
-                facultyData.residency_breakdown.forEach(residencyData => {
-                  const residencyLabel = residencyData.residency_group_descr === 'International' ? 'International' : 'Local';
-                  chart10Data.push({
-                    faculty_residency: `${residencyLabel}\n${facultyData.faculty_descr.replace('Faculty of ', '').replace('UNSW ', '')}`,
-                    faculty_full: facultyData.faculty_descr,
-                    residency_type: residencyData.residency_group_descr,
-                    "2024": residencyData["2024"] || 0,
-                    "2025": residencyData["2025"] || 0
-                  });
-                });
-              }
-            });
+      // 按faculty和residency排序
+      chart10Data.sort((a, b) => {
+        if (a.faculty_full !== b.faculty_full) {
+          return a.faculty_full.localeCompare(b.faculty_full);
+        }
+        return a.residency_type.localeCompare(b.residency_type);
+      });
 
-            // 按faculty和residency排序
-            chart10Data.sort((a, b) => {
-              if (a.faculty_full !== b.faculty_full) {
-                return a.faculty_full.localeCompare(b.faculty_full);
-              }
-              return a.residency_type.localeCompare(b.residency_type);
-            });
+      chart10 = chart10Data;
+    }
 
-            chart10 = chart10Data;
-          }
-          
-          setChart9Data(chart9);
-          setChart10Data(chart10);
-        })
-        .catch(() => {
-          setChart9Data([]);
-          setChart10Data([]);
-        })
-        .finally(() => {
-          setYoyDataLoading(false);
-        });
-    } else {
-      // 非YoY模式下清空数据
-      setChart9Data([]);
-      setChart10Data([]);
+    setChart9Data(chart9);
+    setChart10Data(chart10);
+  };
+
+  // Census数据（Chart_census1）
+  const applyCensusData = (result) => {
+    let chartCensus1 = [];
+
+    if (Array.isArray(result)) {
+      // 转换数据格式，参考Chart9的结构
+      chartCensus1 = result.map(faculty => ({
+        faculty_descr: faculty.faculty_descr
+          ?.replace('Faculty of ', '')
+          .replace('UNSW ', '')
+          .replace('University of New South Wales ', ''),
+        male_drop: faculty.gender_breakdown?.find(g => g.gender === 'M')?.drop_count || 0,
+        female_drop: faculty.gender_breakdown?.find(g => g.gender === 'F')?.drop_count || 0,
+        total_drop: faculty.total_drop || 0
+      }));
     }
-  }, [analysisMode]);
 
-  // 获取Census数据（Chart_census1）
+    setChartCensus1Data(chartCensus1);
+  };
+
+  // 一次请求取齐当前模式下所有图表的数据（服务端合并取数、并发查询），替代原来每组图表各自请求
   useEffect(() => {
-    // 只有在Census模式下且有selectedTerm时才获取数据
-    if ((analysisMode === 'census_day' || analysisMode === 'census_yoy') && selectedTerm) {
-      setCensusDataLoading(true);
-      getCensusGenderDrop(selectedTerm)
-        .then(res => {
-          let chartCensus1 = [];
-          
-          if (res.data && res.data.result && Array.isArray(res.data.result)) {
-            // 转换数据格式，参考Chart9的结构
-            chartCensus1 = res.data.result.map(faculty => ({
-              faculty_descr: faculty.faculty_descr
-                ?.replace('Faculty of ', '')
-                .replace('UNSW ', '')
-                .replace('University of New South Wales ', ''),
-              male_drop: faculty.gender_breakdown?.find(g => g.gender === 'M')?.drop_count || 0,
-              female_drop: faculty.gender_breakdown?.find(g => g.gender === 'F')?.drop_count || 0,
-              total_drop: faculty.total_drop || 0
-            }));
-          }
-          
-          setChartCensus1Data(chartCensus1);
-        })
-        .catch(() => {
-          setChartCensus1Data([]);
-        })
-        .finally(() => {
-          setCensusDataLoading(false);
-        });
-    } else {
-      // 非Census模式下清空数据
-      setChartCensus1Data([]);
-         }
-   }, [analysisMode, selectedTerm]);
+    const hasYoY = analysisMode === 'yoy_comparison' || analysisMode === 'census_yoy';
+    // Census图表只有在选择了term时才取数
+    const hasCensus = (analysisMode === 'census_day' || analysisMode === 'census_yoy') && selectedTerm;
+    const chartIds = getAvailableCharts()
+      .map(chart => chart.id)
+      .filter(id => id !== 'chart_census1' || hasCensus);
+    // 其它模式（如尚未上传时为空）只有基础图表，按 default 取数
+    const reportMode = ['yoy_comparison', 'census_day', 'census_yoy'].includes(analysisMode) ? analysisMode : 'default';
+    const setAllLoading = (loading) => {
+      setChart2Loading(loading);
+      setEquityDataLoading(loading);
+      setCdevDataLoading(loading);
+      setYoyDataLoading(loading && hasYoY);
+      setCensusDataLoading(Boolean(loading && hasCensus));
+    };
+
+    let cancelled = false;
+    setAllLoading(true);
+    getReport(reportMode, chartIds, hasCensus ? selectedTerm : undefined)
+      .then(res => {
+        if (cancelled) return;
+        const charts = (res.data && res.data.result && res.data.result.charts) || {};
+        applyGenderData(charts.gender_participation);
+        applyEquityData(charts.wil_participation);
+        applyCdevData(charts.cdev_enrolments);
+        // 非YoY / 非Census模式下清空对应数据
+        applyYoYData(charts.yoy_comparison);
+        applyCensusData(charts.chart_census1);
+      })
+      .catch(() => {
+        if (cancelled) return;
+        [applyGenderData, applyEquityData, applyCdevData, applyYoYData, applyCensusData].forEach(apply => apply(undefined));
+      })
+      .finally(() => {
+        if (!cancelled) setAllLoading(false);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [analysisMode, selectedTerm]);
 
   // 生成报告函数
   const generateReport = async (sendByEmail = false) => {
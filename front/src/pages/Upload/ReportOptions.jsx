@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import {
   Box,
   Typography,
@@ -17,7 +17,7 @@ import {
   CheckCircle as CheckIcon,
   ExpandMore as ExpandMoreIcon,
 } from '@mui/icons-material';
-import { getFileRequirements } from '../../helper/Api';
+import { getFileRequirements, getCensusTerms } from '../../helper/Api';
 
 const ReportOptions = ({
   theme,
@@ -47,14 +47,26 @@ const ReportOptions = ({
     },
   ];
 
-  const termOptions = ['Hexamester 1', 
-                       'Hexamester 4', 
-                       'Semester 1 Canberra', 
-                       'Semester 2 Canberra', 
-                       'Summer Term', 
-                       'Term 1', 
-                       'Term 2', 
-                       'Term 3'];
+  // 默认的term，已上传数据后改用数据中出现的term
+  const [termOptions, setTermOptions] = useState(['Hexamester 1', 
+                                                  'Hexamester 4', 
+                                                  'Semester 1 Canberra', 
+                                                  'Semester 2 Canberra', 
+                                                  'Summer Term', 
+                                                  'Term 1', 
+                                                  'Term 2', 
+                                                  'Term 3']);
+
+  useEffect(() => {
+    getCensusTerms()
+      .then((response) => {
+        const terms = response.data?.result;
+        if (Array.isArray(terms) && terms.length > 0) {
+          setTermOptions(terms);
+        }
+      })
+      .catch(() => {});
+  }, [uploadResult]);
 
   return (
     <Box sx={{